@@ -1,6 +1,6 @@
 import sys
 
-from populate import db_connections, populate, process_sitemap
+from populate import bump_index_generation, db_connections, populate, process_sitemap
 
 if __name__ == "__main__":
     if len(sys.argv) > 1:
@@ -8,5 +8,6 @@ if __name__ == "__main__":
         process_sitemap(sitemap=sitemap, skip_existing=True)
     else:
         populate(skip_existing=True)
+    bump_index_generation()
     db_connections.closeall()
     exit(0)
@@ -6,8 +6,13 @@ from flask import Flask
 from jinja2 import ChoiceLoader, PackageLoader
 from tna_utilities.datetime import pretty_datetime
 
-from app.lib.cache import cache
+from app.lib.cache import cache, cache_config
 from app.lib.context_processor import cookie_preference, now_iso_8601
+from app.lib.db import db
+from app.lib.memory_index import memory_index
+from app.lib.query_log import query_log
+from app.lib.result_set_cache import result_set_cache
+from app.lib.suggestions import title_suggestions
 from app.lib.talisman import talisman
 from app.lib.template_filters import (
     commafy,
@@ -17,6 +22,7 @@ from app.lib.template_filters import (
     result_type,
     slugify,
 )
+from app.lib.url_rules import url_rules
 from app.lib.urls import correct_url, is_url_archived
 
 
@@ -44,15 +50,14 @@ def create_app(config_class):
         gunicorn_error_logger.level or os.getenv("LOG_LEVEL", "warning").upper()
     )
 
-    cache.init_app(
-        app,
-        config={
-            "CACHE_TYPE": app.config.get("CACHE_TYPE"),
-            "CACHE_DEFAULT_TIMEOUT": app.config.get("CACHE_DEFAULT_TIMEOUT"),
-            "CACHE_IGNORE_ERRORS": app.config.get("CACHE_IGNORE_ERRORS"),
-            "CACHE_DIR": app.config.get("CACHE_DIR"),
-        },
-    )
+    cache.init_app(app, config=cache_config(app.config))
+
+    url_rules.init_app(app)
+    db.init_app(app)
+    result_set_cache.init_app(app)
+    memory_index.init_app(app)
+    title_suggestions.init_app(app)
+    query_log.init_app(app)
 
     talisman.init_app(
         app,
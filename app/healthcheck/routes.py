@@ -1,6 +1,12 @@
-from flask import current_app
+import os
+
+from flask import Response, current_app
 
 from app.healthcheck import bp
+from app.lib.db import db
+from app.lib.metrics import metrics
+from app.lib.result_set_cache import result_set_cache
+from app.lib.suggestions import title_suggestions
 
 
 @bp.route("/live/")
@@ -11,3 +17,48 @@ def healthcheck():
 @bp.route("/version/")
 def healthcheck_version():
     return current_app.config["BUILD_VERSION"]
+
+
+@bp.route("/db/")
+def healthcheck_db():
+    return db.status()
+
+
+@bp.route("/cache/")
+def healthcheck_cache():
+    return {
+        "type": current_app.config.get("CACHE_TYPE"),
+        "worker": os.getpid(),
+        "counters": {
+            name: count
+            for name, count in metrics.counters().items()
+            if name.endswith(("_cache_hits", "_cache_misses"))
+        },
+        "result_set_cache": result_set_cache.status(),
+    }
+
+
+@bp.route("/search/")
+def healthcheck_search():
+    return {
+        "time_budget": current_app.config.get("SEARCH_TIME_BUDGET"),
+        "worker": os.getpid(),
+        "counters": {
+            name: count
+            for name, count in metrics.counters().items()
+            if name.startswith("degraded_search")
+        },
+        "candidates": current_app.config.get("SEARCH_CANDIDATES"),
+        "timings": metrics.timings(),
+        "suggestions": title_suggestions.status(),
+    }
+
+
+@bp.route("/metrics/")
+def healthcheck_metrics():
+    """
+    The counters, cache hit ratios and latency histograms of this worker in the
+    Prometheus text format, labelled with the worker's process ID.
+    """
+
+    return Response(metrics.prometheus(), mimetype="text/plain; version=0.0.4")
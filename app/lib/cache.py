@@ -1,3 +1,22 @@
 from flask_caching import Cache
 
 cache = Cache()
+
+CACHE_CONFIG_KEYS = (
+    "CACHE_TYPE",
+    "CACHE_DEFAULT_TIMEOUT",
+    "CACHE_IGNORE_ERRORS",
+    "CACHE_KEY_PREFIX",
+    "CACHE_DIR",
+    "CACHE_REDIS_URL",
+)
+
+
+def cache_config(config):
+    """Get the settings for the cache backend from the app config."""
+
+    return {
+        key: config.get(key)
+        for key in CACHE_CONFIG_KEYS
+        if config.get(key) not in (None, "", [])
+    }
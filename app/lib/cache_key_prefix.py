@@ -1,6 +1,13 @@
 from flask import request
 
+from app.lib.index_version import get_index_version
+
 
 def cache_key_prefix():
     """Make a key that includes GET parameters."""
     return f"{request.full_path}{request.cookies.get('cookie_preferences_set' or '')}{request.cookies.get('theme' or '')}"
+
+
+def versioned_cache_key_prefix():
+    """Make a key that includes GET parameters and the version of the index."""
+    return f"{get_index_version()}|{cache_key_prefix()}"
@@ -0,0 +1,66 @@
+import hashlib
+from datetime import timezone
+from functools import wraps
+
+from flask import current_app, g, make_response, request
+
+from app.lib.cache_key_prefix import cache_key_prefix
+from app.lib.index_version import get_index_last_updated, get_index_version
+
+
+def conditional_response(view):
+    """
+    Add an ETag and Last-Modified header based on the index version to a view and
+    respond with a 304 to conditional requests that still match, before the view
+    is called.
+
+    The ETag includes everything the cached response depends on, so this should
+    be used above cache.cached(key_prefix=versioned_cache_key_prefix). Pages with
+    partial results, which the view marks by setting g.partial_results, are sent
+    without validators and aren't stored, so they are never revalidated.
+    """
+
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        etag = hashlib.md5(
+            "|".join(
+                [
+                    get_index_version(),
+                    current_app.config.get("BUILD_VERSION") or "",
+                    current_app.config.get("SEARCH_ENGINE"),
+                    cache_key_prefix(),
+                ]
+            ).encode()
+        ).hexdigest()
+        last_updated = get_index_last_updated()
+        if last_updated is not None:
+            # The "date_updated" column is stored without a time zone, which is
+            # assumed to be UTC, and Last-Modified only has a precision of seconds
+            last_updated = last_updated.replace(tzinfo=timezone.utc, microsecond=0)
+
+        if request.if_none_match:
+            not_modified = request.if_none_match.contains(etag)
+        else:
+            not_modified = bool(
+                last_updated
+                and request.if_modified_since
+                and request.if_modified_since >= last_updated
+            )
+
+        response = (
+            make_response("", 304)
+            if not_modified
+            else make_response(view(*args, **kwargs))
+        )
+        if g.get("partial_results"):
+            response.headers["Cache-Control"] = "no-store"
+        elif response.status_code in (200, 304):
+            response.set_etag(etag)
+            if last_updated is not None:
+                response.last_modified = last_updated
+            response.headers["Cache-Control"] = current_app.config.get(
+                "SEARCH_CACHE_CONTROL"
+            )
+        return response
+
+    return wrapper
@@ -0,0 +1,186 @@
+import asyncio
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+class Crawler:
+    """
+    Crawl pages concurrently in three stages, fetching, parsing and writing,
+    which are joined by bounded queues so a slow stage holds back the others
+    instead of filling the memory.
+
+    Pages are fetched with a single requests session so the connections to each
+    host are kept alive and reused. As requests is blocking, each stage runs its
+    work in a pool of threads while asyncio schedules it, with at most
+    `concurrency` requests at a time and `host_concurrency` to any one host.
+
+    The stages are functions of the items being crawled, which are (index, url)
+    tuples:
+    - fetch(session, item) gets a page and returns what the parse stage needs
+    - parse(fetched) returns a document, or None to skip the page
+    - write(documents) stores a batch of documents, and can return how many of
+      them were stored if some of them couldn't be
+    Returning None from fetch or parse drops an item from the later stages.
+
+    Documents are buffered before they are written, and a batch is written once
+    it has `write_batch_size` documents or `flush_interval` seconds after its
+    first document, whichever is sooner.
+    """
+
+    def __init__(
+        self,
+        fetch,
+        parse,
+        write,
+        concurrency=16,
+        host_concurrency=4,
+        parse_concurrency=2,
+        queue_size=100,
+        write_batch_size=100,
+        flush_interval=1.0,
+    ):
+        self.fetch = fetch
+        self.parse = parse
+        self.write = write
+        self.concurrency = concurrency
+        self.host_concurrency = host_concurrency
+        self.parse_concurrency = parse_concurrency
+        self.queue_size = queue_size
+        self.write_batch_size = write_batch_size
+        self.flush_interval = flush_interval
+        self.stats = Counter()
+        self._stats_lock = threading.Lock()
+
+    def count(self, name, value=1):
+        with self._stats_lock:
+            self.stats[name] += value
+
+    def session(self):
+        session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=self.concurrency, pool_maxsize=self.host_concurrency
+        )
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        return session
+
+    def crawl(self, items):
+        """
+        Crawl all the items and return how many were fetched, parsed and written,
+        and how many documents were written per second spent writing.
+        """
+
+        start = time.monotonic()
+        asyncio.run(self._crawl(items))
+        stats = dict(self.stats)
+        write_seconds = stats.get("write_seconds", 0)
+        return stats | {
+            "seconds": time.monotonic() - start,
+            "written_per_second": (
+                stats.get("written", 0) / write_seconds if write_seconds else 0
+            ),
+        }
+
+    async def _crawl(self, items):
+        loop = asyncio.get_running_loop()
+        fetch_queue = asyncio.Queue(self.queue_size)
+        parse_queue = asyncio.Queue(self.queue_size)
+        write_queue = asyncio.Queue(self.queue_size)
+        host_semaphores = {}
+
+        async def run(executor, function, *args):
+            try:
+                return True, await loop.run_in_executor(executor, function, *args)
+            except Exception as e:
+                self.count("errors")
+                print(f"Error in the {function.__name__} stage of the crawler: {e}")
+                return False, None
+
+        async def fetcher(session, executor):
+            while (item := await fetch_queue.get()) is not None:
+                host = urlsplit(item[1]).netloc
+                semaphore = host_semaphores.setdefault(
+                    host, asyncio.Semaphore(self.host_concurrency)
+                )
+                async with semaphore:
+                    _, fetched = await run(executor, self.fetch, session, item)
+                if fetched is not None:
+                    self.count("fetched")
+                    await parse_queue.put(fetched)
+
+        async def parser(executor):
+            while (fetched := await parse_queue.get()) is not None:
+                _, document = await run(executor, self.parse, fetched)
+                if document is not None:
+                    self.count("parsed")
+                    await write_queue.put(document)
+
+        async def flush(executor, batch):
+            start = time.monotonic()
+            ok, written = await run(executor, self.write, batch)
+            self.count("write_seconds", time.monotonic() - start)
+            if ok:
+                written = len(batch) if written is None else written
+                self.count("batches")
+                self.count("written", written)
+                if written < len(batch):
+                    self.count("errors", len(batch) - written)
+
+        async def writer(executor):
+            batch = []
+            flush_at = None
+            while True:
+                try:
+                    document = await asyncio.wait_for(
+                        write_queue.get(),
+                        max(0, flush_at - loop.time()) if batch else None,
+                    )
+                except asyncio.TimeoutError:
+                    await flush(executor, batch)
+                    batch = []
+                    continue
+                if document is None:
+                    break
+                if not batch:
+                    flush_at = loop.time() + self.flush_interval
+                batch.append(document)
+                if len(batch) >= self.write_batch_size:
+                    await flush(executor, batch)
+                    batch = []
+            if batch:
+                await flush(executor, batch)
+
+        with (
+            self.session() as session,
+            ThreadPoolExecutor(self.concurrency) as fetch_executor,
+            ThreadPoolExecutor(self.parse_concurrency) as parse_executor,
+            ThreadPoolExecutor(1) as write_executor,
+        ):
+            fetchers = [
+                asyncio.create_task(fetcher(session, fetch_executor))
+                for _ in range(self.concurrency)
+            ]
+            parsers = [
+                asyncio.create_task(parser(parse_executor))
+                for _ in range(self.parse_concurrency)
+            ]
+            writer_task = asyncio.create_task(writer(write_executor))
+
+            for item in items:
+                await fetch_queue.put(item)
+
+            # Stop each stage once the stage before it has finished
+            for stage_tasks, queue in (
+                (fetchers, fetch_queue),
+                (parsers, parse_queue),
+                ([writer_task], write_queue),
+            ):
+                for _ in stage_tasks:
+                    await queue.put(None)
+                await asyncio.gather(*stage_tasks)
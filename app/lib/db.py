@@ -0,0 +1,221 @@
+import hashlib
+import os
+import re
+import threading
+from contextlib import contextmanager
+
+import psycopg2
+import psycopg2.extras
+from psycopg2.pool import ThreadedConnectionPool
+
+from app.lib.server_timing import stage, timed_stage
+
+PLACEHOLDER_RE = re.compile(r"%\(p(\d+)\)s")
+
+# Statements are deallocated when a connection has prepared this many
+MAX_PREPARED_STATEMENTS = 256
+
+
+class DatabasePoolExhausted(Exception):
+    pass
+
+
+class Connection(psycopg2.extensions.connection):
+    """A connection that remembers which statements have been prepared on it."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prepared_statements = set()
+
+
+class Cursor(psycopg2.extras.RealDictCursor):
+    """A cursor that times fetching rows as a stage of handling a request."""
+
+    def fetchone(self):
+        with stage("fetch"):
+            return super().fetchone()
+
+    def fetchmany(self, size=None):
+        with stage("fetch"):
+            return super().fetchmany(size)
+
+    def fetchall(self):
+        with stage("fetch"):
+            return super().fetchall()
+
+
+class Database:
+    """
+    A pool of database connections shared by all the requests handled by a worker.
+
+    The pool is created lazily in each worker process so that connections are
+    never shared between forked gunicorn workers.
+    """
+
+    def __init__(self, app=None):
+        self._pool = None
+        self._pool_pid = None
+        self._lock = threading.Lock()
+        self._slots = None
+        self._in_use = 0
+        self._exhausted = 0
+        self._discarded = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.min_connections = app.config.get("DB_POOL_MIN_CONNECTIONS")
+        self.max_connections = app.config.get("DB_POOL_MAX_CONNECTIONS")
+        self.pool_timeout = app.config.get("DB_POOL_TIMEOUT")
+        self.pre_ping = app.config.get("DB_POOL_PRE_PING")
+        self.prepared_statements = app.config.get("DB_PREPARED_STATEMENTS")
+        self.connection_kwargs = {
+            "host": app.config.get("DB_HOST"),
+            "database": app.config.get("DB_NAME"),
+            "user": app.config.get("DB_USERNAME"),
+            "password": app.config.get("DB_PASSWORD"),
+            "connect_timeout": app.config.get("DB_CONNECT_TIMEOUT"),
+            "options": f"-c statement_timeout={app.config.get('DB_STATEMENT_TIMEOUT')}",
+            "connection_factory": Connection,
+        }
+        app.extensions["db"] = self
+
+    def _get_pool(self):
+        if self._pool is None or self._pool_pid != os.getpid():
+            with self._lock:
+                if self._pool is None or self._pool_pid != os.getpid():
+                    self._pool = ThreadedConnectionPool(
+                        self.min_connections,
+                        self.max_connections,
+                        **self.connection_kwargs,
+                    )
+                    self._pool_pid = os.getpid()
+                    self._slots = threading.BoundedSemaphore(self.max_connections)
+                    self._in_use = 0
+        return self._pool
+
+    def _is_usable(self, conn):
+        if conn.closed:
+            return False
+        if not self.pre_ping:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1;")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    @timed_stage("connect")
+    def getconn(self):
+        pool = self._get_pool()
+        if not self._slots.acquire(timeout=self.pool_timeout):
+            with self._lock:
+                self._exhausted += 1
+            raise DatabasePoolExhausted(
+                f"No database connection became available within {self.pool_timeout}s"
+            )
+        try:
+            conn = pool.getconn()
+            # Replace any connections that have been closed by the server
+            while not self._is_usable(conn):
+                pool.putconn(conn, close=True)
+                with self._lock:
+                    self._discarded += 1
+                conn = pool.getconn()
+        except Exception:
+            self._slots.release()
+            raise
+        with self._lock:
+            self._in_use += 1
+        return conn
+
+    def putconn(self, conn, close=False):
+        if not conn.closed and not close:
+            try:
+                conn.rollback()
+            except psycopg2.Error:
+                close = True
+        self._pool.putconn(conn, close=close or bool(conn.closed))
+        with self._lock:
+            self._in_use -= 1
+        self._slots.release()
+
+    @contextmanager
+    def connection(self):
+        conn = self.getconn()
+        try:
+            yield conn
+        finally:
+            self.putconn(conn)
+
+    @contextmanager
+    def cursor(self, cursor_factory=Cursor):
+        with self.connection() as conn:
+            with conn.cursor(cursor_factory=cursor_factory) as cur:
+                yield cur
+
+    @timed_stage("execute")
+    def execute(self, cur, query, params, timeout=None):
+        """
+        Execute a query template from app.lib.sql with the values of its parameters.
+
+        Each template is prepared once on each connection, so Postgres only parses
+        and plans it the first time and later queries only send the values. Set
+        DB_PREPARED_STATEMENTS to False when connecting through a pooler that does
+        not support prepared statements.
+
+        If a timeout in milliseconds is given, the query is cancelled with
+        psycopg2.errors.QueryCanceled if it takes longer. The timeout only lasts
+        until the end of the transaction.
+        """
+
+        if timeout:
+            cur.execute("SET LOCAL statement_timeout = %s;", (int(timeout),))
+
+        if not self.prepared_statements:
+            cur.execute(query, params)
+            return
+
+        template = query.as_string(cur)
+        name = f"search_{hashlib.md5(template.encode()).hexdigest()[:16]}"
+        conn = cur.connection
+        if name not in conn.prepared_statements:
+            if len(conn.prepared_statements) >= MAX_PREPARED_STATEMENTS:
+                cur.execute("DEALLOCATE ALL;")
+                conn.prepared_statements.clear()
+            cur.execute(
+                f"PREPARE {name} AS "
+                + PLACEHOLDER_RE.sub(r"$\1", template).replace("%%", "%")
+            )
+            conn.prepared_statements.add(name)
+        values = [params[f"p{number}"] for number in range(1, len(params) + 1)]
+        if values:
+            cur.execute(f"EXECUTE {name} ({', '.join(['%s'] * len(values))});", values)
+        else:
+            cur.execute(f"EXECUTE {name};")
+
+    def status(self):
+        """Report how much of the pool in this worker is being used."""
+        with self._lock:
+            return {
+                "pid": os.getpid(),
+                "max_connections": self.max_connections,
+                "in_use": self._in_use,
+                "saturation": (
+                    self._in_use / self.max_connections if self.max_connections else 0
+                ),
+                "exhausted": self._exhausted,
+                "discarded": self._discarded,
+            }
+
+    def close(self):
+        with self._lock:
+            if self._pool is not None and self._pool_pid == os.getpid():
+                self._pool.closeall()
+            self._pool = None
+            self._pool_pid = None
+
+
+db = Database()
@@ -0,0 +1,107 @@
+import re
+from collections import Counter
+from functools import lru_cache
+from urllib.parse import quote_plus
+
+from markupsafe import escape
+
+
+class Highlighter:
+    """
+    Highlight the query parts in the strings of a page of results, with a single
+    regular expression compiled for all of them.
+
+    Each query part also matches its URL encoded form so it can be highlighted in
+    the addresses of pages.
+    """
+
+    def __init__(self, query_parts):
+        substrings = {
+            substring
+            for part in query_parts
+            if part
+            for substring in (part, quote_plus(part))
+        }
+        self.pattern = (
+            re.compile(
+                "|".join(
+                    re.escape(substring)
+                    for substring in sorted(substrings, key=len, reverse=True)
+                ),
+                re.IGNORECASE,
+            )
+            if substrings
+            else None
+        )
+
+    def mark(self, s, escape_html=False):
+        if self.pattern is None:
+            return str(escape(s)) if escape_html else s
+        if not escape_html:
+            return self.pattern.sub(r"<mark>\g<0></mark>", s)
+
+        # Match the text before it is escaped, so query parts such as "amp" can't
+        # match inside the HTML entities, then escape each segment of it
+        marked = []
+        end = 0
+        for match in self.pattern.finditer(s):
+            marked.append(str(escape(s[end : match.start()])))
+            marked.append(f"<mark>{escape(match.group())}</mark>")
+            end = match.end()
+        marked.append(str(escape(s[end:])))
+        return "".join(marked)
+
+    def snippet(self, text, length):
+        """
+        Get the window of about length characters of text that matches the most
+        different query parts, or the start of the text if none of them match.
+        """
+
+        text = " ".join(text.split())
+        if len(text) <= length:
+            return text
+
+        matches = (
+            [
+                (match.start(), match.group().lower())
+                for match in self.pattern.finditer(text)
+            ]
+            if self.pattern
+            else []
+        )
+        best_start = 0
+        best_score = (0, 0)
+        counts = Counter()
+        end = 0
+        for index, (start, part) in enumerate(matches):
+            while end < len(matches) and matches[end][0] < start + length:
+                counts[matches[end][1]] += 1
+                end += 1
+            score = (len(counts), end - index)
+            if score > best_score:
+                best_start, best_score = start, score
+            counts[part] -= 1
+            if not counts[part]:
+                del counts[part]
+
+        # Start a little before the best match, at the start of a word
+        start = max(0, best_start - length // 4)
+        if start:
+            start = text.find(" ", start, best_start) + 1 or best_start
+        end = min(len(text), start + length)
+        if end < len(text) and (space := text.rfind(" ", start, end)) > start:
+            end = space
+        return (
+            f"{'… ' if start else ''}{text[start:end]}{' …' if end < len(text) else ''}"
+        )
+
+
+@lru_cache(maxsize=256)
+def _get_highlighter(query_parts):
+    return Highlighter(query_parts)
+
+
+def get_highlighter(query_parts):
+    """Get the highlighter for some query parts, which is only compiled once."""
+
+    return _get_highlighter(tuple(query_parts))
@@ -0,0 +1,80 @@
+from flask import current_app
+
+from app.lib.cache import cache
+from app.lib.db import db
+from app.lib.index_version import get_index_version
+from app.lib.urls import CONTENT_TYPES
+
+# Count the pages that can be found, in total and for each content type
+INDEX_STATS_QUERY = """SELECT
+        COUNT(*) AS "total",
+        COALESCE(
+            (
+                SELECT jsonb_object_agg("content_type", "documents")
+                FROM (
+                    SELECT "content_type", COUNT(*) AS "documents"
+                    FROM "sitemap_urls"
+                    WHERE NOT "is_blacklisted" AND "content_type" IS NOT NULL
+                    GROUP BY "content_type"
+                ) AS "counts"
+            ),
+            '{}'::jsonb
+        ) AS "content_types",
+        MAX("date_updated") AS "last_updated"
+    FROM "sitemap_urls"
+    WHERE NOT "is_blacklisted"
+"""
+
+
+def refresh_index_stats(cur):
+    """
+    Store the statistics of the index in the "index_stats" table, for the
+    ingestion scripts to run in the same transaction as their other changes.
+    """
+
+    cur.execute(f"""INSERT INTO "index_stats" (
+            "id", "total", "content_types", "last_updated"
+        )
+        SELECT TRUE, "total", "content_types", "last_updated"
+        FROM ({INDEX_STATS_QUERY}) AS "stats"
+        ON CONFLICT ("id") DO UPDATE SET
+            "total" = EXCLUDED."total",
+            "content_types" = EXCLUDED."content_types",
+            "last_updated" = EXCLUDED."last_updated",
+            "date_updated" = CURRENT_TIMESTAMP;""")
+
+
+def get_index_stats():
+    """
+    Get the number of pages that can be found, in total and for each content
+    type, and the time they were last updated.
+
+    The statistics are stored by the ingestion scripts so this only reads a
+    single row, and they are cached for each version of the index. They are
+    only counted from the pages if the scripts haven't stored them yet.
+    """
+
+    cache_key = f"index-stats:{get_index_version()}"
+    if (stats := cache.get(cache_key)) is not None:
+        return stats
+
+    with db.cursor() as cur:
+        cur.execute("""SELECT "total", "content_types", "last_updated"
+            FROM "index_stats";""")
+        row = cur.fetchone()
+        if row is None:
+            cur.execute(f"{INDEX_STATS_QUERY};")
+            row = cur.fetchone()
+
+    stats = {
+        "total": row["total"],
+        "content_types": {content_type: 0 for content_type in CONTENT_TYPES}
+        | {
+            content_type: documents
+            for content_type, documents in row["content_types"].items()
+            if content_type in CONTENT_TYPES
+        },
+        "last_updated": row["last_updated"],
+    }
+    cache.set(cache_key, stats, timeout=current_app.config.get("SEARCH_CACHE_TIMEOUT"))
+    return stats
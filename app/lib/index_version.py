@@ -0,0 +1,116 @@
+import os
+import threading
+import time
+
+import psycopg2.errors
+from flask import Flask, current_app, g
+
+from app.lib.cache import cache, cache_config
+from app.lib.db import db
+
+# The key in the shared cache that the ingestion scripts set to the generation of
+# the index whenever they change the crawled pages
+INDEX_GENERATION_CACHE_KEY = "index-generation"
+
+_lock = threading.Lock()
+_index_version = {
+    "version": None,
+    "generation": None,
+    "last_updated": None,
+    "checked": 0.0,
+}
+
+
+def _get_shared_generation():
+    # Only ask the shared cache once for each request
+    if "index_generation" not in g:
+        g.index_generation = cache.get(INDEX_GENERATION_CACHE_KEY)
+    return g.index_generation
+
+
+def _get_index_state():
+    now = time.monotonic()
+    ttl = current_app.config.get("INDEX_VERSION_TTL")
+    shared_generation = _get_shared_generation()
+    with _lock:
+        if (
+            _index_version["version"] is not None
+            and now - _index_version["checked"] < ttl
+            and shared_generation in (None, _index_version["generation"])
+        ):
+            return dict(_index_version)
+
+    with db.cursor() as cur:
+        try:
+            # The date the generation was bumped also changes when pages are
+            # removed or their details are recalculated, which the pages' dates
+            # don't show
+            cur.execute("""SELECT
+                    COALESCE(
+                        (SELECT "date_updated" FROM "index_generation"),
+                        MAX("date_updated")
+                    ) AS "last_updated",
+                    (SELECT "generation" FROM "index_generation") AS "generation"
+                FROM "sitemap_urls";""")
+        except psycopg2.errors.UndefinedTable:
+            # The "index_generation" table is only created by populate.py, so use
+            # the pages' dates until it has been run
+            cur.connection.rollback()
+            cur.execute("""SELECT
+                    MAX("date_updated") AS "last_updated",
+                    NULL AS "generation"
+                FROM "sitemap_urls";""")
+        row = cur.fetchone()
+    last_updated = row["last_updated"] if row else None
+    generation = row["generation"] if row else None
+    if generation is not None:
+        version = f"generation-{generation}"
+        if generation != shared_generation:
+            # Share the generation with the other workers in case it was missed
+            cache.set(INDEX_GENERATION_CACHE_KEY, generation, timeout=0)
+            g.index_generation = generation
+    else:
+        version = last_updated.isoformat() if last_updated else "empty"
+
+    with _lock:
+        _index_version["version"] = version
+        _index_version["generation"] = generation
+        _index_version["last_updated"] = last_updated
+        _index_version["checked"] = now
+        return dict(_index_version)
+
+
+def get_index_version():
+    """
+    Get a version of the index that changes whenever the crawled pages change.
+
+    This is the generation of the index that the ingestion scripts bump after
+    they change the crawled pages. The generation in the shared cache is checked
+    on every request so all the workers start using a new generation at the same
+    time, and the database is only checked once every INDEX_VERSION_TTL seconds
+    in each worker.
+    """
+
+    return _get_index_state()["version"]
+
+
+def get_index_last_updated():
+    """
+    Get the time the crawled pages were last changed, which is when the
+    generation of the index was last bumped, if there are any.
+    """
+
+    return _get_index_state()["last_updated"]
+
+
+def publish_index_generation(generation):
+    """
+    Set the generation of the index in the shared cache, for the ingestion
+    scripts which run outside of the app.
+    """
+
+    app = Flask(__name__)
+    app.config.from_object(os.getenv("CONFIG", "config.Production"))
+    cache.init_app(app, config=cache_config(app.config))
+    with app.app_context():
+        cache.set(INDEX_GENERATION_CACHE_KEY, generation, timeout=0)
@@ -0,0 +1,318 @@
+import os
+import re
+import threading
+from array import array
+from bisect import bisect_right
+
+import psycopg2.extras
+from flask import current_app
+
+from app.lib.db import db
+from app.lib.index_version import get_index_version
+from app.lib.urls import CONTENT_TYPES
+
+FIELDS = ("title", "description", "body", "url")
+
+WORD_RE = re.compile(r"[^\W_]+")
+
+
+class Document:
+    __slots__ = (
+        "id",
+        "title",
+        "url",
+        "description",
+        "lower_fields",
+        "length_differences",
+        "url_depth",
+        "is_archived",
+        "content_type",
+    )
+
+    def __init__(self, row):
+        self.id = row["id"]
+        self.title = row["title"]
+        self.url = row["url"]
+        self.description = row["description"]
+        values = [row[field] for field in FIELDS]
+        self.lower_fields = tuple(
+            value.lower() if value is not None else None for value in values
+        )
+        # Lowercasing can change the length of some strings, which the SQL
+        # engines also count
+        self.length_differences = tuple(
+            len(value) - len(lower_value) if value is not None else 0
+            for value, lower_value in zip(values, self.lower_fields)
+        )
+        self.url_depth = row["url_depth"]
+        self.is_archived = row["is_archived"]
+        self.content_type = row["content_type"]
+
+
+class MemoryIndex:
+    """
+    An inverted index of all the crawled pages held in the memory of a worker.
+
+    Every word in every field is mapped to an array of the IDs of the pages that
+    contain it. A query part is matched against the vocabulary of words to find
+    the pages that might contain it, then those pages are scored by counting the
+    instances of the query part in each field in the same way as the "substring"
+    search engine.
+
+    The index is loaded when a worker starts and is refreshed with the pages that
+    have been added or updated whenever the index version changes.
+    """
+
+    def __init__(self, app=None):
+        self._lock = threading.RLock()
+        self._pid = None
+        self._reset()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.extensions["memory_index"] = self
+        if app.config.get("SEARCH_ENGINE") == "memory":
+            with app.app_context():
+                try:
+                    self.ensure_loaded()
+                except Exception as e:
+                    app.logger.error(f"Unable to load the in-memory search index: {e}")
+
+    def _reset(self):
+        self._documents = {}
+        self._postings = {}
+        self._removed_documents = 0
+        self._vocabulary = "\n"
+        self._vocabulary_terms = []
+        self._vocabulary_offsets = array("L")
+        self._version = None
+        self._last_updated = None
+
+    def _load_rows(self, since=None):
+        with db.connection() as conn:
+            # Use a server side cursor so the table is loaded in batches
+            with conn.cursor(
+                name="memory_index", cursor_factory=psycopg2.extras.RealDictCursor
+            ) as cur:
+                cur.itersize = current_app.config.get("SEARCH_MEMORY_INDEX_BATCH_SIZE")
+                if since is None:
+                    cur.execute("""SELECT "id", "title", "url", "description", "body",
+                            "url_depth", "is_archived", "is_blacklisted",
+                            "content_type", "date_updated"
+                        FROM "sitemap_urls"
+                        WHERE "url" IS NOT NULL;""")
+                else:
+                    cur.execute(
+                        """SELECT "id", "title", "url", "description", "body",
+                            "url_depth", "is_archived", "is_blacklisted",
+                            "content_type", "date_updated"
+                        FROM "sitemap_urls"
+                        WHERE "url" IS NOT NULL
+                            AND "date_updated" > %s;""",
+                        (since,),
+                    )
+                for row in cur:
+                    if row["date_updated"] and (
+                        self._last_updated is None
+                        or row["date_updated"] > self._last_updated
+                    ):
+                        self._last_updated = row["date_updated"]
+                    if row["is_blacklisted"] is not False:
+                        self._remove(row["id"])
+                        continue
+                    self._add(Document(row))
+
+    def _add(self, document):
+        self._remove(document.id)
+        self._documents[document.id] = document
+        terms = set()
+        for lower_value in document.lower_fields:
+            if lower_value:
+                terms.update(WORD_RE.findall(lower_value))
+        for term in terms:
+            if term not in self._postings:
+                self._postings[term] = array("I")
+            self._postings[term].append(document.id)
+
+    def _remove(self, id):
+        if self._documents.pop(id, None) is not None:
+            # The postings of removed pages are only dropped when the index is
+            # rebuilt, until then they are ignored when scoring
+            self._removed_documents += 1
+
+    def _build_vocabulary(self):
+        self._vocabulary_terms = list(self._postings.keys())
+        self._vocabulary_offsets = array("L")
+        offset = 1
+        for term in self._vocabulary_terms:
+            self._vocabulary_offsets.append(offset)
+            offset += len(term) + 1
+        self._vocabulary = "\n" + "\n".join(self._vocabulary_terms) + "\n"
+
+    def ensure_loaded(self):
+        """Load or refresh the index if the index version has changed."""
+
+        version = get_index_version()
+        with self._lock:
+            if self._pid == os.getpid() and self._version == version:
+                return
+            if self._pid != os.getpid() or self._removed_documents > len(
+                self._documents
+            ):
+                self._reset()
+                self._load_rows()
+            else:
+                self._load_rows(since=self._last_updated)
+                with db.cursor() as cur:
+                    cur.execute('SELECT "id" FROM "sitemap_urls";')
+                    current_ids = {row["id"] for row in cur.fetchall()}
+                for id in set(self._documents) - current_ids:
+                    self._remove(id)
+            self._build_vocabulary()
+            self._pid = os.getpid()
+            self._version = version
+
+    def _matching_ids(self, token):
+        """Get the IDs of the pages with a word that contains the token."""
+
+        ids = set()
+        start = self._vocabulary.find(token)
+        while start != -1:
+            term_index = bisect_right(self._vocabulary_offsets, start) - 1
+            ids.update(self._postings[self._vocabulary_terms[term_index]])
+            # Skip to the next word in the vocabulary
+            start = self._vocabulary.find(
+                token,
+                self._vocabulary_offsets[term_index]
+                + len(self._vocabulary_terms[term_index])
+                + 1,
+            )
+        return ids
+
+    def _candidate_ids(self, query_part):
+        """Get the IDs of the pages that might contain a query part."""
+
+        tokens = WORD_RE.findall(query_part)
+        min_token_length = current_app.config.get("SEARCH_MEMORY_INDEX_MIN_TOKEN")
+        if not tokens or max(len(token) for token in tokens) < min_token_length:
+            return set(self._documents)
+        candidate_ids = None
+        for token in sorted(tokens, key=len, reverse=True):
+            if len(token) < min_token_length:
+                continue
+            ids = self._matching_ids(token)
+            candidate_ids = ids if candidate_ids is None else candidate_ids & ids
+            if not candidate_ids:
+                break
+        return candidate_ids
+
+    def rank(self, all_query_parts, quoted_query_parts, requested_types):
+        """
+        Get the total number of results and the ranked (relevance, title, id) of
+        every result for a query.
+        """
+
+        self.ensure_loaded()
+
+        # The SQL engines score every row as 0 when there are no query parts
+        if not all_query_parts:
+            return {"total_results": 0, "ranked": []}
+
+        field_weights = [
+            current_app.config.get("RELEVANCE_TITLE_MATCH_WEIGHT"),
+            current_app.config.get("RELEVANCE_DESCRIPTION_MATCH_WEIGHT"),
+            current_app.config.get("RELEVANCE_BODY_MATCH_WEIGHT"),
+            current_app.config.get("RELEVANCE_URL_MATCH_WEIGHT"),
+        ]
+        quote_weight = current_app.config.get("RELEVANCE_QUOTE_MATCH_MULTIPLIER")
+        archived_weight = current_app.config.get("RELEVANCE_ARCHIVED_WEIGHT")
+
+        with self._lock:
+            candidate_ids = set()
+            for query_part in all_query_parts:
+                candidate_ids |= self._candidate_ids(query_part)
+
+            ranked = []
+            for id in candidate_ids:
+                document = self._documents.get(id)
+                if document is None or (
+                    requested_types in CONTENT_TYPES
+                    and document.content_type != requested_types
+                ):
+                    continue
+                score = 0
+                for query_part in all_query_parts:
+                    field_scores = [
+                        (
+                            (
+                                length_difference
+                                + lower_value.count(query_part) * len(query_part)
+                            )
+                            * field_weight
+                            if lower_value is not None
+                            else 0
+                        )
+                        for lower_value, length_difference, field_weight in zip(
+                            document.lower_fields,
+                            document.length_differences,
+                            field_weights,
+                        )
+                    ]
+                    # The SQL engines only multiply the score of the last field,
+                    # the URL, by the quote weight
+                    score += sum(field_scores[:-1]) + field_scores[-1] * (
+                        quote_weight if query_part in quoted_query_parts else 1
+                    )
+                relevance = (score / (document.url_depth + 1)) * (
+                    archived_weight if document.is_archived else 1
+                )
+                if relevance > 0:
+                    ranked.append((relevance, document.title, document.id))
+
+        ranked.sort(
+            key=lambda result: (
+                -result[0],
+                result[1] is None,
+                result[1] or "",
+                result[2],
+            )
+        )
+        return {"total_results": len(ranked), "ranked": ranked}
+
+    def facets(self, all_query_parts, quoted_query_parts):
+        """Count the results of each content type for a query."""
+
+        facets = {content_type: 0 for content_type in CONTENT_TYPES}
+        ranked = self.rank(all_query_parts, quoted_query_parts, "all")["ranked"]
+        with self._lock:
+            for _, _, id in ranked:
+                document = self._documents.get(id)
+                if document is not None and document.content_type in facets:
+                    facets[document.content_type] += 1
+        return facets
+
+    def get_results(self, ids):
+        with self._lock:
+            return [
+                {
+                    "id": document.id,
+                    "title": document.title,
+                    "url": document.url,
+                    "description": document.description,
+                }
+                for document in (self._documents.get(id) for id in ids)
+                if document is not None
+            ]
+
+    def status(self):
+        with self._lock:
+            return {
+                "documents": len(self._documents),
+                "terms": len(self._postings),
+                "removed_documents": self._removed_documents,
+                "version": self._version,
+            }
+
+
+memory_index = MemoryIndex()
@@ -0,0 +1,153 @@
+import os
+import threading
+from collections import Counter
+
+# The upper bounds in seconds of the buckets of the latency histograms
+HISTOGRAM_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+def prometheus_labels(labels):
+    return ",".join(
+        '{}="{}"'.format(
+            name,
+            str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"),
+        )
+        for name, value in labels
+    )
+
+
+class Metrics:
+    """
+    Counters, timings and latency histograms for the requests handled by a
+    worker.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = Counter()
+        self._timings = {}
+        self._histograms = {}
+
+    def increment(self, name, value=1):
+        with self._lock:
+            self._counters[name] += value
+
+    def observe(self, name, seconds, labels=None):
+        labels = tuple(sorted((labels or {}).items()))
+        with self._lock:
+            count, total = self._timings.get(name, (0, 0.0))
+            self._timings[name] = (count + 1, total + seconds)
+            histogram = self._histograms.setdefault(
+                (name, labels),
+                {"buckets": [0] * len(HISTOGRAM_BUCKETS), "count": 0, "sum": 0.0},
+            )
+            for index, bound in enumerate(HISTOGRAM_BUCKETS):
+                if seconds <= bound:
+                    histogram["buckets"][index] += 1
+                    break
+            histogram["count"] += 1
+            histogram["sum"] += seconds
+
+    def counters(self):
+        with self._lock:
+            return dict(self._counters)
+
+    def timings(self):
+        with self._lock:
+            return {
+                name: {"count": count, "total": total, "average": total / count}
+                for name, (count, total) in self._timings.items()
+            }
+
+    def cache_hit_ratios(self):
+        """
+        Get the ratio of hits to lookups for each cache. Hits in more than one
+        layer of a cache, such as "ranked_results_worker_cache_hits", are added
+        together.
+        """
+
+        counters = self.counters()
+        caches = {
+            name.removesuffix("_cache_misses"): {"hits": 0, "misses": count}
+            for name, count in counters.items()
+            if name.endswith("_cache_misses")
+        }
+        for name, count in counters.items():
+            if not name.endswith("_cache_hits"):
+                continue
+            cache_name = name.removesuffix("_cache_hits")
+            cache_name = next(
+                (
+                    other
+                    for other in caches
+                    if cache_name == other or cache_name.startswith(f"{other}_")
+                ),
+                cache_name,
+            )
+            caches.setdefault(cache_name, {"hits": 0, "misses": 0})["hits"] += count
+        return {
+            cache_name: lookups["hits"] / (lookups["hits"] + lookups["misses"])
+            for cache_name, lookups in caches.items()
+        }
+
+    def prometheus(self, prefix="ds_sitemap_search"):
+        """
+        Get the metrics in the Prometheus text exposition format.
+
+        Every gunicorn worker keeps its own metrics, so each sample is labelled
+        with the process ID of the worker to stop the samples of different
+        workers being mistaken for one another. They can be added together with
+        "sum without (worker)" in PromQL.
+        """
+
+        worker = (("worker", os.getpid()),)
+        lines = []
+        for name, count in sorted(self.counters().items()):
+            lines.append(f"# TYPE {prefix}_{name}_total counter")
+            lines.append(
+                f"{prefix}_{name}_total{{{prometheus_labels(worker)}}} {count}"
+            )
+
+        ratios = self.cache_hit_ratios()
+        if ratios:
+            lines.append(f"# TYPE {prefix}_cache_hit_ratio gauge")
+            for cache_name, ratio in sorted(ratios.items()):
+                labels = prometheus_labels(worker + (("cache", cache_name),))
+                lines.append(f"{prefix}_cache_hit_ratio{{{labels}}} {ratio}")
+
+        with self._lock:
+            histograms = sorted(
+                (
+                    name,
+                    worker + labels,
+                    dict(histogram, buckets=list(histogram["buckets"])),
+                )
+                for (name, labels), histogram in self._histograms.items()
+            )
+        declared = set()
+        for name, labels, histogram in histograms:
+            if name not in declared:
+                lines.append(f"# TYPE {prefix}_{name} histogram")
+                declared.add(name)
+            cumulative = 0
+            for bound, count in zip(HISTOGRAM_BUCKETS, histogram["buckets"]):
+                cumulative += count
+                bucket_labels = prometheus_labels(labels + (("le", bound),))
+                lines.append(f"{prefix}_{name}_bucket{{{bucket_labels}}} {cumulative}")
+            bucket_labels = prometheus_labels(labels + (("le", "+Inf"),))
+            lines.append(
+                f"{prefix}_{name}_bucket{{{bucket_labels}}} {histogram['count']}"
+            )
+            labels = f"{{{prometheus_labels(labels)}}}"
+            lines.append(f"{prefix}_{name}_sum{labels} {histogram['sum']}")
+            lines.append(f"{prefix}_{name}_count{labels} {histogram['count']}")
+        return "\n".join(lines) + "\n"
+
+    def clear(self):
+        with self._lock:
+            self._counters.clear()
+            self._timings.clear()
+            self._histograms.clear()
+
+
+metrics = Metrics()
@@ -0,0 +1,22 @@
+import re
+
+from bs4 import BeautifulSoup
+
+
+def extract_page(html):
+    """Get the title, description and body text of a crawled page."""
+
+    soup = BeautifulSoup(html, "html.parser")
+    title = soup.title
+    title = title.text if title else None
+    description = soup.find("meta", attrs={"property": "og:description"}) or soup.find(
+        "meta", attrs={"name": "description"}
+    )
+    description = (
+        description.attrs["content"]
+        if description and "content" in description.attrs
+        else None
+    )
+    body = soup.find("main") or soup.find(role="main") or soup.body
+    body = re.sub(r"\n+\s*", "\n", body.text).strip() if body else ""
+    return title, description, body
@@ -0,0 +1,135 @@
+import random
+import re
+import threading
+import time
+from collections import Counter
+
+import psycopg2
+import psycopg2.extras
+from flask import current_app
+
+from app.lib.db import DatabasePoolExhausted, db
+from app.lib.sql import get_query_parts
+from app.lib.urls import CONTENT_TYPES
+
+# Queries with email addresses or long numbers, such as phone numbers, might
+# identify someone so they are never logged
+PERSONAL_DATA_RE = re.compile(r"@|\d{6,}")
+
+MAX_QUERY_LENGTH = 200
+
+
+def normalize_query(query):
+    """
+    Normalize a query so equivalent queries are logged together, with the quoted
+    query parts first. Returns None if the query shouldn't be logged.
+    """
+
+    if PERSONAL_DATA_RE.search(query):
+        return None
+    all_query_parts, quoted_query_parts = get_query_parts(query)
+    normalized_query = " ".join(
+        f'"{part}"' if part in quoted_query_parts else part
+        for part in sorted(
+            all_query_parts, key=lambda part: (part not in quoted_query_parts, part)
+        )
+    )
+    if not normalized_query or len(normalized_query) > MAX_QUERY_LENGTH:
+        return None
+    return normalized_query
+
+
+class QueryLog:
+    """
+    A sample of the normalized queries that have been searched for and how many
+    times, used to warm the cache with the most popular queries after a crawl.
+
+    Queries are counted in the memory of each worker and written to the
+    "search_queries" table at most once every SEARCH_QUERY_LOG_FLUSH_INTERVAL
+    seconds, in a background thread so a search never waits for a connection.
+    """
+
+    def __init__(self, app=None):
+        self._lock = threading.Lock()
+        self._counts = Counter()
+        self._last_flushed = time.monotonic()
+        self._flushing = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.sample_rate = app.config.get("SEARCH_QUERY_LOG_SAMPLE_RATE")
+        self.flush_interval = app.config.get("SEARCH_QUERY_LOG_FLUSH_INTERVAL")
+        app.extensions["query_log"] = self
+
+    def record(self, query, requested_types):
+        if not self.sample_rate or random.random() >= self.sample_rate:
+            return
+        if requested_types != "all" and requested_types not in CONTENT_TYPES:
+            return
+        if (normalized_query := normalize_query(query)) is None:
+            return
+        with self._lock:
+            self._counts[(normalized_query, requested_types)] += 1
+            flush = time.monotonic() - self._last_flushed >= self.flush_interval
+        if flush:
+            self._flush_in_background()
+
+    def _flush_in_background(self):
+        app = current_app._get_current_object()
+
+        def flush():
+            with app.app_context():
+                self.flush()
+
+        with self._lock:
+            if self._flushing is not None and self._flushing.is_alive():
+                return
+            self._flushing = threading.Thread(target=flush, daemon=True)
+            self._flushing.start()
+
+    def flush(self):
+        with self._lock:
+            counts = self._counts
+            self._counts = Counter()
+            self._last_flushed = time.monotonic()
+        if not counts:
+            return
+        try:
+            with db.cursor() as cur:
+                psycopg2.extras.execute_values(
+                    cur,
+                    """INSERT INTO "search_queries" ("query", "types", "hits")
+                    VALUES %s
+                    ON CONFLICT ("query", "types") DO UPDATE
+                    SET "hits" = "search_queries"."hits" + EXCLUDED."hits",
+                        "last_searched" = CURRENT_TIMESTAMP;""",
+                    [
+                        (query, requested_types, hits)
+                        for (query, requested_types), hits in counts.items()
+                    ],
+                )
+                cur.connection.commit()
+        except (psycopg2.Error, DatabasePoolExhausted) as e:
+            # Keep the counts to write with the next flush, as logging the query
+            # must never stop a search
+            with self._lock:
+                self._counts.update(counts)
+            current_app.logger.warning(f"Unable to write the query log: {e}")
+
+    def top_queries(self, limit, min_hits=1):
+        """Get the most popular (query, types) that have been logged."""
+
+        with db.cursor() as cur:
+            cur.execute(
+                """SELECT "query", "types"
+                FROM "search_queries"
+                WHERE "hits" >= %s
+                ORDER BY "hits" DESC, "last_searched" DESC
+                LIMIT %s;""",
+                (min_hits, limit),
+            )
+            return [(row["query"], row["types"]) for row in cur.fetchall()]
+
+
+query_log = QueryLog()
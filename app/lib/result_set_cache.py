@@ -0,0 +1,57 @@
+import threading
+from collections import OrderedDict
+
+
+class ResultSetCache:
+    """
+    A least recently used cache of ranked results held in the memory of a worker.
+
+    Each entry holds the total number of results for a query and the ordered
+    (relevance, title, id) tuples of the top results. The cache is bounded by
+    both the number of entries and the total number of tuples it holds.
+    """
+
+    def __init__(self, app=None):
+        self._entries = OrderedDict()
+        self._rows = 0
+        self._lock = threading.Lock()
+        self.max_entries = 0
+        self.max_rows = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.max_entries = app.config.get("RESULT_SET_CACHE_MAX_ENTRIES")
+        self.max_rows = app.config.get("RESULT_SET_CACHE_MAX_ROWS")
+        self.clear()
+
+    def get(self, key):
+        with self._lock:
+            if key not in self._entries:
+                return None
+            self._entries.move_to_end(key)
+            return self._entries[key]
+
+    def set(self, key, total_results, ranked):
+        if not self.max_entries or len(ranked) > self.max_rows:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._rows -= len(self._entries.pop(key)["ranked"])
+            self._entries[key] = {"total_results": total_results, "ranked": ranked}
+            self._rows += len(ranked)
+            while len(self._entries) > self.max_entries or self._rows > self.max_rows:
+                _, evicted = self._entries.popitem(last=False)
+                self._rows -= len(evicted["ranked"])
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._rows = 0
+
+    def status(self):
+        with self._lock:
+            return {"entries": len(self._entries), "rows": self._rows}
+
+
+result_set_cache = ResultSetCache()
@@ -0,0 +1,377 @@
+import json
+import time
+
+import psycopg2.errors
+from flask import current_app
+
+from app.lib.cache import cache
+from app.lib.db import db
+from app.lib.highlighter import get_highlighter
+from app.lib.index_stats import get_index_stats
+from app.lib.index_version import get_index_version
+from app.lib.memory_index import memory_index
+from app.lib.metrics import metrics
+from app.lib.result_set_cache import result_set_cache
+from app.lib.sql import (
+    contruct_candidates_query,
+    contruct_facets_query,
+    contruct_results_query,
+    contruct_search_continuation_query,
+    contruct_search_query,
+)
+from app.lib.urls import CONTENT_TYPES
+
+
+def search_cache_key(all_query_parts, quoted_query_parts, requested_types):
+    """
+    Make a key that is the same for every equivalent query, regardless of the
+    order, case or repetition of the query parts.
+
+    Query parts can contain spaces, so they are serialised as JSON lists to keep
+    the parts of different queries from joining into the same key.
+    """
+
+    return "|".join(
+        [
+            current_app.config.get("SEARCH_ENGINE"),
+            get_index_version(),
+            requested_types,
+            json.dumps(sorted(set(all_query_parts))),
+            json.dumps(sorted(set(quoted_query_parts))),
+        ]
+    )
+
+
+def score_rows(cur, all_query_parts, quoted_query_parts, requested_types, timeout):
+    """
+    Score the rows for a query, in two phases if SEARCH_CANDIDATES is set.
+
+    The first phase finds that many candidates with a cheap score that leaves out
+    the body and the second phase scores only those candidates in full. This
+    trades the recall of the results for the speed of the search, so the total
+    number of results is at most SEARCH_CANDIDATES.
+    """
+
+    candidates = current_app.config.get("SEARCH_CANDIDATES")
+    if not candidates:
+        start = time.perf_counter()
+        sql_query, params = contruct_search_query(
+            all_query_parts=all_query_parts,
+            quoted_query_parts=quoted_query_parts,
+            requested_types=requested_types,
+            limit=current_app.config.get("RANKED_RESULTS_LIMIT"),
+        )
+        db.execute(cur, sql_query, params, timeout=timeout)
+        rows = cur.fetchall()
+        metrics.observe("search_ranking_seconds", time.perf_counter() - start)
+        return rows
+
+    start = time.perf_counter()
+    sql_query, params = contruct_candidates_query(
+        all_query_parts=all_query_parts,
+        quoted_query_parts=quoted_query_parts,
+        requested_types=requested_types,
+        limit=candidates,
+    )
+    db.execute(cur, sql_query, params, timeout=timeout)
+    candidate_ids = [row["id"] for row in cur.fetchall()]
+    metrics.observe("search_candidates_seconds", time.perf_counter() - start)
+
+    start = time.perf_counter()
+    sql_query, params = contruct_search_query(
+        all_query_parts=all_query_parts,
+        quoted_query_parts=quoted_query_parts,
+        requested_types=requested_types,
+        limit=candidates,
+        candidate_ids=candidate_ids,
+    )
+    db.execute(cur, sql_query, params)
+    rows = cur.fetchall()
+    metrics.observe("search_reranking_seconds", time.perf_counter() - start)
+    return rows
+
+
+def rank_within_time_budget(all_query_parts, quoted_query_parts, requested_types):
+    """
+    Score the rows for a query within SEARCH_TIME_BUDGET milliseconds.
+
+    If the full scoring takes longer, the query is cancelled and the rows are
+    scored again without the body, which is much cheaper. The results are then
+    marked as partial.
+    """
+
+    limit = current_app.config.get("RANKED_RESULTS_LIMIT")
+    partial = False
+    with db.cursor() as cur:
+        try:
+            rows = score_rows(
+                cur,
+                all_query_parts,
+                quoted_query_parts,
+                requested_types,
+                timeout=current_app.config.get("SEARCH_TIME_BUDGET"),
+            )
+        except psycopg2.errors.QueryCanceled:
+            cur.connection.rollback()
+            metrics.increment("degraded_searches")
+            current_app.logger.warning(
+                f"Search for {all_query_parts} exceeded the time budget, "
+                "falling back to partial results"
+            )
+            partial = True
+            sql_query, params = contruct_search_query(
+                all_query_parts=all_query_parts,
+                quoted_query_parts=quoted_query_parts,
+                requested_types=requested_types,
+                limit=limit,
+                degraded=True,
+            )
+            db.execute(cur, sql_query, params)
+            rows = cur.fetchall()
+
+    return {
+        "total_results": rows[0]["total_results"] if rows else 0,
+        "ranked": [(row["relevance"], row["title"], row["id"]) for row in rows],
+        "partial": partial,
+    }
+
+
+def get_ranked_results(cache_key, all_query_parts, quoted_query_parts, requested_types):
+    """
+    Get the total number of results and the ranked (relevance, title, id) of the
+    top results.
+
+    The rows are only scored once for each query, after which the ranked results
+    are stored in the worker's result set cache and the shared cache. Partial
+    results are only kept in the shared cache, for SEARCH_DEGRADED_CACHE_TIMEOUT
+    seconds, so the query is tried again in full soon after.
+    """
+
+    if (ranked_results := result_set_cache.get(cache_key)) is not None:
+        metrics.increment("ranked_results_worker_cache_hits")
+        return ranked_results
+
+    if current_app.config.get("SEARCH_ENGINE") == "memory":
+        metrics.increment("ranked_results_cache_misses")
+        ranked_results = memory_index.rank(
+            all_query_parts, quoted_query_parts, requested_types
+        )
+    elif (ranked_results := cache.get(f"ranked-results:{cache_key}")) is not None:
+        metrics.increment("ranked_results_shared_cache_hits")
+    else:
+        metrics.increment("ranked_results_cache_misses")
+        ranked_results = rank_within_time_budget(
+            all_query_parts, quoted_query_parts, requested_types
+        )
+        cache.set(
+            f"ranked-results:{cache_key}",
+            ranked_results,
+            timeout=(
+                current_app.config.get("SEARCH_DEGRADED_CACHE_TIMEOUT")
+                if ranked_results["partial"]
+                else current_app.config.get("SEARCH_CACHE_TIMEOUT")
+            ),
+        )
+
+    if ranked_results.get("partial"):
+        return ranked_results
+    result_set_cache.set(
+        cache_key, ranked_results["total_results"], ranked_results["ranked"]
+    )
+    return ranked_results
+
+
+def continue_ranked_results(
+    cache_key,
+    all_query_parts,
+    quoted_query_parts,
+    requested_types,
+    ranked_results,
+    rows_required,
+):
+    """
+    Extend the ranked results so they include at least the number of rows required.
+
+    The ranking continues from the last known result rather than using an offset.
+    Returns the extended ranking and whether it is partial, which it is if the
+    ranking was already partial or the continuation exceeded the time budget.
+    """
+
+    ranked = ranked_results["ranked"]
+    partial = bool(ranked_results.get("partial"))
+    sql_query, params = contruct_search_continuation_query(
+        all_query_parts=all_query_parts,
+        quoted_query_parts=quoted_query_parts,
+        requested_types=requested_types,
+        after=ranked[-1],
+        limit=rows_required
+        - len(ranked)
+        + current_app.config.get("RANKED_RESULTS_LIMIT"),
+        degraded=partial,
+    )
+    with db.cursor() as cur:
+        try:
+            db.execute(
+                cur,
+                sql_query,
+                params,
+                timeout=current_app.config.get("SEARCH_TIME_BUDGET"),
+            )
+            rows = cur.fetchall()
+        except psycopg2.errors.QueryCanceled:
+            # The later results can't be scored in a comparable way, so only the
+            # results ranked so far are returned
+            cur.connection.rollback()
+            metrics.increment("degraded_search_continuations")
+            return ranked, True
+
+    ranked = ranked + [(row["relevance"], row["title"], row["id"]) for row in rows]
+    if not partial:
+        result_set_cache.set(cache_key, ranked_results["total_results"], ranked)
+    return ranked, partial
+
+
+def get_results(ranked, body_length=0):
+    """
+    Get the details of the ranked results, keeping their order, and the start of
+    their body text if a body_length is given.
+    """
+
+    if not ranked:
+        return []
+    ids = [id for _, _, id in ranked]
+    if current_app.config.get("SEARCH_ENGINE") == "memory" and not body_length:
+        # Pages removed since the results were ranked are left out
+        rows = {row["id"]: row for row in memory_index.get_results(ids)}
+    else:
+        # The memory index doesn't keep the body text so snippets come from the
+        # database for every engine
+        sql_query, params = contruct_results_query(ids, body_length)
+        with db.cursor() as cur:
+            db.execute(cur, sql_query, params)
+            rows = {row["id"]: row for row in cur.fetchall()}
+    return [
+        rows[id] | {"relevance": relevance} for relevance, _, id in ranked if id in rows
+    ]
+
+
+def search(
+    all_query_parts,
+    quoted_query_parts,
+    requested_types,
+    page=1,
+    results_per_page=12,
+):
+    """
+    Get a page of results, the total number of results for a query and whether
+    the results are partial because the search exceeded its time budget.
+
+    Pages are stored in the shared cache beneath the cache of rendered pages, so
+    equivalent queries and requests with different cookies share the results.
+    """
+
+    cache_key = search_cache_key(all_query_parts, quoted_query_parts, requested_types)
+    page_cache_key = f"search-page:{cache_key}|{page}|{results_per_page}"
+    if (cached_page := cache.get(page_cache_key)) is not None:
+        metrics.increment("search_page_cache_hits")
+        return (
+            cached_page["results"],
+            cached_page["total_results"],
+            cached_page["partial"],
+        )
+    metrics.increment("search_page_cache_misses")
+
+    ranked_results = get_ranked_results(
+        cache_key, all_query_parts, quoted_query_parts, requested_types
+    )
+    total_results = ranked_results["total_results"]
+    ranked = ranked_results["ranked"]
+    partial = bool(ranked_results.get("partial"))
+
+    offset = (page - 1) * results_per_page
+    if offset >= total_results:
+        return [], total_results, partial
+
+    # The page is beyond the ranked results that have been stored so far
+    if offset + results_per_page > len(ranked) and len(ranked) < total_results:
+        ranked, partial = continue_ranked_results(
+            cache_key,
+            all_query_parts,
+            quoted_query_parts,
+            requested_types,
+            ranked_results,
+            offset + results_per_page,
+        )
+
+    snippet_length = current_app.config.get("SEARCH_SNIPPET_LENGTH")
+    results = get_results(
+        ranked[offset : offset + results_per_page],
+        body_length=(
+            current_app.config.get("SEARCH_SNIPPET_BODY_LENGTH")
+            if snippet_length
+            else 0
+        ),
+    )
+    if snippet_length:
+        # Keep the part of the body that best matches the query instead of the
+        # start of the body text
+        highlighter = get_highlighter(all_query_parts)
+        for result in results:
+            result["snippet"] = highlighter.snippet(
+                result.pop("body") or "", snippet_length
+            )
+    cache.set(
+        page_cache_key,
+        {"results": results, "total_results": total_results, "partial": partial},
+        timeout=(
+            current_app.config.get("SEARCH_DEGRADED_CACHE_TIMEOUT")
+            if partial
+            else current_app.config.get("SEARCH_CACHE_TIMEOUT")
+        ),
+    )
+    return results, total_results, partial
+
+
+def get_facets(all_query_parts, quoted_query_parts):
+    """
+    Get the number of results of each content type for a query, regardless of the
+    requested types.
+
+    Returns None if counting the results exceeds the time budget.
+    """
+
+    # Every page matches an empty query, so use the stored statistics
+    if not all_query_parts:
+        return get_index_stats()["content_types"]
+
+    cache_key = f"facets:{search_cache_key(all_query_parts, quoted_query_parts, 'all')}"
+    if (facets := cache.get(cache_key)) is not None:
+        metrics.increment("facets_cache_hits")
+        return facets
+    metrics.increment("facets_cache_misses")
+
+    if current_app.config.get("SEARCH_ENGINE") == "memory":
+        facets = memory_index.facets(all_query_parts, quoted_query_parts)
+    else:
+        sql_query, params = contruct_facets_query(all_query_parts, quoted_query_parts)
+        with db.cursor() as cur:
+            try:
+                db.execute(
+                    cur,
+                    sql_query,
+                    params,
+                    timeout=current_app.config.get("SEARCH_TIME_BUDGET"),
+                )
+                rows = cur.fetchall()
+            except psycopg2.errors.QueryCanceled:
+                cur.connection.rollback()
+                metrics.increment("degraded_search_facets")
+                return None
+        facets = {content_type: 0 for content_type in CONTENT_TYPES} | {
+            row["content_type"]: row["total_results"]
+            for row in rows
+            if row["content_type"] in CONTENT_TYPES
+        }
+
+    cache.set(cache_key, facets, timeout=current_app.config.get("SEARCH_CACHE_TIMEOUT"))
+    return facets
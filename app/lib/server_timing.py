@@ -0,0 +1,45 @@
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+from flask import g, has_request_context
+
+
+@contextmanager
+def stage(name):
+    """
+    Time a stage of handling a request so it can be reported in the Server-Timing
+    header. Stages that happen more than once in a request are added together.
+    """
+
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        if has_request_context():
+            timings = g.setdefault("server_timings", {})
+            timings[name] = timings.get(name, 0.0) + time.perf_counter() - start
+
+
+def timed_stage(name):
+    """Time every call to a function as a stage of handling a request."""
+
+    def decorator(function):
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                return function(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def get_stage_timings():
+    return g.get("server_timings", {}) if has_request_context() else {}
+
+
+def server_timing_header(timings):
+    return ", ".join(
+        f"{name};dur={seconds * 1000:.2f}" for name, seconds in timings.items()
+    )
@@ -0,0 +1,143 @@
+import hashlib
+import pickle
+from array import array
+from bisect import bisect_left
+from multiprocessing import shared_memory
+
+
+def url_hash(url):
+    return int.from_bytes(
+        hashlib.blake2b(url.encode(), digest_size=8).digest(), "little"
+    )
+
+
+class SharedUrlSet:
+    """
+    A read only set of URLs which can be shared between processes without being
+    copied, for checking if the crawler has seen a URL before.
+
+    The URLs are stored as a sorted array of their 64 bit hashes in shared
+    memory, which is looked up with a binary search. When the set is pickled to
+    send it to another process only the name of the shared memory is sent, and
+    the other process attaches to it.
+
+    Different URLs could have the same hash, so a URL may be wrongly found in
+    the set, but with fewer than a million URLs the chance is less than one in
+    ten million.
+    """
+
+    def __init__(self, urls=()):
+        self._create({url_hash(url): None for url in urls})
+
+    def _create(self, values):
+        hashes = array("Q", sorted(values))
+        payload = self._payload([values[hash] for hash in hashes])
+        self._length = len(hashes)
+        self._memory = shared_memory.SharedMemory(
+            create=True, size=max(hashes.itemsize * self._length + len(payload), 1)
+        )
+        self._memory.buf[: hashes.itemsize * self._length] = hashes.tobytes()
+        self._memory.buf[hashes.itemsize * self._length :][: len(payload)] = payload
+        self._attach()
+
+    def _payload(self, values):
+        """Get the bytes stored after the hashes, for the values of the URLs."""
+
+        return b""
+
+    def _attach(self):
+        self._hashes = self._memory.buf[: 8 * self._length].cast("Q")
+
+    def _views(self):
+        return [self._hashes]
+
+    def __getstate__(self):
+        return {"name": self._memory.name, "length": self._length}
+
+    def __setstate__(self, state):
+        self._length = state["length"]
+        self._memory = shared_memory.SharedMemory(name=state["name"])
+        self._attach()
+
+    def __len__(self):
+        return self._length
+
+    def _index(self, url):
+        hash = url_hash(url)
+        index = bisect_left(self._hashes, hash)
+        if index < self._length and self._hashes[index] == hash:
+            return index
+        return None
+
+    def __contains__(self, url):
+        return self._index(url) is not None
+
+    def close(self):
+        """Detach from the shared memory in this process."""
+
+        for view in self._views():
+            view.release()
+        self._memory.close()
+
+    def __del__(self):
+        # The views must be released before the shared memory can be closed
+        if hasattr(self, "_hashes"):
+            for view in self._views():
+                view.release()
+
+    def unlink(self):
+        """Detach from and free the shared memory, once every process is done."""
+
+        self.close()
+        self._memory.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.unlink()
+
+
+class SharedUrlMap(SharedUrlSet):
+    """
+    A read only mapping of URLs to values which can be shared between processes
+    without being copied, like a SharedUrlSet.
+
+    The values are pickled one after another after the hashes, with an array of
+    where each one starts, and are only unpickled when they are looked up.
+    """
+
+    def __init__(self, items=()):
+        self._create(
+            {url_hash(url): pickle.dumps(value) for url, value in dict(items).items()}
+        )
+
+    def _payload(self, values):
+        offsets = array("Q", [0])
+        for value in values:
+            offsets.append(offsets[-1] + len(value))
+        return offsets.tobytes() + b"".join(values)
+
+    def _attach(self):
+        super()._attach()
+        offsets_end = 8 * (2 * self._length + 1)
+        self._offsets = self._memory.buf[8 * self._length : offsets_end].cast("Q")
+        self._values = self._memory.buf[offsets_end:]
+
+    def _views(self):
+        return [self._hashes, self._offsets, self._values]
+
+    def _value(self, index):
+        return pickle.loads(
+            self._values[self._offsets[index] : self._offsets[index + 1]]
+        )
+
+    def get(self, url, default=None):
+        index = self._index(url)
+        return default if index is None else self._value(index)
+
+    def __getitem__(self, url):
+        index = self._index(url)
+        if index is None:
+            raise KeyError(url)
+        return self._value(index)
@@ -3,19 +3,36 @@ import sys
 import urllib.error
 import urllib.request
 import xml.etree.ElementTree as ET
+from datetime import datetime, timezone
 
 
-def parse_sitemap(sitemap_xml):
-    urls = set()
+def parse_lastmod(lastmod):
+    """Parse the W3C datetime of a <lastmod>, or get None if it isn't valid."""
+
+    try:
+        date = datetime.fromisoformat(lastmod.strip())
+    except (AttributeError, ValueError):
+        return None
+    # Dates without a time zone are assumed to be in UTC
+    return date if date.tzinfo else date.replace(tzinfo=timezone.utc)
+
+
+def parse_sitemap_entries(sitemap_xml):
+    """Get the last modified date of each URL in a sitemap, or None if it has none."""
+
+    entries = {}
     if sitemap_xml is not None and (
         sitemap_xml.tag == "{http://www.sitemaps.org/schemas/sitemap/0.9}urlset"
     ):
         for url in sitemap_xml:
             if url.tag == "{http://www.sitemaps.org/schemas/sitemap/0.9}url":
-                for loc in url:
-                    if loc.tag == "{http://www.sitemaps.org/schemas/sitemap/0.9}loc":
-                        url = loc.text
-                        urls.add(url)
+                loc = url.findtext("{http://www.sitemaps.org/schemas/sitemap/0.9}loc")
+                if loc:
+                    entries[loc] = parse_lastmod(
+                        url.findtext(
+                            "{http://www.sitemaps.org/schemas/sitemap/0.9}lastmod"
+                        )
+                    )
     elif sitemap_xml is not None and (
         sitemap_xml.tag == "{http://www.sitemaps.org/schemas/sitemap/0.9}sitemapindex"
     ):
@@ -25,11 +42,15 @@ def parse_sitemap(sitemap_xml):
                     if loc.tag == "{http://www.sitemaps.org/schemas/sitemap/0.9}loc":
                         url = loc.text
                         if " " not in url:
-                            urls.update(get_urls_from_sitemap(url))
-    return list(urls)
+                            entries.update(get_sitemap_entries(url))
+    return entries
 
 
-def get_urls_from_sitemap(sitemap_url):
+def parse_sitemap(sitemap_xml):
+    return list(parse_sitemap_entries(sitemap_xml))
+
+
+def get_sitemap_entries(sitemap_url):
     print(f"Getting pages from {sitemap_url}...")
     root = None
     ctx = ssl.create_default_context()
@@ -39,7 +60,7 @@ def get_urls_from_sitemap(sitemap_url):
         with urllib.request.urlopen(sitemap_url, context=ctx) as f:
             xml = f.read().decode("utf-8")
             root = ET.fromstring(xml)
-            return parse_sitemap(root)
+            return parse_sitemap_entries(root)
     except urllib.error.HTTPError as e:
         print(f"⚠️ [ FAIL ] {sitemap_url} - HTTPError: {e.code}")
         sys.exit(1)
@@ -48,3 +69,7 @@ def get_urls_from_sitemap(sitemap_url):
         sys.exit(1)
     print(f"⚠️ [ FAIL ] {sitemap_url} - An unknown error occured")
     sys.exit(1)
+
+
+def get_urls_from_sitemap(sitemap_url):
+    return list(get_sitemap_entries(sitemap_url))
@@ -3,6 +3,10 @@ import re
 from flask import current_app
 from psycopg2 import sql
 
+from app.lib.server_timing import timed_stage
+from app.lib.url_rules import escape_like
+from app.lib.urls import CONTENT_TYPES
+
 
 def get_query_parts(query):
     # Create an empty set to hold quoted query parts
@@ -24,13 +28,57 @@ def get_query_parts(query):
     return query_parts, quoted_query_parts
 
 
-def contruct_search_query(
-    all_query_parts,
-    quoted_query_parts,
-    requested_types,
-    page=1,
-    results_per_page=12,
-):
+def get_trimmed_query_parts(query):
+    """
+    Get the query parts for a query, trimming them to MAX_QUERY_PARTS and
+    preferring quoted parts.
+    """
+
+    all_query_parts, quoted_query_parts = get_query_parts(query)
+
+    # Get the maximum number of query parts allowed
+    max_query_parts = current_app.config.get("MAX_QUERY_PARTS")
+
+    # Check if the number of query parts exceeds the maximum allowed and
+    # trim the list if necessary, preferring quoted parts
+    num_query_parts_exceeded = False
+    if len(all_query_parts) > max_query_parts:
+        num_query_parts_exceeded = True
+        if len(quoted_query_parts) >= max_query_parts:
+            all_query_parts = list(quoted_query_parts)[:max_query_parts]
+            quoted_query_parts = set(all_query_parts)
+        else:
+            all_query_parts = (
+                list(quoted_query_parts)
+                + all_query_parts[: max_query_parts - len(quoted_query_parts)]
+            )
+
+    return all_query_parts, quoted_query_parts, num_query_parts_exceeded
+
+
+class QueryParameters:
+    """
+    Collect the values used in a query so the query itself is a template that is
+    the same for every query with the same structure.
+    """
+
+    def __init__(self):
+        self.values = {}
+
+    def add(self, value, type=None):
+        name = f"p{len(self.values) + 1}"
+        self.values[name] = value
+        placeholder = sql.Placeholder(name)
+        return (
+            sql.SQL("{placeholder}::{type}").format(
+                placeholder=placeholder, type=sql.SQL(type)
+            )
+            if type
+            else placeholder
+        )
+
+
+def get_query_fields(degraded=False):
     # Define the fields we want to query and their realtive weights
     query_fields = [
         {
@@ -50,10 +98,42 @@ def contruct_search_query(
             "weight": current_app.config.get("RELEVANCE_URL_MATCH_WEIGHT"),
         },
     ]
+    # The body is by far the longest field so it is left out of the cheaper plan
+    # used when a search runs out of time
+    if degraded:
+        return [field for field in query_fields if field["field"] != "body"]
+    return query_fields
+
+
+def get_quote_weight(query_part, quoted_query_parts):
+    return (
+        current_app.config.get("RELEVANCE_QUOTE_MATCH_MULTIPLIER")
+        if query_part in quoted_query_parts
+        else 1
+    )
+
+
+def substring_search_sub_query(
+    all_query_parts, quoted_query_parts, params, degraded=False
+):
+    """
+    Score each row by counting the instances of every query part in every field.
+
+    This requires every row of the table to be read and scored.
+    """
+
+    if not all_query_parts:
+        return sql.SQL("1"), sql.SQL("")
+
+    query_fields = [
+        field | {"weight": params.add(field["weight"], "numeric")}
+        for field in get_query_fields(degraded)
+    ]
 
     # Build a list of SQL sub-queries for each query part to search the fields
     sql_sub_queries = []
     for query_part in all_query_parts:
+        query_part_param = params.add(query_part, "text")
         sql_sub_query_parts = []
         for field in query_fields:
             field_name = field["field"]
@@ -66,51 +146,190 @@ def contruct_search_query(
                             ) * {field_weight} ELSE 0 END
                         )""").format(
                     field=sql.Identifier(field_name),
-                    query_part=sql.Literal(query_part),
-                    field_weight=sql.Literal(field_weight),
+                    query_part=query_part_param,
+                    field_weight=field_weight,
                 )
             )
         sql_sub_queries.append(
             sql.SQL("( {part_scores} * {weight} )").format(
                 part_scores=sql.SQL(" + ").join(sql_sub_query_parts),
-                weight=sql.Literal(
-                    current_app.config.get("RELEVANCE_QUOTE_MATCH_MULTIPLIER")
-                    if query_part in quoted_query_parts
-                    else 1
+                weight=params.add(
+                    get_quote_weight(query_part, quoted_query_parts), "numeric"
                 ),
             )
         )
 
-    # Add a sub-query to filter by types if requested
-    types_sub_query = sql.SQL("")
-    if requested_types == "research-guides":
-        types_sub_query = sql.SQL("""
-            AND "url" LIKE '%/help-with-your-research/research-guides/%'
-            AND "url" NOT LIKE '%/help-with-your-research/research-guides/'
-            """)
-    elif requested_types == "archived-blog-posts":
-        types_sub_query = sql.SQL(
-            """AND "url" LIKE 'https://blog.nationalarchives.gov.uk/%'"""
+    return sql.SQL(" + ").join(sql_sub_queries), sql.SQL("")
+
+
+def fulltext_search_sub_query(
+    all_query_parts, quoted_query_parts, params, degraded=False
+):
+    """
+    Score each row using the weighted "search_vector" column.
+
+    Rows are prefiltered with the GIN index on "search_vector" so only rows that
+    match at least one of the query parts are scored. Quoted query parts are
+    matched as phrases.
+    """
+
+    if not all_query_parts:
+        return sql.SQL("1"), sql.SQL("")
+
+    # The weights of the "search_vector" column are set in populate.py:
+    # A = title, B = description, C = url and D = body
+    field_weights = {
+        field["field"]: field["weight"] for field in get_query_fields(degraded)
+    }
+    max_field_weight = max(field_weights.values()) or 1
+    rank_weights = params.add(
+        [
+            field_weights.get("body", 0) / max_field_weight,
+            field_weights["url"] / max_field_weight,
+            field_weights["description"] / max_field_weight,
+            field_weights["title"] / max_field_weight,
+        ],
+        "float4[]",
+    )
+
+    text_search_config = params.add(
+        current_app.config.get("SEARCH_FULLTEXT_CONFIG"), "regconfig"
+    )
+    ts_queries = [
+        sql.SQL("{function}({config}, {query_part})").format(
+            function=sql.SQL(
+                "phraseto_tsquery"
+                if query_part in quoted_query_parts
+                else "plainto_tsquery"
+            ),
+            config=text_search_config,
+            query_part=params.add(query_part, "text"),
         )
-    elif requested_types == "education-and-outreach":
-        types_sub_query = sql.SQL(
-            """AND "url" LIKE '%.nationalarchives.gov.uk/education/%'"""
+        for query_part in all_query_parts
+    ]
+
+    sql_sub_queries = [
+        sql.SQL(
+            """( ts_rank({rank_weights}, "search_vector", {ts_query}) * {weight} )"""
+        ).format(
+            rank_weights=rank_weights,
+            ts_query=ts_query,
+            weight=params.add(
+                get_quote_weight(query_part, quoted_query_parts), "numeric"
+            ),
         )
+        for query_part, ts_query in zip(all_query_parts, ts_queries)
+    ]
+
+    return sql.SQL(" + ").join(sql_sub_queries), sql.SQL(
+        """AND "search_vector" @@ ( {ts_queries} )"""
+    ).format(ts_queries=sql.SQL(" || ").join(ts_queries))
+
+
+def trigram_search_sub_query(
+    all_query_parts, quoted_query_parts, params, degraded=False
+):
+    """
+    Score each row by counting the instances of every query part in every field,
+    the same as the "substring" engine.
+
+    Rows are prefiltered with the pg_trgm GIN indexes on each field so only rows
+    that contain at least one of the query parts are scored.
+    """
+
+    search_sub_query, _ = substring_search_sub_query(
+        all_query_parts, quoted_query_parts, params, degraded
+    )
+    return search_sub_query, substring_prefilter(all_query_parts, params, degraded)
+
+
+def substring_prefilter(all_query_parts, params, degraded=False):
+    """
+    Filter the rows to those that contain at least one of the query parts in a
+    field with a weight, using the pg_trgm GIN indexes if they exist.
+    """
+
+    if not all_query_parts:
+        return sql.SQL("")
+
+    # Only the fields with a weight can contribute to the relevance
+    query_fields = [field for field in get_query_fields(degraded) if field["weight"]]
+    if not query_fields:
+        return sql.SQL("")
+
+    prefilters = []
+    for query_part in all_query_parts:
+        like_query_part = params.add(f"%{escape_like(query_part)}%", "text")
+        prefilters += [
+            sql.SQL("{field} ILIKE {query_part}").format(
+                field=sql.Identifier(field["field"]),
+                query_part=like_query_part,
+            )
+            for field in query_fields
+        ]
+
+    return sql.SQL("AND ( {prefilter} )").format(
+        prefilter=sql.SQL(" OR ").join(prefilters)
+    )
+
+
+SEARCH_ENGINES = {
+    "substring": substring_search_sub_query,
+    "fulltext": fulltext_search_sub_query,
+    "trigram": trigram_search_sub_query,
+}
+
+
+def order_query_parts(all_query_parts, quoted_query_parts):
+    # Put the quoted query parts first so equivalent queries share a template
+    return sorted(
+        all_query_parts, key=lambda part: (part not in quoted_query_parts, part)
+    )
+
 
-    blacklisted_urls = current_app.config.get("BLACKLISTED_URLS_SQL_LIKE")
-    blacklist_sub_where = (
-        sql.SQL("""AND "url" NOT LIKE ALL({blacklisted_url_likes})""").format(
-            blacklisted_url_likes=sql.Literal(blacklisted_urls)
+def get_types_sub_query(requested_types, params):
+    # Add a sub-query to filter by types if requested, using the content type that
+    # was stored when the page was crawled
+    return (
+        sql.SQL("""AND "content_type" = {requested_types}""").format(
+            requested_types=params.add(requested_types, "text")
         )
-        if blacklisted_urls
+        if requested_types in CONTENT_TYPES
         else sql.SQL("")
     )
 
-    # Get the web archive domains from the config - this is used to determine if a URL
-    # is archived and should have a different relevance weight
-    webarchive_domains = current_app.config.get("ARCHIVED_URLS")
 
-    # Create the main SQL query to fetch the results
+def contruct_scored_results_query(
+    all_query_parts,
+    quoted_query_parts,
+    requested_types,
+    params,
+    degraded=False,
+    candidate_ids=None,
+):
+    # Get the scoring and filtering sub-queries for the configured search engine
+    search_engine = current_app.config.get("SEARCH_ENGINE")
+    if search_engine not in SEARCH_ENGINES:
+        raise ValueError(f"Unknown search engine '{search_engine}'")
+    search_sub_query, search_sub_where = SEARCH_ENGINES[search_engine](
+        order_query_parts(all_query_parts, quoted_query_parts),
+        quoted_query_parts,
+        params,
+        degraded,
+    )
+    types_sub_query = get_types_sub_query(requested_types, params)
+
+    # Only score the candidates from the first phase of a two-phase search
+    candidates_sub_query = (
+        sql.SQL("""AND "id" = ANY({candidate_ids})""").format(
+            candidate_ids=params.add(list(candidate_ids), "integer[]")
+        )
+        if candidate_ids is not None
+        else sql.SQL("")
+    )
+
+    # Create the SQL query to score every matching row - the URL depth and whether
+    # the URL is archived or blacklisted were stored when the page was crawled
     return sql.SQL(
         """WITH "scored_results" AS (
             SELECT
@@ -118,53 +337,240 @@ def contruct_search_query(
                 "title",
                 "url",
                 "description",
+                "content_type",
                 (
                     (
                         {search_sub_query}
                     ) /
-                    (
-                        (
-                            CHAR_LENGTH(url) -
-                            CHAR_LENGTH(REPLACE(url, '/', ''))
-                        ) + 1
-                    )
+                    ( "url_depth" + 1 )
                 ) *
                 (
                     CASE
-                        WHEN "url" LIKE {webarchive_domains} THEN {archived_weight}
+                        WHEN "is_archived" THEN {archived_weight}
                         ELSE 1
                     END
                 ) AS "relevance"
             FROM "sitemap_urls"
             WHERE "url" IS NOT NULL
-                {blacklist_sub_where}
+                AND NOT "is_blacklisted"
+                {search_sub_where}
                 {types_sub_query}
+                {candidates_sub_query}
+        )""",
+    ).format(
+        search_sub_query=search_sub_query,
+        search_sub_where=search_sub_where,
+        archived_weight=params.add(
+            current_app.config.get("RELEVANCE_ARCHIVED_WEIGHT"), "numeric"
+        ),
+        types_sub_query=types_sub_query,
+        candidates_sub_query=candidates_sub_query,
+    )
+
+
+@timed_stage("sql")
+def contruct_candidates_query(
+    all_query_parts,
+    quoted_query_parts,
+    requested_types,
+    limit=1000,
+):
+    """
+    Get the IDs of the candidates for the first phase of a two-phase search.
+
+    Candidates are the rows that contain at least one of the query parts, found
+    with the indexes used by the "fulltext" or "trigram" engines. They are ordered
+    by a cheap score that leaves out the body, then only the best are scored in
+    full by contruct_search_query with their candidate_ids.
+    """
+
+    params = QueryParameters()
+    all_query_parts = order_query_parts(all_query_parts, quoted_query_parts)
+    if current_app.config.get("SEARCH_ENGINE") == "fulltext":
+        # The "search_vector" column includes the body so it can be used to match
+        # the rows, even though the body isn't part of the score
+        search_sub_query, search_sub_where = fulltext_search_sub_query(
+            all_query_parts, quoted_query_parts, params, degraded=True
         )
+    else:
+        search_sub_query, _ = substring_search_sub_query(
+            all_query_parts, quoted_query_parts, params, degraded=True
+        )
+        # The body is left out of the prefilter too so it can use the trigram
+        # indexes on the other fields rather than scanning every body
+        search_sub_where = substring_prefilter(all_query_parts, params, degraded=True)
+
+    return (
+        sql.SQL("""SELECT "id"
+        FROM "sitemap_urls"
+        WHERE "url" IS NOT NULL
+            AND NOT "is_blacklisted"
+            {search_sub_where}
+            {types_sub_query}
+        ORDER BY ( {search_sub_query} ) / ( "url_depth" + 1 ) DESC,
+            "id" ASC
+        LIMIT {limit};""").format(
+            search_sub_query=search_sub_query,
+            search_sub_where=search_sub_where,
+            types_sub_query=get_types_sub_query(requested_types, params),
+            limit=params.add(limit, "integer"),
+        ),
+        params.values,
+    )
+
+
+@timed_stage("sql")
+def contruct_search_query(
+    all_query_parts,
+    quoted_query_parts,
+    requested_types,
+    limit=1000,
+    degraded=False,
+    candidate_ids=None,
+):
+    """
+    Rank the results for a query in a single pass over the matching rows.
+
+    Returns the relevance, title and ID of the top results along with the total
+    number of results so later pages can be served without scoring the rows again.
+
+    Like all the search queries, this returns the query template and the values of
+    its parameters separately. A degraded query leaves the body out of the scoring
+    and candidate IDs limit the scoring to those rows.
+    """
+
+    params = QueryParameters()
+    scored_results = contruct_scored_results_query(
+        all_query_parts,
+        quoted_query_parts,
+        requested_types,
+        params,
+        degraded,
+        candidate_ids,
+    )
+    return (
+        sql.SQL("""{scored_results}
         SELECT
-            "id",
-            "title",
-            "url",
-            "description",
             "relevance",
-            (SELECT COUNT(*) FROM "scored_results" WHERE "relevance" > 0) AS "total_results"
+            "title",
+            "id",
+            COUNT(*) OVER () AS "total_results"
         FROM "scored_results"
         WHERE "relevance" > 0
         ORDER BY "relevance" DESC,
-            "title" ASC
-        LIMIT {limit}
-        OFFSET {offset};""",
-    ).format(
-        search_sub_query=(
-            sql.SQL(" + ").join(sql_sub_queries) if sql_sub_queries else sql.SQL("1")
+            "title" ASC,
+            "id" ASC
+        LIMIT {limit};""").format(
+            scored_results=scored_results,
+            limit=params.add(limit, "integer"),
         ),
-        archived_weight=sql.Literal(
-            current_app.config.get("RELEVANCE_ARCHIVED_WEIGHT")
+        params.values,
+    )
+
+
+@timed_stage("sql")
+def contruct_search_continuation_query(
+    all_query_parts,
+    quoted_query_parts,
+    requested_types,
+    after,
+    limit=1000,
+    degraded=False,
+):
+    """
+    Continue a ranking from the (relevance, title, id) of the last known result.
+
+    The results are sorted by relevance descending then title and ID ascending,
+    with untitled results last, so the continuation is built up from each column.
+    """
+
+    params = QueryParameters()
+    scored_results = contruct_scored_results_query(
+        all_query_parts, quoted_query_parts, requested_types, params, degraded
+    )
+
+    relevance, title, id = after
+    relevance = params.add(relevance)
+    id = params.add(id)
+    if title is not None:
+        title = params.add(title)
+        title_continuation = sql.SQL(
+            """"title" > {title} OR "title" IS NULL OR ("title" = {title} AND "id" > {id})"""
+        ).format(title=title, id=id)
+    else:
+        title_continuation = sql.SQL(""""title" IS NULL AND "id" > {id}""").format(
+            id=id
+        )
+
+    return (
+        sql.SQL("""{scored_results}
+        SELECT
+            "relevance",
+            "title",
+            "id"
+        FROM "scored_results"
+        WHERE "relevance" > 0
+            AND (
+                "relevance" < {relevance}
+                OR ("relevance" = {relevance} AND ({title_continuation}))
+            )
+        ORDER BY "relevance" DESC,
+            "title" ASC,
+            "id" ASC
+        LIMIT {limit};""").format(
+            scored_results=scored_results,
+            relevance=relevance,
+            title_continuation=title_continuation,
+            limit=params.add(limit, "integer"),
         ),
-        blacklist_sub_where=blacklist_sub_where,
-        types_sub_query=types_sub_query,
-        limit=sql.Literal(results_per_page),
-        offset=sql.Literal((page - 1) * results_per_page),
-        webarchive_domains=sql.Literal(
-            "|".join([f"{domain}%" for domain in webarchive_domains])
+        params.values,
+    )
+
+
+@timed_stage("sql")
+def contruct_facets_query(all_query_parts, quoted_query_parts):
+    """Count the results of each content type for a query."""
+
+    params = QueryParameters()
+    scored_results = contruct_scored_results_query(
+        all_query_parts, quoted_query_parts, "all", params
+    )
+    return (
+        sql.SQL("""{scored_results}
+        SELECT
+            "content_type",
+            COUNT(*) AS "total_results"
+        FROM "scored_results"
+        WHERE "relevance" > 0
+        GROUP BY "content_type";""").format(scored_results=scored_results),
+        params.values,
+    )
+
+
+@timed_stage("sql")
+def contruct_results_query(ids, body_length=0):
+    """
+    Get the details of some results, with the start of their body text if a
+    body_length is given so snippets can be made without fetching whole bodies.
+    """
+
+    params = QueryParameters()
+    return (
+        sql.SQL("""SELECT
+            "id",
+            "title",
+            "url",
+            "description"{body}
+        FROM "sitemap_urls"
+        WHERE "id" = ANY({ids});""").format(
+            body=(
+                sql.SQL(', LEFT("body", {body_length}) AS "body"').format(
+                    body_length=params.add(body_length, "integer")
+                )
+                if body_length
+                else sql.SQL("")
+            ),
+            ids=params.add(list(ids), "integer[]"),
         ),
+        params.values,
     )
@@ -0,0 +1,292 @@
+import heapq
+import os
+import re
+import threading
+import unicodedata
+from array import array
+from bisect import bisect_left
+
+from flask import current_app
+
+from app.lib.db import db
+from app.lib.index_version import get_index_version
+
+# The same suffixes are removed from titles in the search results
+TITLE_SUFFIXES = (
+    ", Author at The National Archives blog",
+    " - The National Archives blog",
+    " - The National Archives Design System",
+    " - The National Archives",
+)
+
+WORD_RE = re.compile(r"[a-z0-9]+")
+
+
+def clean_title(title):
+    for suffix in TITLE_SUFFIXES:
+        title = title.replace(suffix, "")
+    return title.strip()
+
+
+def normalize(text):
+    """Lowercase text and reduce it to ASCII words separated by single spaces."""
+
+    text = unicodedata.normalize("NFKD", text).encode("ascii", "ignore").decode()
+    return " ".join(WORD_RE.findall(text.lower()))
+
+
+# Prefixes which start more than this many keys have their suggestions ranked
+# when the array is built, so a request never scans more keys than this
+PRECOMPUTED_RANGE_SIZE = 1000
+
+
+class TitleSuggestions:
+    """
+    A sorted array of the normalized titles of all the crawled pages, used to
+    suggest titles while a user is typing a query.
+
+    Each title is added once for every word in it so a title can be suggested
+    from the start of any of its words. The suggestions for short or common
+    prefixes, which start too many keys to rank in a request, are ranked when
+    the array is built.
+
+    The array is loaded when a worker starts, or in a background thread on the
+    first request if it isn't preloaded, in which case nothing is suggested until
+    it has loaded. When the index version changes it is rebuilt in a background
+    thread while the previous one is still used.
+    """
+
+    def __init__(self, app=None):
+        self._lock = threading.Lock()
+        self._pid = None
+        self._version = None
+        self._building = None
+        self._data = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.extensions["title_suggestions"] = self
+        if app.config.get("SEARCH_SUGGESTIONS_PRELOAD"):
+            with app.app_context():
+                try:
+                    self._rebuild(get_index_version())
+                except Exception as e:
+                    app.logger.error(f"Unable to load the title suggestions: {e}")
+
+    def _load(self):
+        with db.cursor() as cur:
+            cur.execute("""SELECT "title", "url", "url_depth", "is_archived"
+                FROM "sitemap_urls"
+                WHERE "url" IS NOT NULL
+                    AND "title" IS NOT NULL
+                    AND NOT "is_blacklisted";""")
+            rows = cur.fetchall()
+
+        # Weight the titles in the same way as a title match in a search
+        title_weight = current_app.config.get("RELEVANCE_TITLE_MATCH_WEIGHT")
+        archived_weight = current_app.config.get("RELEVANCE_ARCHIVED_WEIGHT")
+
+        titles = []
+        entries = []
+        for row in rows:
+            title = clean_title(row["title"])
+            normalized_title = normalize(title)
+            if not normalized_title:
+                continue
+            weight = (title_weight / ((row["url_depth"] or 0) + 1)) * (
+                archived_weight if row["is_archived"] else 1
+            )
+            title_index = len(titles)
+            titles.append((title, row["url"], normalized_title))
+            for word in re.finditer(r"\S+", normalized_title):
+                # Titles that start with the query are better suggestions than
+                # titles with a later word that starts with it
+                entries.append(
+                    (
+                        normalized_title[word.start() :],
+                        title_index,
+                        weight if word.start() == 0 else weight / 2,
+                    )
+                )
+        entries.sort()
+
+        data = {
+            "keys": [key for key, _, _ in entries],
+            "title_indexes": array("I", (index for _, index, _ in entries)),
+            "weights": array("d", (weight for _, _, weight in entries)),
+            "titles": titles,
+            "limit": current_app.config.get("SEARCH_SUGGESTIONS_LIMIT"),
+        }
+        data["precomputed"] = self._precompute(data)
+        return data
+
+    def _precompute(self, data):
+        """
+        Rank the suggestions for each prefix which starts more than
+        PRECOMPUTED_RANGE_SIZE keys.
+
+        The prefixes are found from the shortest to the longest, and then ranked
+        from the longest to the shortest so each prefix only needs the rankings of
+        its longer prefixes and the keys which aren't in them.
+        """
+
+        keys = data["keys"]
+        groups = []
+        parents = [{"length": 0, "start": 0, "end": len(keys), "children": []}]
+        while parents:
+            longer_parents = []
+            for parent in parents:
+                length = parent["length"] + 1
+                index = parent["start"]
+                while index < parent["end"]:
+                    if len(keys[index]) < length:
+                        # The key is the whole of the shorter prefix
+                        index += 1
+                        continue
+                    prefix = keys[index][:length]
+                    end = bisect_left(keys, next_prefix(prefix), index, parent["end"])
+                    if end - index > PRECOMPUTED_RANGE_SIZE:
+                        group = {
+                            "prefix": prefix,
+                            "length": length,
+                            "start": index,
+                            "end": end,
+                            "children": [],
+                        }
+                        parent["children"].append(group)
+                        groups.append(group)
+                        longer_parents.append(group)
+                    index = end
+            parents = longer_parents
+
+        min_length = current_app.config.get("SEARCH_SUGGESTIONS_MIN_LENGTH")
+        precomputed = {}
+        for group in reversed(groups):
+            group["ranked"] = rank(
+                data, group["start"], group["end"], data["limit"], group["children"]
+            )
+            if group["length"] >= min_length:
+                precomputed[group["prefix"]] = group["ranked"]
+        return precomputed
+
+    def _rebuild(self, version):
+        data = self._load()
+        with self._lock:
+            self._data = data
+            self._pid = os.getpid()
+            self._version = version
+            self._building = None
+
+    def _rebuild_in_background(self, version):
+        app = current_app._get_current_object()
+
+        def rebuild():
+            with app.app_context():
+                try:
+                    self._rebuild(version)
+                except Exception as e:
+                    app.logger.error(f"Unable to load the title suggestions: {e}")
+                    with self._lock:
+                        self._building = None
+
+        thread = threading.Thread(target=rebuild, daemon=True)
+        self._building = thread
+        thread.start()
+
+    def ensure_loaded(self):
+        """
+        Start rebuilding the suggestions if the index version has changed and
+        get the suggestions to use until then, if there are any.
+        """
+
+        version = get_index_version()
+        with self._lock:
+            if (self._pid != os.getpid() or self._version != version) and (
+                self._building is None or not self._building.is_alive()
+            ):
+                self._rebuild_in_background(version)
+            return self._data
+
+    def suggest(self, query, limit=8):
+        """Get the best titles with a word that starts with the query."""
+
+        prefix = normalize(query)
+        if len(prefix) < current_app.config.get("SEARCH_SUGGESTIONS_MIN_LENGTH"):
+            return []
+
+        data = self.ensure_loaded()
+        if data is None:
+            return []
+        if prefix in data["precomputed"] and limit <= data["limit"]:
+            ranked = data["precomputed"][prefix][:limit]
+        else:
+            keys = data["keys"]
+            ranked = rank(
+                data,
+                bisect_left(keys, prefix),
+                bisect_left(keys, next_prefix(prefix)),
+                limit,
+            )
+        return [
+            {"title": data["titles"][index][0], "url": data["titles"][index][1]}
+            for index, _ in ranked
+        ]
+
+    def status(self):
+        with self._lock:
+            data = self._data or {"titles": [], "keys": [], "precomputed": {}}
+            return {
+                "titles": len(data["titles"]),
+                "keys": len(data["keys"]),
+                "precomputed_prefixes": len(data["precomputed"]),
+                "version": self._version,
+            }
+
+
+def next_prefix(prefix):
+    """Get the first string after all the strings that start with a prefix."""
+
+    return prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+def rank(data, start, end, limit, children=()):
+    """
+    Get the best titles for a range of keys, with their weights. The rankings of
+    any longer prefixes within the range are used instead of their keys.
+    """
+
+    titles = data["titles"]
+    title_indexes = data["title_indexes"]
+    weights = data["weights"]
+    best = {}
+    position = start
+    for child in [*children, {"start": end, "end": end, "ranked": []}]:
+        for i in range(position, child["start"]):
+            title_index = title_indexes[i]
+            if weights[i] > best.get(title_index, 0):
+                best[title_index] = weights[i]
+        for title_index, weight in child["ranked"]:
+            if weight > best.get(title_index, 0):
+                best[title_index] = weight
+        position = child["end"]
+
+    ranked = []
+    seen = set()
+    for title_index, weight in heapq.nsmallest(
+        limit * 2,
+        best.items(),
+        key=lambda item: (-item[1], titles[item[0]][2], item[0]),
+    ):
+        normalized_title = titles[title_index][2]
+        # Only suggest each title once, even if more than one page has it
+        if normalized_title in seen:
+            continue
+        seen.add(normalized_title)
+        ranked.append((title_index, weight))
+        if len(ranked) == limit:
+            break
+    return ranked
+
+
+title_suggestions = TitleSuggestions()
@@ -1,10 +1,9 @@
-import re
 from datetime import datetime
-from urllib.parse import quote_plus
 
 from tna_utilities.string import slugify as slugify_util
 
-from app.lib.urls import correct_url, is_url_archived
+from app.lib.highlighter import Highlighter, get_highlighter
+from app.lib.urls import correct_url, is_url_archived, url_content_type
 
 
 def slugify(s):
@@ -19,30 +18,31 @@ def remove_quotes(s):
     return s.replace('"', "").replace("'", "")
 
 
+# The labels shown above results of each content type
+RESULT_TYPE_LABELS = {
+    "research-guides": "Research guide",
+    # "education-and-outreach": "Education resource",
+}
+
+
 def result_type(url):
     url = correct_url(url)
     if is_url_archived(url):
         return "Archived"
-    if "/help-with-your-research/research-guides/" in url:
-        return "Research guide"
-    # if "/education/resources/" in url:
-    #     return "Education resource"
-    return ""
+    return RESULT_TYPE_LABELS.get(url_content_type(url), "")
 
 
-def mark(s, substrings):
-    substrings = (
+def mark(s, substrings, escape_html=False):
+    highlighter = (
         substrings
-        if isinstance(substrings, list)
-        else [
-            re.escape(string.replace('"', "").strip())
-            for string in substrings.split(" ")
-            if string
-        ]
+        if isinstance(substrings, Highlighter)
+        else get_highlighter(
+            substrings
+            if isinstance(substrings, list)
+            else [string.replace('"', "").strip() for string in substrings.split(" ")]
+        )
     )
-    substrings = [re.escape(quote_plus(string)) for string in substrings if string]
-    compiled = re.compile(f"({'|'.join(substrings)})", re.IGNORECASE)
-    return compiled.sub(r"<mark>\g<0></mark>", s)
+    return highlighter.mark(s, escape_html=escape_html)
 
 
 def pretty_age(date):
@@ -0,0 +1,111 @@
+import re
+
+from psycopg2 import sql
+
+from config import Production
+
+# The content types of pages, in order of priority, and a regular expression
+# matching the URLs of each of them
+CONTENT_TYPE_RULES = {
+    "research-guides": r".*/help-with-your-research/research-guides/.",
+    "archived-blog-posts": r"https://blog\.nationalarchives\.gov\.uk/",
+    "education-and-outreach": r".*\.nationalarchives\.gov\.uk/education/",
+}
+
+CONTENT_TYPES = list(CONTENT_TYPE_RULES)
+
+
+def escape_like(value):
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def sql_like_to_regex(pattern):
+    return "".join(
+        ".*" if char == "%" else "." if char == "_" else re.escape(char)
+        for char in pattern
+    )
+
+
+def prefixes_regex(prefixes):
+    return re.compile("|".join(re.escape(prefix) for prefix in prefixes) or r"(?!)")
+
+
+class UrlRules:
+    """
+    The rules for remapping, archiving, blacklisting and finding the content type
+    of URLs, each compiled once into a single regular expression.
+
+    The same rules are used to show results, to store the details derived from
+    URLs when pages are crawled and to make SQL predicates.
+    """
+
+    def __init__(self, config=None):
+        self.configure(config or vars(Production))
+
+    def init_app(self, app):
+        self.configure(app.config)
+        app.extensions["url_rules"] = self
+
+    def configure(self, config):
+        self.domain_remaps = dict(config.get("DOMAIN_REMAPS") or {})
+        self.archived_urls = list(config.get("ARCHIVED_URLS") or [])
+        self.blacklisted_urls_sql_like = list(
+            config.get("BLACKLISTED_URLS_SQL_LIKE") or []
+        )
+
+        # Alternatives are tried in order so the first matching rule is used
+        self._remaps_re = prefixes_regex(self.domain_remaps)
+        self._archived_re = prefixes_regex(self.archived_urls)
+        self._blacklisted_re = re.compile(
+            "|".join(
+                f"(?:{sql_like_to_regex(pattern)})"
+                for pattern in self.blacklisted_urls_sql_like
+            )
+            or r"(?!)",
+            re.DOTALL,
+        )
+        self._content_types_re = re.compile(
+            "|".join(
+                f"(?P<content_type_{index}>{regex})"
+                for index, regex in enumerate(CONTENT_TYPE_RULES.values())
+            ),
+            re.DOTALL,
+        )
+
+    def correct_url(self, url):
+        if match := self._remaps_re.match(url):
+            domain = match.group()
+            return url.replace(domain, self.domain_remaps[domain])
+        return url
+
+    def is_archived(self, url):
+        return bool(self._archived_re.match(url))
+
+    def is_blacklisted(self, url):
+        return bool(self._blacklisted_re.fullmatch(url))
+
+    def content_type(self, url):
+        if match := self._content_types_re.match(url):
+            return CONTENT_TYPES[int(match.lastgroup.rsplit("_", 1)[1])]
+        return None
+
+    def remapped_domain_sql(self, field, old_domain):
+        """
+        Get a predicate matching the URLs in a field that start with a remapped
+        domain, and an expression to remap them.
+        """
+
+        field = sql.Identifier(field)
+        return (
+            sql.SQL("{field} LIKE {pattern}").format(
+                field=field, pattern=sql.Literal(f"{escape_like(old_domain)}%")
+            ),
+            sql.SQL("OVERLAY({field} PLACING {new_domain} FROM 1 FOR {length})").format(
+                field=field,
+                new_domain=sql.Literal(self.domain_remaps[old_domain]),
+                length=sql.Literal(len(old_domain)),
+            ),
+        )
+
+
+url_rules = UrlRules()
@@ -1,31 +1,21 @@
-import json
-import os
-
-from config import ARCHIVED_URLS, DOMAIN_REMAPS
+from app.lib.url_rules import CONTENT_TYPES, url_rules  # noqa: F401
 
 
 def correct_url(url):
-    remaps = DOMAIN_REMAPS | (json.loads(os.environ.get("DOMAIN_REMAPS", "{}")))
-    for domain, replacement in remaps.items():
-        if url.startswith(domain):
-            return url.replace(domain, replacement)
-    return url
+    return url_rules.correct_url(url)
 
 
 def is_url_archived(url):
-    archived_urls: list[str] = [
-        domain
-        for domain in (
-            ARCHIVED_URLS
-            + [
-                archived_url
-                for archived_url in os.environ.get("ARCHIVED_URLS", "").split(",")
-                if archived_url
-            ]
-        )
-        if domain
-    ]
-    for archived_url in archived_urls:
-        if url.startswith(archived_url):
-            return True
-    return False
+    return url_rules.is_archived(url)
+
+
+def is_url_blacklisted(url):
+    return url_rules.is_blacklisted(url)
+
+
+def url_depth(url):
+    return url.count("/")
+
+
+def url_content_type(url):
+    return url_rules.content_type(url)
@@ -1,31 +1,38 @@
+import hashlib
 import math
-import os
+import time
 import unicodedata
 from urllib.parse import unquote
 
-import psycopg2
-import psycopg2.extras
-from flask import current_app, render_template, request
+from flask import (
+    current_app,
+    g,
+    jsonify,
+    make_response,
+    render_template,
+    request,
+)
 
 from app.lib.cache import cache
-from app.lib.cache_key_prefix import cache_key_prefix
+from app.lib.cache_key_prefix import versioned_cache_key_prefix
+from app.lib.conditional_response import conditional_response
+from app.lib.highlighter import get_highlighter
+from app.lib.index_stats import get_index_stats
+from app.lib.index_version import get_index_version
+from app.lib.metrics import metrics
 from app.lib.pagination import pagination_object
-from app.lib.sql import contruct_search_query, get_query_parts
+from app.lib.query_log import query_log
+from app.lib.search import get_facets, search
+from app.lib.server_timing import get_stage_timings, server_timing_header, stage
+from app.lib.sql import get_trimmed_query_parts
+from app.lib.suggestions import title_suggestions
+from app.lib.template_filters import result_type
+from app.lib.urls import CONTENT_TYPES, correct_url
 from app.sitemap_search import bp
 
 
-@bp.route("/")
-@cache.cached(key_prefix=cache_key_prefix)
-def index():
-    """
-    Search the sitemap database for URLs matching the query.
-
-    This is a simple and "hacky" search implementation that constructs a complex SQL
-    query to search the database of previously crawled pages.
-
-    It is a temporary solution until we can implement a more robust search solution
-    using Wagtail.
-    """
+def get_search_arguments():
+    """Get the query, types and page from the query parameters."""
 
     # Get the query from the query parameters
     query = unquote(request.args.get("q", ""))
@@ -48,58 +55,99 @@ def index():
         if request.args.get("page") and request.args.get("page").isnumeric()
         else 1
     )
-    results_per_page = current_app.config.get("RESULTS_PER_PAGE")
 
-    # Start a connection to the database and create a cursor
-    conn = psycopg2.connect(
-        host=os.environ.get("DB_HOST"),
-        database=os.environ.get("DB_NAME"),
-        user=os.environ.get("DB_USERNAME"),
-        password=os.environ.get("DB_PASSWORD"),
-    )
-    cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+    return query, requested_types, page
+
+
+@bp.before_request
+def log_search_query():
+    """Log a sample of the searches, including those served from the cache."""
+
+    if request.endpoint in ("sitemap_search.index", "sitemap_search.api"):
+        query, requested_types, page = get_search_arguments()
+        if query and page == 1:
+            query_log.record(query, requested_types)
+
+
+@bp.before_request
+def start_timing():
+    g.request_started = time.perf_counter()
+
+
+@bp.after_request
+def add_server_timing(response):
+    """
+    Report how long each stage of a search took in the Server-Timing header and
+    add the timings to the latency histograms, labelled by the requested types
+    and the number of query parts.
+    """
+
+    if request.endpoint not in ("sitemap_search.index", "sitemap_search.api"):
+        return response
+    timings = get_stage_timings() | {"total": time.perf_counter() - g.request_started}
+    if current_app.config.get("SEARCH_SERVER_TIMING"):
+        response.headers["Server-Timing"] = server_timing_header(timings)
+
+    query, requested_types, _ = get_search_arguments()
+    labels = {
+        "endpoint": request.endpoint.removeprefix("sitemap_search."),
+        "types": (
+            requested_types
+            if requested_types == "all" or requested_types in CONTENT_TYPES
+            else "other"
+        ),
+        "query_parts": str(len(get_trimmed_query_parts(query)[0])),
+    }
+    for name, seconds in timings.items():
+        if name == "total":
+            metrics.observe("search_request_seconds", seconds, labels)
+        else:
+            metrics.observe("search_stage_seconds", seconds, labels | {"stage": name})
+    return response
+
+
+def is_complete_response(response):
+    """Only cache rendered pages which don't have partial results."""
+
+    return not g.get("partial_results")
+
+
+@bp.route("/")
+@conditional_response
+@cache.cached(
+    key_prefix=versioned_cache_key_prefix, response_filter=is_complete_response
+)
+def index():
+    """
+    Search the sitemap database for URLs matching the query.
+
+    This is a simple and "hacky" search implementation that constructs a complex SQL
+    query to search the database of previously crawled pages.
+
+    It is a temporary solution until we can implement a more robust search solution
+    using Wagtail.
+    """
+
+    with stage("parse"):
+        query, requested_types, page = get_search_arguments()
+        all_query_parts, quoted_query_parts, num_query_parts_exceeded = (
+            get_trimmed_query_parts(query)
+        )
+    results_per_page = current_app.config.get("RESULTS_PER_PAGE")
 
     # If there is a query, we need to search the database
     if query or requested_types != "all":
-        all_query_parts, quoted_query_parts = get_query_parts(query)
-
-        # Get the maximum number of query parts allowed
-        max_query_parts = current_app.config.get("MAX_QUERY_PARTS")
-
-        # Check if the number of query parts exceeds the maximum allowed and
-        # trim the list if necessary, preferring quoted parts
-        num_query_parts_exceeded = False
-        if len(all_query_parts) > max_query_parts:
-            num_query_parts_exceeded = True
-            if len(quoted_query_parts) >= max_query_parts:
-                all_query_parts = list(quoted_query_parts)[:max_query_parts]
-                quoted_query_parts = set(all_query_parts)
-            else:
-                all_query_parts = (
-                    list(quoted_query_parts)
-                    + all_query_parts[: max_query_parts - len(quoted_query_parts)]
-                )
-
-        # Construct and execute the SQL query
-        sql_query = contruct_search_query(
+        # Get the page of results and the total number of results, only scoring
+        # the rows once for all the pages of the same query. The results are
+        # partial if the search ran out of time and fell back to a cheaper plan
+        results, total_results, partial_results = search(
             all_query_parts=all_query_parts,
             quoted_query_parts=quoted_query_parts,
             requested_types=requested_types,
             page=page,
             results_per_page=results_per_page,
         )
-        cur.execute(sql_query)
-
-        # Get all the results
-        results = cur.fetchall()
-
-        # Close the cursor and connection
-        cur.close()
-        conn.close()
-
-        # Get the total number of results and calculate the pages required for
-        # pagination
-        total_results = results[0]["total_results"] if len(results) else 0
+        g.partial_results = partial_results
         pages = math.ceil(total_results / results_per_page)
 
         # If there are no results and the page is greater than 1, return a 404
@@ -107,49 +155,148 @@ def index():
             return render_template("errors/page-not-found.html")
 
         # Render the template with the results
-        return render_template(
-            "sitemap_search/index.html",
-            q=query,
-            all_query_parts=all_query_parts,
-            num_query_parts_exceeded=num_query_parts_exceeded,
-            page=page,
-            pages=pages,
-            results=results,
-            total_results=total_results,
-            results_per_page=results_per_page,
-            pagination=pagination_object(page, pages, request.args),
-        )
+        with stage("render"):
+            return render_template(
+                "sitemap_search/index.html",
+                q=query,
+                all_query_parts=all_query_parts,
+                highlighter=get_highlighter(all_query_parts),
+                num_query_parts_exceeded=num_query_parts_exceeded,
+                partial_results=partial_results,
+                page=page,
+                pages=pages,
+                results=results,
+                total_results=total_results,
+                results_per_page=results_per_page,
+                pagination=pagination_object(page, pages, request.args),
+            )
     else:
-        # If there is no query, we just return the index page with no results
-        sql_query = psycopg2.sql.SQL("""
-                    SELECT COUNT(*) AS total_results,
-                        MAX(date_updated) AS last_updated
-                    FROM sitemap_urls
-                    WHERE url NOT LIKE ANY({blacklisted_url_likes})""").format(
-            blacklisted_url_likes=psycopg2.sql.Literal(
-                current_app.config.get("BLACKLISTED_URLS_SQL_LIKE")
+        # If there is no query, we just return the index page with no results and
+        # the total number of pages and last updated date stored by the crawler
+        stats = get_index_stats()
+        total_results = stats["total"]
+        last_updated = stats["last_updated"]
+
+        # Render the template with no results
+        with stage("render"):
+            return render_template(
+                "sitemap_search/index.html",
+                q=query,
+                page=page,
+                pages=0,
+                results=[],
+                total_results=total_results,
+                last_updated=last_updated,
+                results_per_page=results_per_page,
+                pagination={},
             )
-        )
-        cur.execute(sql_query)
-        results = cur.fetchall()
 
-        # Close the cursor and connection
-        cur.close()
-        conn.close()
 
-        # Get the total number of results and last updated date
-        total_results = results[0]["total_results"] if len(results) else 0
-        last_updated = results[0]["last_updated"] if len(results) else None
+@bp.route("/api/")
+def api():
+    """
+    Search the sitemap database for URLs matching the query and return the results
+    as JSON, without rendering a template.
 
-        # Render the template with no results
-        return render_template(
-            "sitemap_search/index.html",
-            q=query,
-            page=page,
-            pages=0,
-            results=[],
-            total_results=total_results,
-            last_updated=last_updated,
-            results_per_page=results_per_page,
-            pagination={},
+    The ETag changes whenever the index or the app changes, so clients and CDNs
+    can revalidate the results without the search being run again. Partial
+    results and pages past the last are sent without validators and aren't
+    stored.
+    """
+
+    query, requested_types, page = get_search_arguments()
+    results_per_page = current_app.config.get("RESULTS_PER_PAGE")
+
+    etag = hashlib.md5(
+        "|".join(
+            [
+                get_index_version(),
+                current_app.config.get("BUILD_VERSION") or "",
+                current_app.config.get("SEARCH_ENGINE"),
+                query,
+                requested_types,
+                str(page),
+                str(results_per_page),
+            ]
+        ).encode()
+    ).hexdigest()
+    if request.if_none_match.contains(etag):
+        response = make_response("", 304)
+    else:
+        all_query_parts, quoted_query_parts, num_query_parts_exceeded = (
+            get_trimmed_query_parts(query)
+        )
+        results, total_results, partial_results = [], 0, False
+        facets = {}
+        if query or requested_types != "all":
+            results, total_results, partial_results = search(
+                all_query_parts=all_query_parts,
+                quoted_query_parts=quoted_query_parts,
+                requested_types=requested_types,
+                page=page,
+                results_per_page=results_per_page,
+            )
+            facets = get_facets(all_query_parts, quoted_query_parts)
+        response = jsonify(
+            {
+                "query": query,
+                "query_parts": all_query_parts,
+                "query_parts_exceeded": num_query_parts_exceeded,
+                "types": requested_types,
+                "page": page,
+                "pages": math.ceil(total_results / results_per_page),
+                "total": total_results,
+                "partial": partial_results,
+                "results": [
+                    {
+                        "id": result["id"],
+                        "title": result["title"],
+                        "url": correct_url(result["url"]),
+                        "description": result["description"],
+                        "snippet": result.get("snippet"),
+                        "type": result_type(result["url"]),
+                        "relevance": float(result["relevance"]),
+                    }
+                    for result in results
+                ],
+                "facets": facets,
+            }
         )
+
+        # If there are no results and the page is greater than 1, return a 404
+        if not results and page > 1:
+            response.status_code = 404
+        if partial_results:
+            response.headers["Cache-Control"] = "no-store"
+            return response
+    if response.status_code in (200, 304):
+        response.set_etag(etag)
+        response.cache_control.public = True
+        response.cache_control.max_age = current_app.config.get("SEARCH_API_MAX_AGE")
+    return response
+
+
+@bp.route("/suggest/")
+def suggest():
+    """
+    Suggest the titles of pages as a user types a query.
+
+    The suggestions come from a sorted array of titles held in the memory of each
+    worker, so the database isn't queried.
+    """
+
+    query = request.args.get("q", "")
+    response = jsonify(
+        {
+            "query": query,
+            "suggestions": [
+                suggestion | {"url": correct_url(suggestion["url"])}
+                for suggestion in title_suggestions.suggest(
+                    query, limit=current_app.config.get("SEARCH_SUGGESTIONS_LIMIT")
+                )
+            ],
+        }
+    )
+    response.cache_control.public = True
+    response.cache_control.max_age = current_app.config.get("SEARCH_API_MAX_AGE")
+    return response
@@ -1,4 +1,4 @@
-from populate import populate
+from populate import bump_index_generation, populate
 
 if __name__ == "__main__":
     if (
@@ -9,5 +9,6 @@ if __name__ == "__main__":
     ):
         print("Dropping all URLs and re-indexing...")
         populate(drop_table=True)
+        bump_index_generation()
     else:
         print("Operation cancelled. No URLs were dropped.")
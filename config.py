@@ -11,6 +11,24 @@ DOMAIN_REMAPS = {
 ARCHIVED_URLS = [
     "https://blog.nationalarchives.gov.uk/",
 ]
+BLACKLISTED_URLS_SQL_LIKE = [
+    "%nationalarchives.gov.uk/tag/%",
+    "%nationalarchives.gov.uk/im_guidance_link/%",
+    "%nationalarchives.gov.uk/category/new-chat/%",
+    "%nationalarchives.gov.uk/category/records-2/%",
+]
+SEARCH_ENGINE = os.environ.get("SEARCH_ENGINE", "substring")
+SEARCH_FULLTEXT_CONFIG = os.environ.get("SEARCH_FULLTEXT_CONFIG", "english")
+SEARCH_CANDIDATES = int(os.environ.get("SEARCH_CANDIDATES", "0"))
+CRAWL_MODE = os.environ.get("CRAWL_MODE", "async")
+CRAWL_CONCURRENCY = int(os.environ.get("CRAWL_CONCURRENCY", "16"))
+CRAWL_HOST_CONCURRENCY = int(os.environ.get("CRAWL_HOST_CONCURRENCY", "4"))
+CRAWL_PARSE_CONCURRENCY = int(os.environ.get("CRAWL_PARSE_CONCURRENCY", "2"))
+CRAWL_QUEUE_SIZE = int(os.environ.get("CRAWL_QUEUE_SIZE", "100"))
+CRAWL_TIMEOUT = int(os.environ.get("CRAWL_TIMEOUT", "10"))
+CRAWL_WRITE_BATCH_SIZE = int(os.environ.get("CRAWL_WRITE_BATCH_SIZE", "100"))
+CRAWL_FLUSH_INTERVAL = float(os.environ.get("CRAWL_FLUSH_INTERVAL", "1"))
+CRAWL_REMOVE_MAX_FRACTION = float(os.environ.get("CRAWL_REMOVE_MAX_FRACTION", "0.1"))
 
 
 class Features:
@@ -69,10 +87,28 @@ class Production(Features):
     }
     FORCE_HTTPS: bool = strtobool(os.getenv("FORCE_HTTPS", "False"))
 
-    CACHE_TYPE: str = "FileSystemCache"
+    CACHE_TYPE: str = os.environ.get("CACHE_TYPE", "FileSystemCache")
     CACHE_DEFAULT_TIMEOUT: int = int(os.environ.get("CACHE_DEFAULT_TIMEOUT", "300"))
     CACHE_IGNORE_ERRORS: bool = True
+    CACHE_KEY_PREFIX: str = os.environ.get("CACHE_KEY_PREFIX", "ds-sitemap-search:")
     CACHE_DIR: str = os.environ.get("CACHE_DIR", "/tmp")
+    CACHE_REDIS_URL: str = os.environ.get("CACHE_REDIS_URL", "")
+
+    DB_HOST: str = os.environ.get("DB_HOST", "")
+    DB_NAME: str = os.environ.get("DB_NAME", "")
+    DB_USERNAME: str = os.environ.get("DB_USERNAME", "")
+    DB_PASSWORD: str = os.environ.get("DB_PASSWORD", "")
+    DB_CONNECT_TIMEOUT: int = int(os.environ.get("DB_CONNECT_TIMEOUT", "3"))
+    DB_STATEMENT_TIMEOUT: int = int(os.environ.get("DB_STATEMENT_TIMEOUT", "10000"))
+    DB_POOL_MIN_CONNECTIONS: int = int(os.environ.get("DB_POOL_MIN_CONNECTIONS", "1"))
+    DB_POOL_MAX_CONNECTIONS: int = int(
+        os.environ.get("DB_POOL_MAX_CONNECTIONS", os.environ.get("THREADS", "4"))
+    )
+    DB_POOL_TIMEOUT: float = float(os.environ.get("DB_POOL_TIMEOUT", "5"))
+    DB_POOL_PRE_PING: bool = strtobool(os.getenv("DB_POOL_PRE_PING", "True"))
+    DB_PREPARED_STATEMENTS: bool = strtobool(
+        os.getenv("DB_PREPARED_STATEMENTS", "True")
+    )
 
     GA4_ID: str = os.environ.get("GA4_ID", "")
 
@@ -92,7 +128,33 @@ class Production(Features):
         if domain
     ]
 
+    SEARCH_ENGINE: str = SEARCH_ENGINE
+    SEARCH_FULLTEXT_CONFIG: str = SEARCH_FULLTEXT_CONFIG
+    SEARCH_MEMORY_INDEX_BATCH_SIZE: int = int(
+        os.environ.get("SEARCH_MEMORY_INDEX_BATCH_SIZE", "2000")
+    )
+    SEARCH_MEMORY_INDEX_MIN_TOKEN: int = int(
+        os.environ.get("SEARCH_MEMORY_INDEX_MIN_TOKEN", "3")
+    )
+
     MAX_QUERY_PARTS: int = int(os.environ.get("MAX_QUERY_PARTS", "12"))
+    SEARCH_TIME_BUDGET: int = int(os.environ.get("SEARCH_TIME_BUDGET", "2000"))
+    SEARCH_CACHE_TIMEOUT: int = int(os.environ.get("SEARCH_CACHE_TIMEOUT", "86400"))
+    SEARCH_DEGRADED_CACHE_TIMEOUT: int = int(
+        os.environ.get("SEARCH_DEGRADED_CACHE_TIMEOUT", "60")
+    )
+    SEARCH_CANDIDATES: int = SEARCH_CANDIDATES
+    SEARCH_API_MAX_AGE: int = int(os.environ.get("SEARCH_API_MAX_AGE", "300"))
+    SEARCH_CACHE_CONTROL: str = os.environ.get(
+        "SEARCH_CACHE_CONTROL", "public, max-age=0, must-revalidate"
+    )
+    SEARCH_SUGGESTIONS_PRELOAD: bool = strtobool(
+        os.getenv("SEARCH_SUGGESTIONS_PRELOAD", "True")
+    )
+    SEARCH_SUGGESTIONS_LIMIT: int = int(os.environ.get("SEARCH_SUGGESTIONS_LIMIT", "8"))
+    SEARCH_SUGGESTIONS_MIN_LENGTH: int = int(
+        os.environ.get("SEARCH_SUGGESTIONS_MIN_LENGTH", "2")
+    )
 
     RELEVANCE_TITLE_MATCH_WEIGHT: float = float(
         os.environ.get("RELEVANCE_TITLE_MATCH_WEIGHT", "250")
@@ -120,14 +182,33 @@ class Production(Features):
             "",
         ).split(",")
         if blacklisted_url
-    ] or [
-        "%nationalarchives.gov.uk/tag/%",
-        "%nationalarchives.gov.uk/im_guidance_link/%",
-        "%nationalarchives.gov.uk/category/new-chat/%",
-        "%nationalarchives.gov.uk/category/records-2/%",
-    ]
+    ] or BLACKLISTED_URLS_SQL_LIKE
 
     RESULTS_PER_PAGE: int = int(os.environ.get("RESULTS_PER_PAGE", "12"))
+    RANKED_RESULTS_LIMIT: int = int(os.environ.get("RANKED_RESULTS_LIMIT", "1200"))
+    RESULT_SET_CACHE_MAX_ENTRIES: int = int(
+        os.environ.get("RESULT_SET_CACHE_MAX_ENTRIES", "256")
+    )
+    RESULT_SET_CACHE_MAX_ROWS: int = int(
+        os.environ.get("RESULT_SET_CACHE_MAX_ROWS", "100000")
+    )
+    INDEX_VERSION_TTL: int = int(os.environ.get("INDEX_VERSION_TTL", "30"))
+
+    SEARCH_SERVER_TIMING: bool = strtobool(os.getenv("SEARCH_SERVER_TIMING", "True"))
+    SEARCH_SNIPPET_LENGTH: int = int(os.environ.get("SEARCH_SNIPPET_LENGTH", "0"))
+    SEARCH_SNIPPET_BODY_LENGTH: int = int(
+        os.environ.get("SEARCH_SNIPPET_BODY_LENGTH", "2000")
+    )
+    SEARCH_QUERY_LOG_SAMPLE_RATE: float = float(
+        os.environ.get("SEARCH_QUERY_LOG_SAMPLE_RATE", "0.1")
+    )
+    SEARCH_QUERY_LOG_FLUSH_INTERVAL: int = int(
+        os.environ.get("SEARCH_QUERY_LOG_FLUSH_INTERVAL", "60")
+    )
+    SEARCH_WARM_QUERIES: int = int(os.environ.get("SEARCH_WARM_QUERIES", "50"))
+    SEARCH_WARM_MIN_HITS: int = int(os.environ.get("SEARCH_WARM_MIN_HITS", "2"))
+    SEARCH_WARM_PAGES: int = int(os.environ.get("SEARCH_WARM_PAGES", "2"))
+    SEARCH_WARM_CONCURRENCY: int = int(os.environ.get("SEARCH_WARM_CONCURRENCY", "2"))
 
 
 class Staging(Production):
@@ -157,6 +238,9 @@ class Test(Production):
     SENTRY_SAMPLE_RATE = 0
 
     CACHE_TYPE = "SimpleCache"
+
+    SEARCH_SUGGESTIONS_PRELOAD = False
+    SEARCH_QUERY_LOG_SAMPLE_RATE = 0
     CACHE_DEFAULT_TIMEOUT = 1
 
     FORCE_HTTPS = False
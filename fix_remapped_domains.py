@@ -1,6 +1,7 @@
-from populate import db_connections, fix_remapped_domains
+from populate import bump_index_generation, db_connections, fix_remapped_domains
 
 if __name__ == "__main__":
     fix_remapped_domains()
+    bump_index_generation()
     db_connections.closeall()
     exit(0)
@@ -1,18 +1,45 @@
+import hashlib
 import os
-import re
 import sys
+from collections import Counter
 from multiprocessing import Pool
+from urllib.parse import urlparse
 
 import psycopg2
 import psycopg2.extras
 import requests
-from bs4 import BeautifulSoup
 from psycopg2 import sql
 from psycopg2.pool import SimpleConnectionPool
 
-from app.lib.sitemaps import get_urls_from_sitemap
-from app.lib.urls import correct_url
-from config import DOMAIN_REMAPS
+from app.lib.crawler import Crawler
+from app.lib.index_stats import refresh_index_stats
+from app.lib.index_version import publish_index_generation
+from app.lib.pages import extract_page
+from app.lib.shared_url_set import SharedUrlMap
+from app.lib.sitemaps import get_sitemap_entries
+from app.lib.url_rules import url_rules
+from app.lib.urls import (
+    correct_url,
+    is_url_archived,
+    is_url_blacklisted,
+    url_content_type,
+    url_depth,
+)
+from config import (
+    CRAWL_CONCURRENCY,
+    CRAWL_FLUSH_INTERVAL,
+    CRAWL_HOST_CONCURRENCY,
+    CRAWL_MODE,
+    CRAWL_PARSE_CONCURRENCY,
+    CRAWL_QUEUE_SIZE,
+    CRAWL_REMOVE_MAX_FRACTION,
+    CRAWL_TIMEOUT,
+    CRAWL_WRITE_BATCH_SIZE,
+    SEARCH_CANDIDATES,
+    SEARCH_ENGINE,
+    SEARCH_FULLTEXT_CONFIG,
+)
+from warm_cache import warm_cache
 
 
 class bcolors:
@@ -31,6 +58,21 @@ def padded_enumeration(number, total):
     return f"[{str(number).rjust(len(str(total)), ' ')}/{total}]"
 
 
+def content_hash(title, description, body):
+    return hashlib.sha256(
+        "\0".join([title or "", description or "", body or ""]).encode()
+    ).hexdigest()
+
+
+def url_details(url):
+    return (
+        url_depth(url),
+        is_url_archived(url),
+        is_url_blacklisted(url),
+        url_content_type(url),
+    )
+
+
 db_connections = SimpleConnectionPool(
     1,
     10,
@@ -43,150 +85,447 @@ db_connections = SimpleConnectionPool(
 
 
 class Engine(object):
-    def __init__(self, num_urls, existing_urls, skip_existing=False):
+    def __init__(
+        self,
+        num_urls,
+        skip_existing=False,
+        validators=None,
+        sitemap_lastmods=None,
+        sitemap=None,
+    ):
         self.num_urls = num_urls
-        self.existing_urls = existing_urls
         self.skip_existing = skip_existing
+        # The ETag, Last-Modified, content hash and sitemap lastmod of each
+        # existing URL, in a dict or a SharedUrlMap shared with other processes
+        self.validators = {} if validators is None else validators
+        # The lastmod of each URL in the sitemap being crawled
+        self.sitemap_lastmods = sitemap_lastmods or {}
+        # The sitemap being crawled, which is stored with the pages added from it
+        self.sitemap = sitemap
 
     def __call__(self, data):
+        fetched = self.fetch(requests, data)
+        if fetched is not None:
+            self.write([self.parse(fetched)])
+
+    def get_validators(self, url):
+        return self.validators.get(url) or self.validators.get(correct_url(url))
+
+    def fetch(self, session, data):
         index, url = data
 
         # Skip existing URLs if specified
-        if self.skip_existing and url in self.existing_urls:
+        if self.skip_existing and (
+            url in self.validators or correct_url(url) in self.validators
+        ):
             print(
                 f"{padded_enumeration(index + 1, self.num_urls)} [{bcolors.WARNING}SKIPPED{bcolors.ENDC}] {url} (already exists)"
             )
-            return
+            return None
 
         # Add a user-agent to avoid being blocked
         headers = {
             "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/58.0.3029.110 Safari/537.3"
         }
+
+        # Only download the page again if it has changed since it was last crawled
+        validators = self.get_validators(url)
+        if validators and validators["etag"]:
+            headers["If-None-Match"] = validators["etag"]
+        if validators and validators["last_modified"]:
+            headers["If-Modified-Since"] = validators["last_modified"]
         try:
-            response = requests.get(
-                correct_url(url), headers=headers, timeout=10, verify=False
+            response = session.get(
+                correct_url(url), headers=headers, timeout=CRAWL_TIMEOUT, verify=False
             )
         except Exception as e:
             print(
                 f"{padded_enumeration(index + 1, self.num_urls)} [{bcolors.FAIL} ERROR {bcolors.ENDC}] {correct_url(url)} - {e}"
             )
-            return
+            return None
 
-        if response.ok:
-            conn = db_connections.getconn()
+        sitemap_lastmod = self.sitemap_lastmods.get(url)
+        if response.status_code == 304:
+            print(
+                f"{padded_enumeration(index + 1, self.num_urls)} [{bcolors.OKCYAN}NOT MODIFIED{bcolors.ENDC}] {correct_url(url)}"
+            )
+            if validators["sitemap_lastmod"] == sitemap_lastmod:
+                return None
+            # Only write the new sitemap lastmod so the page isn't crawled again
+            return {
+                "index": index,
+                "url": url,
+                "etag": validators["etag"],
+                "last_modified": validators["last_modified"],
+                "content_hash": validators["content_hash"],
+                "sitemap_lastmod": sitemap_lastmod,
+            }
+
+        if response.status_code in (404, 410):
+            # The page no longer exists so remove it from the results, even if it
+            # is still in the sitemap
+            return {
+                "index": index,
+                "url": url,
+                "status_code": response.status_code,
+                "gone": True,
+            }
+
+        if not response.ok:
+            print(
+                f"{padded_enumeration(index + 1, self.num_urls)} [{bcolors.FAIL} ERROR {bcolors.ENDC}] {correct_url(url)} - {response.status_code}"
+            )
+            return None
+
+        return {
+            "index": index,
+            "url": url,
+            "html": response.text,
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+            "sitemap_lastmod": sitemap_lastmod,
+        }
+
+    def parse(self, fetched):
+        if "html" not in fetched:
+            # The page was not modified or is gone so there is nothing to parse
+            return fetched
+        title, description, body = extract_page(fetched.pop("html"))
+        return fetched | {
+            "title": title,
+            "description": description,
+            "body": body,
+            "content_hash": content_hash(title, description, body),
+        }
+
+    def write(self, documents):
+        """
+        Write a batch of documents and get how many were written. If the batch
+        can't be written, each document is written on its own so only the ones
+        which fail are lost.
+        """
+
+        try:
+            self.write_batch(documents)
+            return len(documents)
+        except Exception as e:
+            if len(documents) == 1:
+                print(
+                    f"{padded_enumeration(documents[0]['index'] + 1, self.num_urls)} [{bcolors.FAIL} ERROR {bcolors.ENDC}] {correct_url(documents[0]['url'])} - {e}"
+                )
+                return 0
+        return sum(self.write([document]) for document in documents)
+
+    def write_batch(self, documents):
+        """
+        Write a batch of documents in a single transaction. Pages which are gone
+        are removed, pages which haven't changed only have their validators
+        updated and the rest are added or updated with a single upsert.
+        """
+
+        gone_documents = []
+        unchanged_documents = []
+        changed_documents = {}
+        for document in documents:
+            validators = self.get_validators(document["url"])
+            if document.get("gone"):
+                gone_documents.append(document)
+            elif validators and validators["content_hash"] == document["content_hash"]:
+                unchanged_documents.append(document)
+            else:
+                # A URL can only be upserted once in a statement so keep the last
+                changed_documents[correct_url(document["url"])] = document
+
+        conn = db_connections.getconn()
+        try:
             with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
-                soup = BeautifulSoup(response.text, "html.parser")
-                title = soup.title
-                title = title.text if title else None
-                description = soup.find(
-                    "meta", attrs={"property": "og:description"}
-                ) or soup.find("meta", attrs={"name": "description"})
-                description = (
-                    description.attrs["content"]
-                    if description and "content" in description.attrs
-                    else None
+                removed_urls = self.remove(cur, gone_documents)
+                self.write_validators(cur, unchanged_documents)
+                added_urls = self.upsert(cur, changed_documents)
+            conn.commit()
+        except Exception:
+            db_connections.putconn(conn, close=True)
+            raise
+        db_connections.putconn(conn)
+
+        for document in gone_documents:
+            if correct_url(document["url"]) in removed_urls:
+                print(
+                    f"{padded_enumeration(document['index'] + 1, self.num_urls)} [{bcolors.FAIL}REMOVED{bcolors.ENDC}] {correct_url(document['url'])} - {document['status_code']}"
+                )
+            else:
+                print(
+                    f"{padded_enumeration(document['index'] + 1, self.num_urls)} [{bcolors.FAIL} ERROR {bcolors.ENDC}] {correct_url(document['url'])} - {document['status_code']}"
+                )
+        for document in unchanged_documents:
+            print(
+                f"{padded_enumeration(document['index'] + 1, self.num_urls)} [{bcolors.OKCYAN}UNCHANGED{bcolors.ENDC}] {correct_url(document['url'])}"
+            )
+        for fixed_url, document in changed_documents.items():
+            if fixed_url in added_urls:
+                print(
+                    f"{padded_enumeration(document['index'] + 1, self.num_urls)} [{bcolors.OKGREEN} ADDED {bcolors.ENDC}] {fixed_url}"
+                )
+            else:
+                print(
+                    f"{padded_enumeration(document['index'] + 1, self.num_urls)} [{bcolors.OKBLUE}UPDATED{bcolors.ENDC}] {fixed_url} ({document['url']})"
                 )
-                body = soup.find("main") or soup.find(role="main") or soup.body
-                body = re.sub(r"\n+\s*", "\n", body.text).strip() if body else ""
-
-                fixed_url = correct_url(url)
-
-                if (
-                    url not in self.existing_urls
-                    and fixed_url not in self.existing_urls
-                ):
-                    # The URL does not exist, insert it
-                    query = sql.SQL("""INSERT INTO sitemap_urls (
-                            title,
-                            url,
-                            description,
-                            body
-                        ) VALUES (
-                            {title},
-                            {url},
-                            {description},
-                            {body}
-                        );""").format(
-                        title=sql.Literal(title),
-                        url=sql.Literal(fixed_url),
-                        description=sql.Literal(description),
-                        body=sql.Literal(body),
-                    )
-                    try:
-                        cur.execute(query)
-                        conn.commit()
-                    except Exception as e:
-                        print(
-                            f"{padded_enumeration(index + 1, self.num_urls)} [{bcolors.FAIL} ERROR {bcolors.ENDC}] {fixed_url} - {e}"
-                        )
-                        db_connections.putconn(conn, close=True)
-                        return
 
-                    print(
-                        f"{padded_enumeration(index + 1, self.num_urls)} [{bcolors.OKGREEN} ADDED {bcolors.ENDC}] {fixed_url}"
-                    )
-                    self.existing_urls.append(url)
-                    self.existing_urls.append(fixed_url)
-                else:
-                    # The URL exists, update it
-                    url_to_update = url if url in self.existing_urls else fixed_url
-
-                    query = sql.SQL("""UPDATE sitemap_urls SET
-                            url = {url},
-                            title = {title},
-                            description = {description},
-                            body = {body},
-                            date_updated = CURRENT_TIMESTAMP
-                        WHERE url = {url_to_update};""").format(
-                        url=sql.Literal(fixed_url),
-                        title=sql.Literal(title),
-                        description=sql.Literal(description),
-                        body=sql.Literal(body),
-                        url_to_update=sql.Literal(url_to_update),
-                    )
-                    try:
-                        cur.execute(query)
-                        conn.commit()
-                    except Exception as e:
-                        print(
-                            f"{padded_enumeration(index + 1, self.num_urls)} [{bcolors.FAIL} ERROR {bcolors.ENDC}] {url_to_update} - {e}"
-                        )
-                        db_connections.putconn(conn, close=True)
-                        return
+    def remove(self, cur, documents):
+        """Delete the pages of documents which are gone and get their URLs."""
+
+        if not documents:
+            return set()
 
-                    print(
-                        f"{padded_enumeration(index + 1, self.num_urls)} [{bcolors.OKBLUE}UPDATED{bcolors.ENDC}] {url_to_update} ({url})"
+        urls = {document["url"] for document in documents} | {
+            correct_url(document["url"]) for document in documents
+        }
+        cur.execute(
+            "DELETE FROM sitemap_urls WHERE url = ANY(%s) RETURNING url;",
+            (list(urls),),
+        )
+        return {correct_url(row["url"]) for row in cur.fetchall()}
+
+    def write_validators(self, cur, documents):
+        """Keep the new validators of pages without changing them."""
+
+        rows = []
+        for document in documents:
+            validators = self.get_validators(document["url"])
+            if (
+                validators["etag"],
+                validators["last_modified"],
+                validators["sitemap_lastmod"],
+            ) != (
+                document["etag"],
+                document["last_modified"],
+                document["sitemap_lastmod"],
+            ):
+                rows.append(
+                    (
+                        document["url"],
+                        correct_url(document["url"]),
+                        document["etag"],
+                        document["last_modified"],
+                        document["sitemap_lastmod"],
                     )
-            db_connections.putconn(conn)
-        else:
-            print(
-                f"{padded_enumeration(index + 1, self.num_urls)} [{bcolors.FAIL} ERROR {bcolors.ENDC}] {correct_url(url)} - {response.status_code}"
+                )
+        if not rows:
+            return
+        psycopg2.extras.execute_values(
+            cur,
+            """UPDATE sitemap_urls SET
+                etag = data.etag,
+                last_modified = data.last_modified,
+                sitemap_lastmod = data.sitemap_lastmod
+            FROM (VALUES %s) AS data (url, fixed_url, etag, last_modified, sitemap_lastmod)
+            WHERE sitemap_urls.url IN (data.url, data.fixed_url);""",
+            rows,
+            template="(%s, %s, %s::varchar, %s::varchar, %s::timestamptz)",
+            page_size=len(rows),
+        )
+
+    def upsert(self, cur, documents):
+        """
+        Add or update the pages of documents, keyed by their corrected URLs, and
+        get the URLs which were added.
+        """
+
+        if not documents:
+            return set()
+
+        # Move pages which were stored before their domain was remapped to their
+        # corrected URLs so they are updated rather than added again
+        renamed_urls = [
+            (document["url"], fixed_url)
+            for fixed_url, document in documents.items()
+            if document["url"] != fixed_url and document["url"] in self.validators
+        ]
+        if renamed_urls:
+            psycopg2.extras.execute_values(
+                cur,
+                """UPDATE sitemap_urls SET url = data.fixed_url
+                FROM (VALUES %s) AS data (url, fixed_url)
+                WHERE sitemap_urls.url = data.url
+                    AND NOT EXISTS (
+                        SELECT 1 FROM sitemap_urls AS existing
+                        WHERE existing.url = data.fixed_url
+                    );""",
+                renamed_urls,
+                page_size=len(renamed_urls),
             )
-            # TODO: Do we need to remove the URL from the database?
-        return
 
+        rows = [
+            (
+                document["title"],
+                fixed_url,
+                document["description"],
+                document["body"],
+                *url_details(fixed_url),
+                document["etag"],
+                document["last_modified"],
+                document["content_hash"],
+                document["sitemap_lastmod"],
+                self.sitemap,
+            )
+            for fixed_url, document in documents.items()
+        ]
+        # New rows have no previous version so their xmax is 0
+        results = psycopg2.extras.execute_values(
+            cur,
+            """INSERT INTO sitemap_urls (
+                title,
+                url,
+                description,
+                body,
+                url_depth,
+                is_archived,
+                is_blacklisted,
+                content_type,
+                etag,
+                last_modified,
+                content_hash,
+                sitemap_lastmod,
+                sitemap
+            ) VALUES %s
+            ON CONFLICT (url) DO UPDATE SET
+                title = EXCLUDED.title,
+                description = EXCLUDED.description,
+                body = EXCLUDED.body,
+                url_depth = EXCLUDED.url_depth,
+                is_archived = EXCLUDED.is_archived,
+                is_blacklisted = EXCLUDED.is_blacklisted,
+                content_type = EXCLUDED.content_type,
+                etag = EXCLUDED.etag,
+                last_modified = EXCLUDED.last_modified,
+                content_hash = EXCLUDED.content_hash,
+                sitemap_lastmod = EXCLUDED.sitemap_lastmod,
+                sitemap = EXCLUDED.sitemap,
+                date_updated = CURRENT_TIMESTAMP
+            RETURNING url, xmax = 0 AS added;""",
+            rows,
+            page_size=len(rows),
+            fetch=True,
+        )
+        return {result["url"] for result in results if result["added"]}
+
+
+pool_engine = None
+
+
+def set_pool_engine(engine):
+    global pool_engine
+    pool_engine = engine
+
+
+def process_page(data):
+    pool_engine(data)
+
+
+def is_new_or_changed(validators, sitemap_lastmod):
+    """
+    Check if a page from a sitemap needs crawling, which is when it is new or its
+    lastmod is later than when it was last crawled. Pages without a lastmod are
+    always crawled.
+    """
+
+    return (
+        not validators
+        or not sitemap_lastmod
+        or not validators["sitemap_lastmod"]
+        or sitemap_lastmod > validators["sitemap_lastmod"]
+    )
+
+
+def process_sitemap(sitemap, skip_existing=False, incremental=False):
+    """Crawl the pages in a sitemap and get the URLs that were in it."""
 
-def process_sitemap(sitemap, skip_existing=False):
     conn = db_connections.getconn()
     with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
-        cur.execute("SELECT url FROM sitemap_urls;")
-        existing_urls = cur.fetchall()
+        cur.execute(
+            "SELECT url, etag, last_modified, content_hash, sitemap_lastmod FROM sitemap_urls;"
+        )
+        validators = {entry["url"]: dict(entry) for entry in cur.fetchall()}
     db_connections.putconn(conn)
-    existing_urls = [url.get("url") for url in existing_urls]
 
-    urls = get_urls_from_sitemap(sitemap)
-    engine = Engine(len(urls), existing_urls, skip_existing)
-    with Pool(1) as pool:
-        try:
-            pool.map(engine, [(index, url) for index, url in enumerate(urls)], 1)
-        except Exception as e:
-            print(f"Error processing sitemap {sitemap}: {e}")
-        pool.close()
-        pool.join()
+    sitemap_lastmods = get_sitemap_entries(sitemap)
+    urls = list(sitemap_lastmods)
+    set_url_sitemap(sitemap, urls)
+
+    if CRAWL_MODE != "async":
+        # Share the validators with the pool's worker without copying them to it
+        validators = SharedUrlMap(validators)
+    engine = Engine(len(urls), skip_existing, validators, sitemap_lastmods, sitemap)
+    if incremental:
+        urls = [
+            url
+            for url in urls
+            if is_new_or_changed(engine.get_validators(url), sitemap_lastmods[url])
+        ]
+        print(f"Found {len(urls)} new or changed of {len(sitemap_lastmods)} pages")
+        engine.num_urls = len(urls)
+    if CRAWL_MODE == "async":
+        # Fetch and parse many pages at a time while writing them in batches
+        crawler = Crawler(
+            fetch=engine.fetch,
+            parse=engine.parse,
+            write=engine.write,
+            concurrency=CRAWL_CONCURRENCY,
+            host_concurrency=CRAWL_HOST_CONCURRENCY,
+            parse_concurrency=CRAWL_PARSE_CONCURRENCY,
+            queue_size=CRAWL_QUEUE_SIZE,
+            write_batch_size=CRAWL_WRITE_BATCH_SIZE,
+            flush_interval=CRAWL_FLUSH_INTERVAL,
+        )
+        stats = crawler.crawl(enumerate(urls))
+        print(
+            f"Fetched {stats.get('fetched', 0)} and wrote {stats.get('written', 0)} of {len(urls)} pages in {stats['seconds']:.1f}s"
+        )
+        print(
+            f"Wrote {stats.get('batches', 0)} batches at {stats['written_per_second']:.0f} rows per second"
+        )
+    else:
+        # Send the engine to the worker once rather than with every page
+        with Pool(1, initializer=set_pool_engine, initargs=(engine,)) as pool:
+            try:
+                pool.map(
+                    process_page, [(index, url) for index, url in enumerate(urls)], 1
+                )
+            except Exception as e:
+                print(f"Error processing sitemap {sitemap}: {e}")
+            pool.close()
+            pool.join()
+    if isinstance(validators, SharedUrlMap):
+        validators.unlink()
     print(f"Finished processing {sitemap}")
+    return {correct_url(url) for url in sitemap_lastmods}
+
+
+def set_url_sitemap(sitemap, urls):
+    """
+    Store the sitemap of the existing pages in it, including those which aren't
+    crawled again, so they are only removed when they leave that sitemap.
+    """
 
+    if not urls:
+        return
 
-def populate(skip_existing=False, drop_table=False):
+    conn = db_connections.getconn()
+    with conn.cursor() as cur:
+        cur.execute(
+            """UPDATE sitemap_urls SET sitemap = %s
+            WHERE url = ANY(%s) AND sitemap IS DISTINCT FROM %s;""",
+            (
+                sitemap,
+                list(set(urls) | {correct_url(url) for url in urls}),
+                sitemap,
+            ),
+        )
+        conn.commit()
+    db_connections.putconn(conn)
+
+
+def populate(skip_existing=False, drop_table=False, incremental=False):
     conn = db_connections.getconn()
     with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
         if drop_table:
@@ -202,13 +541,290 @@ def populate(skip_existing=False, drop_table=False):
                 date_updated timestamp DEFAULT CURRENT_TIMESTAMP,
                 UNIQUE(url)
             );""")
+
+        # Store the details derived from each URL so they can be filtered with indexes
+        cur.execute("""ALTER TABLE sitemap_urls
+            ADD COLUMN IF NOT EXISTS url_depth integer,
+            ADD COLUMN IF NOT EXISTS is_archived boolean,
+            ADD COLUMN IF NOT EXISTS is_blacklisted boolean,
+            ADD COLUMN IF NOT EXISTS content_type varchar (50);""")
+
+        # Store the validators of each page so it is only downloaded and written
+        # again if it has changed
+        cur.execute("""ALTER TABLE sitemap_urls
+            ADD COLUMN IF NOT EXISTS etag varchar (500),
+            ADD COLUMN IF NOT EXISTS last_modified varchar (100),
+            ADD COLUMN IF NOT EXISTS content_hash char (64);""")
+
+        # Store the lastmod of each page in its sitemap so only the pages which
+        # have changed since they were last crawled are crawled incrementally
+        cur.execute("""ALTER TABLE sitemap_urls
+            ADD COLUMN IF NOT EXISTS sitemap_lastmod timestamptz;""")
+
+        # Store the sitemap each page was last found in so only the pages of the
+        # sitemaps being crawled are removed when they leave them
+        cur.execute("""ALTER TABLE sitemap_urls
+            ADD COLUMN IF NOT EXISTS sitemap varchar (500);""")
+        cur.execute("""CREATE INDEX IF NOT EXISTS sitemap_urls_content_type_idx
+            ON sitemap_urls (content_type)
+            WHERE NOT is_blacklisted AND content_type IS NOT NULL;""")
+        cur.execute("""CREATE INDEX IF NOT EXISTS sitemap_urls_not_blacklisted_idx
+            ON sitemap_urls (date_updated)
+            WHERE NOT is_blacklisted;""")
+
+        # Index the last updated date which is used as the version of the index
+        cur.execute("""CREATE INDEX IF NOT EXISTS sitemap_urls_date_updated_idx
+            ON sitemap_urls (date_updated);""")
+
+        # Keep a log of popular queries which is used to warm the cache
+        cur.execute("""CREATE TABLE IF NOT EXISTS search_queries (
+                query varchar (200) NOT NULL,
+                types varchar (50) NOT NULL,
+                hits integer NOT NULL DEFAULT 0,
+                last_searched timestamp DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (query, types)
+            );""")
+
+        # Keep a generation of the index which is bumped after every change to the
+        # crawled pages and namespaces everything the app caches
+        cur.execute("""CREATE TABLE IF NOT EXISTS index_generation (
+                id boolean PRIMARY KEY DEFAULT TRUE CHECK (id),
+                generation integer NOT NULL DEFAULT 0,
+                date_updated timestamp DEFAULT CURRENT_TIMESTAMP
+            );""")
+        cur.execute("""INSERT INTO index_generation (id) VALUES (TRUE)
+            ON CONFLICT (id) DO NOTHING;""")
+
+        # Keep statistics of the index so they don't need counting for each request
+        cur.execute("""CREATE TABLE IF NOT EXISTS index_stats (
+                id boolean PRIMARY KEY DEFAULT TRUE CHECK (id),
+                total integer NOT NULL DEFAULT 0,
+                content_types jsonb NOT NULL DEFAULT '{}',
+                last_updated timestamp,
+                date_updated timestamp DEFAULT CURRENT_TIMESTAMP
+            );""")
+
+        # Keep a weighted full text search vector for the "fulltext" search engine,
+        # or drop it so the other engines don't pay for it on every write. The
+        # text search configuration it was made with is kept in its comment so it
+        # is made again if SEARCH_FULLTEXT_CONFIG changes
+        cur.execute("""SELECT col_description(attrelid, attnum) AS config
+            FROM pg_attribute
+            WHERE attrelid = 'sitemap_urls'::regclass
+                AND attname = 'search_vector'
+                AND NOT attisdropped;""")
+        search_vector = cur.fetchone()
+        if search_vector and (
+            SEARCH_ENGINE != "fulltext"
+            or search_vector["config"] != SEARCH_FULLTEXT_CONFIG
+        ):
+            cur.execute("DROP INDEX IF EXISTS sitemap_urls_search_vector_idx;")
+            cur.execute("ALTER TABLE sitemap_urls DROP COLUMN search_vector;")
+        if SEARCH_ENGINE == "fulltext":
+            # Every field uses the same configuration as the queries so their
+            # stemmed words match the words in the URL too
+            cur.execute(sql.SQL("""ALTER TABLE sitemap_urls
+                    ADD COLUMN IF NOT EXISTS search_vector tsvector
+                    GENERATED ALWAYS AS (
+                        setweight(to_tsvector({config}::regconfig, COALESCE(title, '')), 'A') ||
+                        setweight(to_tsvector({config}::regconfig, COALESCE(description, '')), 'B') ||
+                        setweight(
+                            to_tsvector({config}::regconfig, REGEXP_REPLACE(url, '[^[:alnum:]]+', ' ', 'g')),
+                            'C'
+                        ) ||
+                        setweight(to_tsvector({config}::regconfig, COALESCE(body, '')), 'D')
+                    ) STORED;""").format(config=sql.Literal(SEARCH_FULLTEXT_CONFIG)))
+            cur.execute(
+                sql.SQL(
+                    "COMMENT ON COLUMN sitemap_urls.search_vector IS {config};"
+                ).format(config=sql.Literal(SEARCH_FULLTEXT_CONFIG))
+            )
+            cur.execute("""CREATE INDEX IF NOT EXISTS sitemap_urls_search_vector_idx
+                ON sitemap_urls USING GIN (search_vector);""")
+
+        # Index every searchable field with trigrams for the "trigram" search
+        # engine, or every field but the body for the candidates of a two-phase
+        # "substring" search, and drop the trigram indexes which aren't needed
+        trigram_fields = []
+        if SEARCH_ENGINE == "trigram":
+            trigram_fields = ["title", "description", "body", "url"]
+        elif SEARCH_ENGINE == "substring" and SEARCH_CANDIDATES:
+            trigram_fields = ["title", "description", "url"]
+        if trigram_fields:
+            cur.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm;")
+        for field in ["title", "description", "body", "url"]:
+            index = sql.Identifier(f"sitemap_urls_{field}_trgm_idx")
+            if field in trigram_fields:
+                cur.execute(
+                    sql.SQL("""CREATE INDEX IF NOT EXISTS {index}
+                        ON sitemap_urls USING GIN ({field} gin_trgm_ops);""").format(
+                        index=index, field=sql.Identifier(field)
+                    )
+                )
+            else:
+                cur.execute(
+                    sql.SQL("DROP INDEX IF EXISTS {index};").format(index=index)
+                )
         conn.commit()
     db_connections.putconn(conn)
 
+    # Recalculate the details derived from existing URLs in case the config changed
+    update_url_columns()
+
     sitemaps = os.getenv("SITEMAPS", "").split(",")
 
+    sitemap_urls = set()
+    empty_sitemaps = []
     for sitemap in sitemaps:
-        process_sitemap(sitemap, skip_existing)
+        urls = process_sitemap(sitemap, skip_existing, incremental)
+        if not urls:
+            empty_sitemaps.append(sitemap)
+        sitemap_urls |= urls
+
+    if incremental:
+        if empty_sitemaps:
+            # The pages of an empty sitemap are more likely to be missing from it
+            # by mistake than to have all been removed
+            print(
+                f"{bcolors.WARNING}No URLs in {', '.join(empty_sitemaps)}, none removed{bcolors.ENDC}"
+            )
+        else:
+            remove_dropped_urls(sitemap_urls, sitemaps)
+
+
+def remove_dropped_urls(sitemap_urls, sitemaps):
+    """
+    Delete the pages of sitemaps which are no longer in any of them. Pages from
+    other sitemaps, such as those added with add_new.py, are kept.
+
+    Nothing is deleted if more than CRAWL_REMOVE_MAX_FRACTION of the pages of any
+    site would be, as a sitemap which is truncated or failed to generate is more
+    likely than that many pages being removed at once.
+    """
+
+    if not sitemap_urls:
+        print(f"{bcolors.WARNING}No URLs in the sitemaps, none removed{bcolors.ENDC}")
+        return
+
+    conn = db_connections.getconn()
+    with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
+        cur.execute(
+            "SELECT url FROM sitemap_urls WHERE sitemap = ANY(%s);", (sitemaps,)
+        )
+        site_pages = Counter(urlparse(row["url"]).netloc for row in cur.fetchall())
+        cur.execute("""CREATE TEMPORARY TABLE current_sitemap_urls (
+                url varchar (500) PRIMARY KEY
+            ) ON COMMIT DROP;""")
+        psycopg2.extras.execute_values(
+            cur,
+            "INSERT INTO current_sitemap_urls (url) VALUES %s ON CONFLICT DO NOTHING;",
+            [(url,) for url in sitemap_urls],
+            page_size=1000,
+        )
+        cur.execute(
+            """DELETE FROM sitemap_urls
+            WHERE sitemap = ANY(%s)
+                AND NOT EXISTS (
+                    SELECT 1 FROM current_sitemap_urls
+                    WHERE current_sitemap_urls.url = sitemap_urls.url
+                )
+            RETURNING url;""",
+            (sitemaps,),
+        )
+        removed_urls = [row["url"] for row in cur.fetchall()]
+        removed_site_pages = Counter(urlparse(url).netloc for url in removed_urls)
+        too_many_removed = [
+            site
+            for site, count in removed_site_pages.items()
+            if count > site_pages[site] * CRAWL_REMOVE_MAX_FRACTION
+        ]
+        if too_many_removed:
+            conn.rollback()
+        else:
+            conn.commit()
+    db_connections.putconn(conn)
+    if too_many_removed:
+        for site in too_many_removed:
+            print(
+                f"{bcolors.WARNING}{removed_site_pages[site]} of {site_pages[site]} pages of {site} are no longer in the sitemaps, none removed{bcolors.ENDC}"
+            )
+        return
+    for url in removed_urls:
+        print(f"[{bcolors.FAIL}REMOVED{bcolors.ENDC}] {url}")
+    print(f"Removed {len(removed_urls)} pages which are no longer in the sitemaps")
+
+
+def update_url_columns():
+    """
+    Recalculate the details derived from the URLs of the pages. The rows which
+    change are marked as updated so the in-memory search index reloads them.
+    """
+
+    conn = db_connections.getconn()
+    with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
+        cur.execute("SELECT id, url FROM sitemap_urls;")
+        psycopg2.extras.execute_values(
+            cur,
+            """UPDATE sitemap_urls SET
+                url_depth = data.url_depth,
+                is_archived = data.is_archived,
+                is_blacklisted = data.is_blacklisted,
+                content_type = data.content_type,
+                date_updated = CURRENT_TIMESTAMP
+            FROM (VALUES %s) AS data (id, url_depth, is_archived, is_blacklisted, content_type)
+            WHERE sitemap_urls.id = data.id
+                AND (
+                    sitemap_urls.url_depth,
+                    sitemap_urls.is_archived,
+                    sitemap_urls.is_blacklisted,
+                    sitemap_urls.content_type
+                ) IS DISTINCT FROM (
+                    data.url_depth,
+                    data.is_archived,
+                    data.is_blacklisted,
+                    data.content_type
+                );""",
+            [
+                (
+                    entry["id"],
+                    url_depth(entry["url"]),
+                    is_url_archived(entry["url"]),
+                    is_url_blacklisted(entry["url"]),
+                    url_content_type(entry["url"]),
+                )
+                for entry in cur.fetchall()
+            ],
+            template="(%s, %s::integer, %s::boolean, %s::boolean, %s::varchar)",
+            page_size=1000,
+        )
+        conn.commit()
+    db_connections.putconn(conn)
+    print("Updated the details derived from URLs")
+
+
+def bump_index_generation():
+    conn = db_connections.getconn()
+    with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
+        # Update the statistics in the same transaction so they always match the
+        # generation they are cached for
+        refresh_index_stats(cur)
+        cur.execute("""UPDATE index_generation SET
+                generation = generation + 1,
+                date_updated = CURRENT_TIMESTAMP
+            RETURNING generation;""")
+        generation = cur.fetchone()["generation"]
+        conn.commit()
+    db_connections.putconn(conn)
+
+    # Tell the app about the new generation straight away so the cached searches
+    # for the previous generation are no longer used
+    try:
+        publish_index_generation(generation)
+    except Exception as e:
+        print(
+            f"{bcolors.WARNING}Unable to share generation {generation} of the index: {e}{bcolors.ENDC}"
+        )
+    print(f"Started generation {generation} of the index")
 
 
 def fix_remapped_domains():
@@ -217,11 +833,14 @@ def fix_remapped_domains():
         cur.execute(sql.SQL("SELECT id, url FROM sitemap_urls;"))
         all_entries = cur.fetchall()
 
-        for old_domain, new_domain in DOMAIN_REMAPS.items():
+        for old_domain, new_domain in url_rules.domain_remaps.items():
+            matches_old_domain, remapped_url_sql = url_rules.remapped_domain_sql(
+                "url", old_domain
+            )
             cur.execute(
-                sql.SQL(
-                    "SELECT id, url FROM sitemap_urls WHERE url LIKE {old_domain};"
-                ).format(old_domain=sql.Literal(f"%{old_domain}%"))
+                sql.SQL("SELECT id, url FROM sitemap_urls WHERE {matches};").format(
+                    matches=matches_old_domain
+                )
             )
             matching_old_domain_entries = cur.fetchall()
             for entry in matching_old_domain_entries:
@@ -240,12 +859,12 @@ def fix_remapped_domains():
 
             query = sql.SQL("""
                 UPDATE sitemap_urls SET
-                    url = REPLACE(url, {old_domain}, {new_domain})
-                WHERE url LIKE {like_old_domain};
+                    url = {remapped_url},
+                    date_updated = CURRENT_TIMESTAMP
+                WHERE {matches};
             """).format(
-                old_domain=sql.Literal(old_domain),
-                new_domain=sql.Literal(new_domain),
-                like_old_domain=sql.Literal(f"%{old_domain}%"),
+                remapped_url=remapped_url_sql,
+                matches=matches_old_domain,
             )
             cur.execute(query)
             print(f"Updated URLs from {old_domain} to {new_domain}")
@@ -253,6 +872,8 @@ def fix_remapped_domains():
         conn.commit()
     db_connections.putconn(conn)
 
+    update_url_columns()
+
 
 if __name__ == "__main__":
     if len(sys.argv) > 1:
@@ -260,5 +881,7 @@ if __name__ == "__main__":
         process_sitemap(sitemap=sitemap)
     else:
         populate()
+    bump_index_generation()
     db_connections.closeall()
+    warm_cache()
     exit(0)
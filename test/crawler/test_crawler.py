@@ -0,0 +1,200 @@
+import threading
+import time
+import unittest
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from app.lib.crawler import Crawler
+from app.lib.pages import extract_page
+from app.lib.sitemaps import get_sitemap_entries, get_urls_from_sitemap
+
+PAGES = {f"/page-{number}/": f"""<html>
+        <head>
+            <title>Page {number}</title>
+            <meta name="description" content="Description {number}">
+        </head>
+        <body>
+            <main>
+                <h1>Page {number}</h1>
+                <p>Body {number}</p>
+            </main>
+        </body>
+    </html>""" for number in range(20)}
+
+LASTMODS = {
+    "/page-1/": "2024-05-01",
+    "/page-2/": "2024-05-01T10:30:00+01:00",
+    "/page-3/": "yesterday",
+}
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    active = 0
+    most_active = 0
+    lock = threading.Lock()
+
+    def do_GET(self):
+        if self.path == "/sitemap.xml":
+            body = """<?xml version="1.0" encoding="UTF-8"?>
+                <urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">{}</urlset>
+            """.format(
+                "".join(
+                    f"<url><loc>http://{self.headers['Host']}{path}</loc>"
+                    + (
+                        f"<lastmod>{LASTMODS[path]}</lastmod>"
+                        if path in LASTMODS
+                        else ""
+                    )
+                    + "</url>"
+                    for path in list(PAGES) + ["/missing/"]
+                )
+            )
+            content_type = "application/xml"
+        elif self.path in PAGES:
+            with StubHandler.lock:
+                StubHandler.active += 1
+                StubHandler.most_active = max(
+                    StubHandler.most_active, StubHandler.active
+                )
+            time.sleep(0.02)
+            with StubHandler.lock:
+                StubHandler.active -= 1
+            body = PAGES[self.path]
+            content_type = "text/html"
+        else:
+            self.send_response(404)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        encoded = body.encode()
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(encoded)))
+        self.end_headers()
+        self.wfile.write(encoded)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class CrawlerTestCase(unittest.TestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        self.domain = f"http://127.0.0.1:{self.server.server_port}"
+        StubHandler.most_active = 0
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def fetch(self, session, item):
+        index, url = item
+        response = session.get(url, timeout=5)
+        return (index, url, response.text) if response.ok else None
+
+    def parse(self, fetched):
+        index, url, html = fetched
+        return (url, *extract_page(html))
+
+    def test_crawl(self):
+        urls = get_urls_from_sitemap(f"{self.domain}/sitemap.xml")
+        self.assertEqual(len(urls), 21)
+
+        written = []
+        batch_sizes = []
+
+        def write(documents):
+            batch_sizes.append(len(documents))
+            written.extend(documents)
+
+        crawler = Crawler(
+            fetch=self.fetch,
+            parse=self.parse,
+            write=write,
+            concurrency=8,
+            host_concurrency=3,
+            queue_size=2,
+            write_batch_size=6,
+        )
+        stats = crawler.crawl(enumerate(urls))
+
+        self.assertEqual(stats["fetched"], 20)
+        self.assertEqual(stats["written"], 20)
+        self.assertEqual(stats["batches"], len(batch_sizes))
+        self.assertLessEqual(max(batch_sizes), 6)
+        self.assertGreater(stats["written_per_second"], 0)
+        self.assertLessEqual(StubHandler.most_active, 3)
+        self.assertGreater(StubHandler.most_active, 1)
+        self.assertIn(
+            (
+                f"{self.domain}/page-7/",
+                "Page 7",
+                "Description 7",
+                "Page 7\nBody 7",
+            ),
+            written,
+        )
+        self.assertNotIn(f"{self.domain}/missing/", [url for url, *_ in written])
+
+    def test_sitemap_lastmods(self):
+        entries = get_sitemap_entries(f"{self.domain}/sitemap.xml")
+
+        self.assertEqual(len(entries), 21)
+        self.assertEqual(
+            entries[f"{self.domain}/page-1/"],
+            datetime(2024, 5, 1, tzinfo=timezone.utc),
+        )
+        self.assertEqual(
+            entries[f"{self.domain}/page-2/"],
+            datetime(2024, 5, 1, 10, 30, tzinfo=timezone(timedelta(hours=1))),
+        )
+        self.assertIsNone(entries[f"{self.domain}/page-3/"])
+        self.assertIsNone(entries[f"{self.domain}/page-4/"])
+
+    def test_crawl_flush_interval(self):
+        def fetch(session, item):
+            # Hold back the last page so the others are written before it
+            if item[0] == 3:
+                time.sleep(0.3)
+            return self.fetch(session, item)
+
+        batch_sizes = []
+        crawler = Crawler(
+            fetch=fetch,
+            parse=self.parse,
+            write=lambda documents: batch_sizes.append(len(documents)),
+            flush_interval=0.1,
+        )
+        stats = crawler.crawl(
+            [(index, f"{self.domain}/page-{index}/") for index in range(4)]
+        )
+
+        self.assertEqual(stats["written"], 4)
+        self.assertEqual(batch_sizes, [3, 1])
+
+    def test_crawl_errors(self):
+        def write(documents):
+            raise ValueError("Unable to write")
+
+        crawler = Crawler(fetch=self.fetch, parse=self.parse, write=write)
+        stats = crawler.crawl([(0, f"{self.domain}/page-1/")])
+
+        self.assertEqual(stats["parsed"], 1)
+        self.assertEqual(stats["errors"], 1)
+        self.assertNotIn("written", stats)
+
+    def test_crawl_partly_written(self):
+        def write(documents):
+            # Only write the pages with even numbers
+            return sum(1 for url, *_ in documents if int(url[-2]) % 2 == 0)
+
+        crawler = Crawler(fetch=self.fetch, parse=self.parse, write=write)
+        stats = crawler.crawl(
+            [(index, f"{self.domain}/page-{index}/") for index in range(4)]
+        )
+
+        self.assertEqual(stats["written"], 2)
+        self.assertEqual(stats["errors"], 2)
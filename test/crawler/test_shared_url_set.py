@@ -0,0 +1,62 @@
+import pickle
+import unittest
+from multiprocessing import Pool
+
+from app.lib.shared_url_set import SharedUrlMap, SharedUrlSet
+
+URLS = [f"https://www.nationalarchives.gov.uk/page-{number}/" for number in range(1000)]
+
+
+def contains(args):
+    url_set, url = args
+    return url in url_set
+
+
+def get(args):
+    url_map, url = args
+    return url_map.get(url)
+
+
+class SharedUrlSetTestCase(unittest.TestCase):
+    def test_contains(self):
+        with SharedUrlSet(URLS + URLS[:10]) as url_set:
+            self.assertEqual(len(url_set), 1000)
+            self.assertIn(URLS[0], url_set)
+            self.assertIn(URLS[-1], url_set)
+            self.assertNotIn("https://www.nationalarchives.gov.uk/", url_set)
+
+    def test_empty(self):
+        with SharedUrlSet() as url_set:
+            self.assertEqual(len(url_set), 0)
+            self.assertNotIn(URLS[0], url_set)
+
+    def test_shared_between_processes(self):
+        with SharedUrlSet(URLS) as url_set:
+            # Only the name of the shared memory is sent to other processes
+            self.assertLess(len(pickle.dumps(url_set)), 200)
+            with Pool(2) as pool:
+                self.assertEqual(
+                    pool.map(contains, [(url_set, URLS[500]), (url_set, "/other/")]),
+                    [True, False],
+                )
+
+    def test_map(self):
+        with SharedUrlMap(
+            {url: {"etag": f'"{index}"'} for index, url in enumerate(URLS)}
+        ) as url_map:
+            self.assertEqual(len(url_map), 1000)
+            self.assertEqual(url_map[URLS[7]], {"etag": '"7"'})
+            self.assertIn(URLS[7], url_map)
+            self.assertIsNone(url_map.get("/other/"))
+            with self.assertRaises(KeyError):
+                url_map["/other/"]
+            with Pool(2) as pool:
+                self.assertEqual(
+                    pool.map(get, [(url_map, URLS[999]), (url_map, "/other/")]),
+                    [{"etag": '"999"'}, None],
+                )
+
+    def test_empty_map(self):
+        with SharedUrlMap() as url_map:
+            self.assertEqual(len(url_map), 0)
+            self.assertIsNone(url_map.get(URLS[0]))
@@ -1,6 +1,8 @@
+import os
 import unittest
 
 from app import create_app
+from app.lib.metrics import metrics
 
 
 class MainBlueprintTestCase(unittest.TestCase):
@@ -23,3 +25,35 @@ class MainBlueprintTestCase(unittest.TestCase):
         rv = self.client.get("/healthcheck/version/")
         self.assertEqual(rv.status_code, 200)
         self.assertIn(self.app.config.get("BUILD_VERSION", ""), rv.text)
+
+    def test_healthcheck_db(self):
+        rv = self.client.get("/healthcheck/db/")
+        self.assertEqual(rv.status_code, 200)
+        self.assertEqual(
+            rv.json["max_connections"], self.app.config["DB_POOL_MAX_CONNECTIONS"]
+        )
+        self.assertEqual(rv.json["in_use"], 0)
+
+    def test_healthcheck_cache(self):
+        rv = self.client.get("/healthcheck/cache/")
+        self.assertEqual(rv.status_code, 200)
+        self.assertEqual(rv.json["type"], "SimpleCache")
+        self.assertIn("counters", rv.json)
+        self.assertEqual(rv.json["result_set_cache"]["entries"], 0)
+
+    def test_healthcheck_search(self):
+        rv = self.client.get("/healthcheck/search/")
+        self.assertEqual(rv.status_code, 200)
+        self.assertEqual(rv.json["time_budget"], self.app.config["SEARCH_TIME_BUDGET"])
+        self.assertIn("counters", rv.json)
+
+    def test_healthcheck_metrics(self):
+        metrics.observe("search_request_seconds", 0.2, {"query_parts": "1"})
+        rv = self.client.get("/healthcheck/metrics/")
+        self.assertEqual(rv.status_code, 200)
+        self.assertEqual(rv.mimetype, "text/plain")
+        self.assertIn(
+            f'ds_sitemap_search_search_request_seconds_bucket{{worker="{os.getpid()}",'
+            'query_parts="1",le="0.25"} 1',
+            rv.text,
+        )
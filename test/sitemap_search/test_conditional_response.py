@@ -0,0 +1,105 @@
+import unittest
+from datetime import datetime
+from unittest.mock import patch
+
+from flask import g
+
+from app import create_app
+from app.lib.conditional_response import conditional_response
+
+
+class ConditionalResponseTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app("config.Test")
+        self.calls = 0
+
+        @self.app.route("/conditional/")
+        @conditional_response
+        def view():
+            self.calls += 1
+            g.partial_results = self.partial_results
+            return "results"
+
+        self.partial_results = False
+        self.client = self.app.test_client()
+        self.version = "generation-1"
+        self.last_updated = datetime(2024, 1, 2, 3, 4, 5, 678)
+        for name, value in [
+            ("get_index_version", lambda: self.version),
+            ("get_index_last_updated", lambda: self.last_updated),
+        ]:
+            patcher = patch(f"app.lib.conditional_response.{name}", value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_validators(self):
+        rv = self.client.get("/conditional/")
+        self.assertEqual(rv.status_code, 200)
+        self.assertEqual(rv.text, "results")
+        self.assertIsNotNone(rv.headers.get("ETag"))
+        self.assertEqual(rv.headers["Last-Modified"], "Tue, 02 Jan 2024 03:04:05 GMT")
+        self.assertEqual(
+            rv.headers["Cache-Control"], self.app.config["SEARCH_CACHE_CONTROL"]
+        )
+
+    def test_if_none_match(self):
+        etag = self.client.get("/conditional/").headers["ETag"]
+        rv = self.client.get("/conditional/", headers={"If-None-Match": etag})
+        self.assertEqual(rv.status_code, 304)
+        self.assertEqual(rv.headers["ETag"], etag)
+        self.assertEqual(self.calls, 1)
+
+        rv = self.client.get("/conditional/", headers={"If-None-Match": '"other"'})
+        self.assertEqual(rv.status_code, 200)
+        self.assertEqual(self.calls, 2)
+
+    def test_if_modified_since(self):
+        rv = self.client.get(
+            "/conditional/",
+            headers={"If-Modified-Since": "Tue, 02 Jan 2024 03:04:05 GMT"},
+        )
+        self.assertEqual(rv.status_code, 304)
+        self.assertEqual(self.calls, 0)
+
+        rv = self.client.get(
+            "/conditional/",
+            headers={"If-Modified-Since": "Tue, 02 Jan 2024 03:04:04 GMT"},
+        )
+        self.assertEqual(rv.status_code, 200)
+        self.assertEqual(self.calls, 1)
+
+    def test_if_none_match_takes_precedence(self):
+        rv = self.client.get(
+            "/conditional/",
+            headers={
+                "If-None-Match": '"other"',
+                "If-Modified-Since": "Tue, 02 Jan 2024 03:04:05 GMT",
+            },
+        )
+        self.assertEqual(rv.status_code, 200)
+
+    def test_etag_changes(self):
+        etag = self.client.get("/conditional/").headers["ETag"]
+        self.assertEqual(self.client.get("/conditional/").headers["ETag"], etag)
+        self.assertNotEqual(
+            self.client.get("/conditional/?q=census").headers["ETag"], etag
+        )
+
+        self.version = "generation-2"
+        new_version_etag = self.client.get("/conditional/").headers["ETag"]
+        self.assertNotEqual(new_version_etag, etag)
+        rv = self.client.get("/conditional/", headers={"If-None-Match": etag})
+        self.assertEqual(rv.status_code, 200)
+
+        self.app.config["BUILD_VERSION"] = "new-build"
+        self.assertNotIn(
+            self.client.get("/conditional/").headers["ETag"], [etag, new_version_etag]
+        )
+
+    def test_partial_results(self):
+        self.partial_results = True
+        rv = self.client.get("/conditional/")
+        self.assertEqual(rv.status_code, 200)
+        self.assertEqual(rv.headers["Cache-Control"], "no-store")
+        self.assertIsNone(rv.headers.get("ETag"))
+        self.assertIsNone(rv.headers.get("Last-Modified"))
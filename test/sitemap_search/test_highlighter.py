@@ -0,0 +1,74 @@
+import unittest
+
+from app.lib.highlighter import Highlighter
+
+
+class HighlighterTestCase(unittest.TestCase):
+    def test_mark(self):
+        highlighter = Highlighter(["census", "census records"])
+        self.assertEqual(
+            highlighter.mark("Census records and the census"),
+            "<mark>Census records</mark> and the <mark>census</mark>",
+        )
+
+    def test_mark_without_query_parts(self):
+        highlighter = Highlighter([])
+        self.assertEqual(highlighter.mark("Tom & Jerry"), "Tom & Jerry")
+        self.assertEqual(
+            highlighter.mark("Tom & Jerry", escape_html=True), "Tom &amp; Jerry"
+        )
+
+    def test_mark_escape_html(self):
+        highlighter = Highlighter(["<b>"])
+        self.assertEqual(
+            highlighter.mark("A <b> tag", escape_html=True),
+            "A <mark>&lt;b&gt;</mark> tag",
+        )
+
+    def test_mark_entities(self):
+        text = 'Tom & Jerry\'s "said" <in> 1939'
+        for query_part, expected in [
+            ("amp", "Tom &amp; Jerry&#39;s &#34;said&#34; &lt;in&gt; 1939"),
+            ("quot", "Tom &amp; Jerry&#39;s &#34;said&#34; &lt;in&gt; 1939"),
+            ("lt", "Tom &amp; Jerry&#39;s &#34;said&#34; &lt;in&gt; 1939"),
+            ("gt", "Tom &amp; Jerry&#39;s &#34;said&#34; &lt;in&gt; 1939"),
+            (
+                "39",
+                "Tom &amp; Jerry&#39;s &#34;said&#34; &lt;in&gt; 19<mark>39</mark>",
+            ),
+            (
+                "&",
+                "Tom <mark>&amp;</mark> Jerry&#39;s &#34;said&#34; &lt;in&gt; 1939",
+            ),
+        ]:
+            with self.subTest(query_part=query_part):
+                self.assertEqual(
+                    Highlighter([query_part]).mark(text, escape_html=True), expected
+                )
+
+    def test_mark_url_encoded(self):
+        highlighter = Highlighter(["census records"])
+        self.assertEqual(
+            highlighter.mark("/search/?q=census+records&type=all", escape_html=True),
+            "/search/?q=<mark>census+records</mark>&amp;type=all",
+        )
+
+    def test_snippet_short_text(self):
+        highlighter = Highlighter(["census"])
+        self.assertEqual(
+            highlighter.snippet("  The   census\nrecords ", 100), "The census records"
+        )
+
+    def test_snippet_window(self):
+        highlighter = Highlighter(["census", "wills"])
+        text = " ".join(["filler"] * 50 + ["census", "and", "wills"] + ["filler"] * 50)
+        snippet = highlighter.snippet(text, 60)
+        self.assertTrue(snippet.startswith("… "))
+        self.assertTrue(snippet.endswith(" …"))
+        self.assertIn("census and wills", snippet)
+        self.assertLessEqual(len(snippet), 60 + len("…  …"))
+
+    def test_snippet_without_matches(self):
+        highlighter = Highlighter(["nothing"])
+        text = " ".join(["word"] * 50)
+        self.assertEqual(highlighter.snippet(text, 22), "word word word word …")
@@ -0,0 +1,159 @@
+import os
+import unittest
+from unittest.mock import patch
+
+from app import create_app
+from app.lib.memory_index import Document, MemoryIndex
+
+ROWS = [
+    {
+        "id": 1,
+        "title": "Census records",
+        "url": "https://www.nationalarchives.gov.uk/census/",
+        "description": "Find census records from 1841 to 1921",
+        "body": "The census was taken every ten years. Census records are online.",
+        "url_depth": 1,
+        "is_archived": False,
+        "content_type": None,
+    },
+    {
+        "id": 2,
+        "title": "Census records",
+        "url": "https://www.nationalarchives.gov.uk/help-with-your-research/"
+        "research-guides/census-records/",
+        "description": None,
+        "body": "How to search the census records of England and Wales.",
+        "url_depth": 3,
+        "is_archived": False,
+        "content_type": "research-guides",
+    },
+    {
+        "id": 3,
+        "title": "CENSUS İSTANBUL",
+        "url": "https://blog.nationalarchives.gov.uk/census-day/",
+        "description": "Census day on the blog",
+        "body": None,
+        "url_depth": 1,
+        "is_archived": True,
+        "content_type": "archived-blog-posts",
+    },
+    {
+        "id": 4,
+        "title": "Wills",
+        "url": "https://www.nationalarchives.gov.uk/wills/",
+        "description": "Find a will",
+        "body": "Wills and probate records.",
+        "url_depth": 1,
+        "is_archived": False,
+        "content_type": None,
+    },
+]
+
+
+def sql_relevance(config, row, all_query_parts, quoted_query_parts):
+    """
+    Score a row in Python with the same expression substring_search_sub_query
+    builds in SQL.
+    """
+
+    def instances(field, query_part):
+        # CHAR_LENGTH(field) - CHAR_LENGTH(REPLACE(LOWER(field), query_part, ''))
+        if row[field] is None:
+            return 0
+        return len(row[field]) - len(row[field].lower().replace(query_part, ""))
+
+    score = 0
+    for query_part in all_query_parts:
+        quote_weight = (
+            config["RELEVANCE_QUOTE_MATCH_MULTIPLIER"]
+            if query_part in quoted_query_parts
+            else 1
+        )
+        score += (
+            instances("title", query_part) * config["RELEVANCE_TITLE_MATCH_WEIGHT"]
+            + instances("description", query_part)
+            * config["RELEVANCE_DESCRIPTION_MATCH_WEIGHT"]
+            + instances("body", query_part) * config["RELEVANCE_BODY_MATCH_WEIGHT"]
+            + instances("url", query_part)
+            * config["RELEVANCE_URL_MATCH_WEIGHT"]
+            * quote_weight
+        )
+    return (score / (row["url_depth"] + 1)) * (
+        config["RELEVANCE_ARCHIVED_WEIGHT"] if row["is_archived"] else 1
+    )
+
+
+class MemoryIndexTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app("config.Test")
+        self.memory_index = MemoryIndex()
+        for row in ROWS:
+            self.memory_index._add(Document(row))
+        self.memory_index._build_vocabulary()
+        self.memory_index._pid = os.getpid()
+        self.memory_index._version = "generation-1"
+        patcher = patch(
+            "app.lib.memory_index.get_index_version", return_value="generation-1"
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def rank(self, all_query_parts, quoted_query_parts=(), requested_types="all"):
+        with self.app.app_context():
+            return self.memory_index.rank(
+                all_query_parts, list(quoted_query_parts), requested_types
+            )
+
+    def assertSameRelevance(self, all_query_parts, quoted_query_parts=()):
+        expected = {
+            row["id"]: sql_relevance(
+                self.app.config, row, all_query_parts, quoted_query_parts
+            )
+            for row in ROWS
+        }
+        ranked = self.rank(all_query_parts, quoted_query_parts)["ranked"]
+        self.assertEqual(
+            {id: relevance for relevance, _, id in ranked},
+            {id: relevance for id, relevance in expected.items() if relevance > 0},
+        )
+
+    def test_relevance(self):
+        self.assertSameRelevance(["census"])
+        self.assertSameRelevance(["census", "records"])
+        self.assertSameRelevance(["cens"])
+
+    def test_quoted_relevance(self):
+        self.assertSameRelevance(["census records"], ["census records"])
+        self.assertSameRelevance(["census", "census day"], ["census day"])
+
+    def test_quote_weight(self):
+        # The quote multiplier only applies to the URL score of a query part, as
+        # it does in substring_search_sub_query: (1500 + 300 + 12 + 30 * 1000) / 2
+        ranked = self.rank(["census"], ["census"])["ranked"]
+        self.assertEqual(ranked[0][2], 1)
+        self.assertEqual(ranked[0][0], 15906)
+        # "census records" isn't in the URL, so quoting it changes nothing
+        self.assertEqual(
+            self.rank(["census records"], ["census records"])["ranked"],
+            self.rank(["census records"])["ranked"],
+        )
+
+    def test_lowercasing_changes_length(self):
+        # "İ" is one character which becomes two when lowercased, so the SQL
+        # engines count an extra character for every instance
+        self.assertSameRelevance(["istanbul"])
+
+    def test_order(self):
+        ranked = self.rank(["census"])["ranked"]
+        self.assertEqual([id for _, _, id in ranked], [1, 2, 3])
+        self.assertEqual(self.rank(["census"])["total_results"], 3)
+
+    def test_requested_types(self):
+        ranked = self.rank(["census"], requested_types="research-guides")["ranked"]
+        self.assertEqual([id for _, _, id in ranked], [2])
+
+    def test_no_query_parts(self):
+        self.assertEqual(self.rank([]), {"total_results": 0, "ranked": []})
+
+    def test_no_results(self):
+        self.assertEqual(self.rank(["nothing"])["ranked"], [])
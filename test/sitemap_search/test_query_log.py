@@ -0,0 +1,96 @@
+import threading
+import unittest
+from unittest.mock import patch
+
+from app import create_app
+from app.lib.query_log import QueryLog, normalize_query
+
+
+class NormalizeQueryTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app("config.Test")
+
+    def normalize_query(self, query):
+        with self.app.app_context():
+            return normalize_query(query)
+
+    def test_normalize(self):
+        self.assertEqual(
+            self.normalize_query('Records  "census records" WILLS'),
+            '"census records" records wills',
+        )
+        self.assertEqual(
+            self.normalize_query("wills records"), self.normalize_query("records wills")
+        )
+        self.assertEqual(self.normalize_query("census 1921"), "1921 census")
+
+    def test_personal_data(self):
+        for query in [
+            "someone@example.com",
+            "email me at someone at example.com@",
+            "07700 900123 07700900123",
+            "123456",
+            "account 12345678",
+        ]:
+            with self.subTest(query=query):
+                self.assertIsNone(self.normalize_query(query))
+
+    def test_not_logged(self):
+        self.assertIsNone(self.normalize_query(""))
+        self.assertIsNone(self.normalize_query('""'))
+        self.assertIsNone(
+            self.normalize_query(" ".join(f"word{number}" for number in range(50)))
+        )
+
+
+class QueryLogTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app("config.Test")
+        self.query_log = QueryLog()
+        self.query_log.sample_rate = 0.5
+        self.query_log.flush_interval = 3600
+        self.flushes = []
+        patcher = patch.object(
+            QueryLog,
+            "flush",
+            lambda query_log: self.flushes.append(threading.current_thread()),
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def record(self, query, requested_types="all", sample=0.1):
+        with self.app.app_context(), patch(
+            "app.lib.query_log.random.random", return_value=sample
+        ):
+            self.query_log.record(query, requested_types)
+
+    def test_sampling(self):
+        self.record("census", sample=0.4)
+        self.record("census", sample=0.6)
+        self.record("Census", sample=0.1)
+        self.assertEqual(dict(self.query_log._counts), {("census", "all"): 2})
+
+        self.query_log.sample_rate = 0
+        self.record("census", sample=0)
+        self.assertEqual(dict(self.query_log._counts), {("census", "all"): 2})
+
+    def test_requested_types(self):
+        self.record("census", "research-guides")
+        self.record("census", "unknown")
+        self.assertEqual(
+            dict(self.query_log._counts), {("census", "research-guides"): 1}
+        )
+
+    def test_personal_data_not_recorded(self):
+        self.record("someone@example.com")
+        self.assertEqual(dict(self.query_log._counts), {})
+
+    def test_flush_in_background(self):
+        self.record("census")
+        self.assertEqual(self.flushes, [])
+
+        self.query_log.flush_interval = 0
+        self.record("census")
+        self.query_log._flushing.join()
+        self.assertEqual(len(self.flushes), 1)
+        self.assertIsNot(self.flushes[0], threading.current_thread())
@@ -0,0 +1,68 @@
+import unittest
+
+from app.lib.result_set_cache import ResultSetCache
+
+
+def ranked(rows):
+    return [(float(rows - index), f"Title {index}", index) for index in range(rows)]
+
+
+class ResultSetCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.cache = ResultSetCache()
+        self.cache.max_entries = 3
+        self.cache.max_rows = 10
+
+    def test_get_and_set(self):
+        self.assertIsNone(self.cache.get("a"))
+        self.cache.set("a", 20, ranked(2))
+        self.assertEqual(
+            self.cache.get("a"), {"total_results": 20, "ranked": ranked(2)}
+        )
+        self.assertEqual(self.cache.status(), {"entries": 1, "rows": 2})
+
+    def test_evict_least_recently_used(self):
+        self.cache.set("a", 1, ranked(1))
+        self.cache.set("b", 1, ranked(1))
+        self.cache.set("c", 1, ranked(1))
+        # Getting an entry makes it the most recently used
+        self.cache.get("a")
+        self.cache.set("d", 1, ranked(1))
+        self.assertIsNone(self.cache.get("b"))
+        for key in ["a", "c", "d"]:
+            self.assertIsNotNone(self.cache.get(key))
+        self.assertEqual(self.cache.status(), {"entries": 3, "rows": 3})
+
+    def test_evict_rows(self):
+        self.cache.set("a", 4, ranked(4))
+        self.cache.set("b", 4, ranked(4))
+        self.cache.set("c", 4, ranked(4))
+        # The oldest entries are evicted until the rows are within the budget
+        self.assertIsNone(self.cache.get("a"))
+        self.assertEqual(self.cache.status(), {"entries": 2, "rows": 8})
+        self.cache.set("d", 9, ranked(9))
+        self.assertIsNone(self.cache.get("b"))
+        self.assertIsNone(self.cache.get("c"))
+        self.assertEqual(self.cache.status(), {"entries": 1, "rows": 9})
+
+    def test_replace(self):
+        self.cache.set("a", 4, ranked(4))
+        self.cache.set("a", 6, ranked(6))
+        self.assertEqual(self.cache.get("a")["total_results"], 6)
+        self.assertEqual(self.cache.status(), {"entries": 1, "rows": 6})
+
+    def test_too_many_rows(self):
+        self.cache.set("a", 11, ranked(11))
+        self.assertIsNone(self.cache.get("a"))
+        self.assertEqual(self.cache.status(), {"entries": 0, "rows": 0})
+
+    def test_disabled(self):
+        self.cache.max_entries = 0
+        self.cache.set("a", 1, ranked(1))
+        self.assertIsNone(self.cache.get("a"))
+
+    def test_clear(self):
+        self.cache.set("a", 1, ranked(1))
+        self.cache.clear()
+        self.assertIsNone(self.cache.get("a"))
+        self.assertEqual(self.cache.status(), {"entries": 0, "rows": 0})
@@ -0,0 +1,128 @@
+import unittest
+from unittest.mock import patch
+
+from app import create_app
+from app.lib.cache import cache
+from app.lib.search import get_results, search, search_cache_key
+
+
+class GetResultsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app("config.Test")
+        self.app.config["SEARCH_ENGINE"] = "memory"
+
+    def test_memory_results_keep_relevance(self):
+        ranked = [(30.0, "A", 1), (20.0, "B", 2), (10.0, "C", 3)]
+        rows = [
+            {"id": 1, "title": "A", "url": "/a/", "description": None},
+            # Page 2 was removed after the results were ranked
+            {"id": 3, "title": "C", "url": "/c/", "description": None},
+        ]
+        with self.app.app_context(), patch(
+            "app.lib.search.memory_index.get_results", return_value=rows
+        ):
+            results = get_results(ranked)
+        self.assertEqual(
+            [(result["id"], result["relevance"]) for result in results],
+            [(1, 30.0), (3, 10.0)],
+        )
+
+    def test_no_results(self):
+        with self.app.app_context():
+            self.assertEqual(get_results([]), [])
+
+
+class SearchCacheKeyTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app("config.Test")
+        patcher = patch("app.lib.search.get_index_version", return_value="generation-1")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def key(self, all_query_parts, quoted_query_parts=(), requested_types="all"):
+        with self.app.app_context():
+            return search_cache_key(
+                all_query_parts, list(quoted_query_parts), requested_types
+            )
+
+    def test_equivalent_queries(self):
+        self.assertEqual(
+            self.key(["census", "records"]), self.key(["records", "census", "census"])
+        )
+        self.assertEqual(
+            self.key(["census records", "wills"], ["census records"]),
+            self.key(["wills", "census records"], ["census records"]),
+        )
+
+    def test_different_queries(self):
+        self.assertNotEqual(
+            self.key(["a b", "c d"], ["a b", "c d"]),
+            self.key(["a", "b c", "d"], ["a", "b c", "d"]),
+        )
+        self.assertNotEqual(
+            self.key(["census records"]), self.key(["census", "records"])
+        )
+        self.assertNotEqual(
+            self.key(["census", "records"]), self.key(["census", "records"], ["census"])
+        )
+        self.assertNotEqual(
+            self.key(["census"]),
+            self.key(["census"], requested_types="research-guides"),
+        )
+
+
+class SearchPagesTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app("config.Test")
+        self.app.config["SEARCH_SNIPPET_LENGTH"] = 0
+        self.ranked = [(float(100 - id), f"Title {id}", id) for id in range(25)]
+        self.ranked_results = {"total_results": 40, "ranked": self.ranked}
+        self.continued = [(float(100 - id), f"Title {id}", id) for id in range(25, 40)]
+        self.continue_calls = []
+
+        def continue_ranked_results(*args):
+            self.continue_calls.append(args[-1])
+            return args[-2]["ranked"] + self.continued, False
+
+        for name, value in [
+            ("get_index_version", lambda: "generation-1"),
+            ("get_ranked_results", lambda *args: self.ranked_results),
+            ("continue_ranked_results", continue_ranked_results),
+            (
+                "get_results",
+                lambda ranked, body_length=0: [{"id": id} for _, _, id in ranked],
+            ),
+        ]:
+            patcher = patch(f"app.lib.search.{name}", value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def search(self, page):
+        with self.app.app_context():
+            cache.clear()
+            results, total_results, partial = search(
+                ["census"], [], "all", page=page, results_per_page=10
+            )
+        return [result["id"] for result in results], total_results, partial
+
+    def test_page_within_ranked_results(self):
+        self.assertEqual(self.search(2), (list(range(10, 20)), 40, False))
+        self.assertEqual(self.continue_calls, [])
+
+    def test_page_beyond_ranked_results(self):
+        # The third page needs rows 20 to 29 but only 25 have been ranked
+        self.assertEqual(self.search(3), (list(range(20, 30)), 40, False))
+        self.assertEqual(self.continue_calls, [30])
+
+    def test_last_page(self):
+        self.ranked_results = {"total_results": 25, "ranked": self.ranked}
+        self.assertEqual(self.search(3), (list(range(20, 25)), 25, False))
+        self.assertEqual(self.continue_calls, [])
+
+    def test_page_past_the_last(self):
+        self.assertEqual(self.search(5), ([], 40, False))
+        self.assertEqual(self.continue_calls, [])
+
+    def test_partial_results(self):
+        self.ranked_results = self.ranked_results | {"partial": True}
+        self.assertEqual(self.search(1), (list(range(10)), 40, True))
@@ -0,0 +1,120 @@
+import unittest
+from unittest.mock import patch
+
+from app import create_app
+
+
+class SitemapSearchBlueprintTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app("config.Test")
+        self.client = self.app.test_client()
+        self.domain = "http://localhost"
+
+    def test_suggest_short_query(self):
+        rv = self.client.get("/search/suggest/?q=a")
+        self.assertEqual(rv.status_code, 200)
+        self.assertEqual(rv.json["query"], "a")
+        self.assertEqual(rv.json["suggestions"], [])
+        self.assertIn("max-age", rv.headers["Cache-Control"])
+
+
+class SitemapSearchApiTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app("config.Test")
+        self.client = self.app.test_client()
+        self.results = [
+            {
+                "id": 1,
+                "title": "Census records",
+                "url": "http://website.live.local/help-with-your-research/"
+                "research-guides/census-records/",
+                "description": "Find census records",
+                "relevance": 100,
+            }
+        ]
+        self.search_response = (self.results, 13, False)
+        self.version = "generation-1"
+        for name, value in [
+            ("search", lambda **kwargs: self.search_response),
+            ("get_facets", lambda *args: {"research-guides": 13}),
+            ("get_index_version", lambda: self.version),
+        ]:
+            patcher = patch(f"app.sitemap_search.routes.{name}", value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_api(self):
+        rv = self.client.get('/search/api/?q="Census records" wills')
+        self.assertEqual(rv.status_code, 200)
+        self.assertEqual(rv.mimetype, "application/json")
+        self.assertCountEqual(rv.json["query_parts"], ["census records", "wills"])
+        self.assertEqual(
+            rv.json | {"query_parts": None},
+            {
+                "query": '"Census records" wills',
+                "query_parts": None,
+                "query_parts_exceeded": False,
+                "types": "all",
+                "page": 1,
+                "pages": 2,
+                "total": 13,
+                "partial": False,
+                "results": [
+                    {
+                        "id": 1,
+                        "title": "Census records",
+                        "url": "https://www.nationalarchives.gov.uk/"
+                        "help-with-your-research/research-guides/census-records/",
+                        "description": "Find census records",
+                        "snippet": None,
+                        "type": "Research guide",
+                        "relevance": 100.0,
+                    }
+                ],
+                "facets": {"research-guides": 13},
+            },
+        )
+        self.assertIsNotNone(rv.headers.get("ETag"))
+        self.assertIn("public", rv.headers["Cache-Control"])
+        self.assertIn("max-age", rv.headers["Cache-Control"])
+
+    def test_api_without_query(self):
+        rv = self.client.get("/search/api/")
+        self.assertEqual(rv.status_code, 200)
+        self.assertEqual(rv.json["results"], [])
+        self.assertEqual(rv.json["total"], 0)
+        self.assertEqual(rv.json["facets"], {})
+
+    def test_api_not_modified(self):
+        etag = self.client.get("/search/api/?q=census").headers["ETag"]
+        rv = self.client.get("/search/api/?q=census", headers={"If-None-Match": etag})
+        self.assertEqual(rv.status_code, 304)
+        self.assertEqual(rv.headers["ETag"], etag)
+
+        self.assertNotEqual(
+            self.client.get("/search/api/?q=census&page=2").headers["ETag"], etag
+        )
+        self.version = "generation-2"
+        rv = self.client.get("/search/api/?q=census", headers={"If-None-Match": etag})
+        self.assertEqual(rv.status_code, 200)
+        self.app.config["BUILD_VERSION"] = "new-build"
+        self.assertNotEqual(
+            self.client.get("/search/api/?q=census").headers["ETag"],
+            rv.headers["ETag"],
+        )
+
+    def test_api_past_last_page(self):
+        self.search_response = ([], 13, False)
+        rv = self.client.get("/search/api/?q=census&page=3")
+        self.assertEqual(rv.status_code, 404)
+        self.assertIsNone(rv.headers.get("ETag"))
+        self.assertNotIn("public", rv.headers.get("Cache-Control", ""))
+        self.assertNotIn("max-age", rv.headers.get("Cache-Control", ""))
+
+    def test_api_partial_results(self):
+        self.search_response = (self.results, 1, True)
+        rv = self.client.get("/search/api/?q=census")
+        self.assertEqual(rv.status_code, 200)
+        self.assertTrue(rv.json["partial"])
+        self.assertEqual(rv.headers["Cache-Control"], "no-store")
+        self.assertIsNone(rv.headers.get("ETag"))
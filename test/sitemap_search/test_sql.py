@@ -0,0 +1,56 @@
+import unittest
+
+from psycopg2 import sql
+
+from app import create_app
+from app.lib.sql import contruct_candidates_query
+
+
+def render(composable):
+    """Render a query without a database connection, to check its structure."""
+
+    if isinstance(composable, sql.Composed):
+        return "".join(render(part) for part in composable)
+    if isinstance(composable, sql.SQL):
+        return composable.string
+    if isinstance(composable, sql.Identifier):
+        return ".".join(f'"{string}"' for string in composable.strings)
+    if isinstance(composable, sql.Placeholder):
+        return f"%({composable.name})s"
+    if isinstance(composable, sql.Literal):
+        return repr(composable.wrapped)
+    raise TypeError(composable)
+
+
+class CandidatesQueryTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app("config.Test")
+
+    def candidates_query(self, all_query_parts, quoted_query_parts=()):
+        with self.app.app_context():
+            query, params = contruct_candidates_query(
+                all_query_parts, list(quoted_query_parts), "all", limit=100
+            )
+        return " ".join(render(query).split()), params
+
+    def test_substring_candidates_leave_out_body(self):
+        self.app.config["SEARCH_ENGINE"] = "substring"
+        query, params = self.candidates_query(["census", "records"])
+        for field in ["title", "description", "url"]:
+            self.assertIn(f'"{field}" ILIKE', query)
+        self.assertNotIn('"body"', query)
+        self.assertIn("LIMIT %(", query)
+        self.assertIn("%census%", params.values())
+        self.assertIn("%records%", params.values())
+
+    def test_trigram_candidates_leave_out_body(self):
+        self.app.config["SEARCH_ENGINE"] = "trigram"
+        query, _ = self.candidates_query(["census"])
+        self.assertIn('"title" ILIKE', query)
+        self.assertNotIn('"body"', query)
+
+    def test_fulltext_candidates_use_search_vector(self):
+        self.app.config["SEARCH_ENGINE"] = "fulltext"
+        query, _ = self.candidates_query(["census"])
+        self.assertIn('"search_vector" @@', query)
+        self.assertNotIn("ILIKE", query)
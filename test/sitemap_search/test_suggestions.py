@@ -0,0 +1,121 @@
+import unittest
+from contextlib import contextmanager
+from unittest.mock import patch
+
+from app import create_app
+from app.lib.suggestions import TitleSuggestions, normalize, rank
+
+
+def row(title, url_depth=1, is_archived=False, url=None):
+    return {
+        "title": title,
+        "url": url or f"https://www.nationalarchives.gov.uk/{normalize(title)}/",
+        "url_depth": url_depth,
+        "is_archived": is_archived,
+    }
+
+
+class FakeDb:
+    def __init__(self, rows):
+        self.rows = rows
+
+    @contextmanager
+    def cursor(self):
+        rows = self.rows
+
+        class Cursor:
+            def execute(self, query):
+                pass
+
+            def fetchall(self):
+                return rows
+
+        yield Cursor()
+
+
+class TitleSuggestionsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app("config.Test")
+        self.rows = [
+            row("Census records - The National Archives"),
+            row("Census records", url_depth=3, url="https://example.com/a/b/"),
+            row("The census of 1921", url_depth=1),
+            row("Censuses", url_depth=2),
+            row("Central records", url_depth=1, is_archived=True),
+            row("Wills and probate"),
+        ]
+        self.version = "generation-1"
+        for target, value in [
+            ("app.lib.suggestions.db", FakeDb(self.rows)),
+            ("app.lib.suggestions.get_index_version", lambda: self.version),
+        ]:
+            patcher = patch(target, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.suggestions = TitleSuggestions()
+
+    def suggest(self, query, limit=8):
+        with self.app.app_context():
+            if self.suggestions._data is None:
+                self.suggestions._rebuild(self.version)
+            return [
+                suggestion["title"]
+                for suggestion in self.suggestions.suggest(query, limit=limit)
+            ]
+
+    def test_ranking(self):
+        # The titles are weighted like a title match in a search, and halved for
+        # a later word that starts with the query. Each title is only suggested
+        # once, with its best weight.
+        self.assertEqual(
+            self.suggest("cen"),
+            ["Census records", "Censuses", "The census of 1921", "Central records"],
+        )
+        self.assertEqual(self.suggest("Census R"), ["Census records"])
+        self.assertEqual(self.suggest("records"), ["Census records", "Central records"])
+        self.assertEqual(self.suggest("nothing"), [])
+
+    def test_min_length(self):
+        self.assertEqual(self.suggest("c"), [])
+        self.assertEqual(self.suggest("ce"), self.suggest("cen")[:4])
+
+    def test_limit(self):
+        self.assertEqual(self.suggest("cen", limit=2), ["Census records", "Censuses"])
+
+    def test_precomputed(self):
+        with patch("app.lib.suggestions.PRECOMPUTED_RANGE_SIZE", 2):
+            self.suggest("")
+        precomputed = self.suggestions._data["precomputed"]
+        self.assertIn("ce", precomputed)
+        self.assertIn("cen", precomputed)
+        self.assertNotIn("c", precomputed)
+        self.assertNotIn("wi", precomputed)
+
+        # The precomputed suggestions are the same as ranking the keys directly
+        data = self.suggestions._data
+        keys = data["keys"]
+        for prefix, ranked in precomputed.items():
+            with self.subTest(prefix=prefix):
+                start = sum(key < prefix for key in keys)
+                end = sum(key < prefix or key.startswith(prefix) for key in keys)
+                with self.app.app_context():
+                    self.assertEqual(ranked, rank(data, start, end, data["limit"]))
+
+        # A limit above the precomputed limit ranks the keys instead
+        with self.app.app_context():
+            self.assertEqual(
+                len(self.suggestions.suggest("ce", limit=data["limit"] + 1)), 4
+            )
+
+    def test_rebuild(self):
+        self.assertEqual(self.suggest("wills"), ["Wills and probate"])
+
+        self.rows[-1] = row("Wills and testaments")
+        self.version = "generation-2"
+        with self.app.app_context():
+            # The previous suggestions are used while they are rebuilt
+            data = self.suggestions.ensure_loaded()
+            self.assertEqual(data["titles"][-1][0], "Wills and probate")
+            self.suggestions._building.join()
+        self.assertEqual(self.suggest("wills"), ["Wills and testaments"])
+        self.assertEqual(self.suggestions.status()["version"], "generation-2")
@@ -0,0 +1,154 @@
+import unittest
+
+from app.lib.template_filters import result_type
+from app.lib.url_rules import UrlRules
+
+CONFIG = {
+    "DOMAIN_REMAPS": {
+        "http://website.live.local/": "https://www.nationalarchives.gov.uk/",
+        "http://website.dev.local/": "https://dev-www.nationalarchives.gov.uk/",
+    },
+    "ARCHIVED_URLS": ["https://blog.nationalarchives.gov.uk/"],
+    "BLACKLISTED_URLS_SQL_LIKE": [
+        "%nationalarchives.gov.uk/tag/%",
+        "%nationalarchives.gov.uk/category/records_2/%",
+    ],
+}
+
+
+class UrlRulesTestCase(unittest.TestCase):
+    def setUp(self):
+        self.url_rules = UrlRules(CONFIG)
+
+    def test_correct_url(self):
+        self.assertEqual(
+            self.url_rules.correct_url("http://website.live.local/about/"),
+            "https://www.nationalarchives.gov.uk/about/",
+        )
+        self.assertEqual(
+            self.url_rules.correct_url("http://website.dev.local/"),
+            "https://dev-www.nationalarchives.gov.uk/",
+        )
+        # Only domains at the start of the URL are remapped
+        self.assertEqual(
+            self.url_rules.correct_url(
+                "https://www.nationalarchives.gov.uk/?from=http://website.live.local/"
+            ),
+            "https://www.nationalarchives.gov.uk/?from=http://website.live.local/",
+        )
+        self.assertEqual(
+            self.url_rules.correct_url("http://website.staging.local/"),
+            "http://website.staging.local/",
+        )
+
+    def test_is_archived(self):
+        self.assertTrue(
+            self.url_rules.is_archived("https://blog.nationalarchives.gov.uk/post/")
+        )
+        self.assertFalse(
+            self.url_rules.is_archived("https://www.nationalarchives.gov.uk/blog/")
+        )
+        self.assertFalse(
+            self.url_rules.is_archived(
+                "https://www.nationalarchives.gov.uk/?https://blog.nationalarchives.gov.uk/"
+            )
+        )
+
+    def test_is_blacklisted(self):
+        self.assertTrue(
+            self.url_rules.is_blacklisted("https://www.nationalarchives.gov.uk/tag/")
+        )
+        self.assertTrue(
+            self.url_rules.is_blacklisted(
+                "https://blog.nationalarchives.gov.uk/tag/census/"
+            )
+        )
+        # An underscore matches any single character, as it does in SQL LIKE
+        self.assertTrue(
+            self.url_rules.is_blacklisted(
+                "https://www.nationalarchives.gov.uk/category/records-2/page/"
+            )
+        )
+        self.assertFalse(
+            self.url_rules.is_blacklisted("https://www.nationalarchives.gov.uk/tags/")
+        )
+        self.assertFalse(
+            self.url_rules.is_blacklisted(
+                "https://www.nationalarchives.gov.uk/category/records--2/"
+            )
+        )
+
+    def test_content_type(self):
+        self.assertEqual(
+            self.url_rules.content_type(
+                "https://www.nationalarchives.gov.uk/help-with-your-research/"
+                "research-guides/census-records/"
+            ),
+            "research-guides",
+        )
+        # The index of the research guides isn't a research guide
+        self.assertIsNone(
+            self.url_rules.content_type(
+                "https://www.nationalarchives.gov.uk/help-with-your-research/"
+                "research-guides/"
+            )
+        )
+        self.assertEqual(
+            self.url_rules.content_type("https://blog.nationalarchives.gov.uk/post/"),
+            "archived-blog-posts",
+        )
+        self.assertEqual(
+            self.url_rules.content_type(
+                "https://www.nationalarchives.gov.uk/education/resources/"
+            ),
+            "education-and-outreach",
+        )
+        self.assertIsNone(
+            self.url_rules.content_type("https://www.nationalarchives.gov.uk/about/")
+        )
+
+    def test_content_type_priority(self):
+        # The first matching rule is used
+        self.assertEqual(
+            self.url_rules.content_type(
+                "https://www.nationalarchives.gov.uk/education/help-with-your-research/"
+                "research-guides/census-records/"
+            ),
+            "research-guides",
+        )
+
+    def test_no_rules(self):
+        url_rules = UrlRules(
+            {"DOMAIN_REMAPS": {}, "ARCHIVED_URLS": [], "BLACKLISTED_URLS_SQL_LIKE": []}
+        )
+        self.assertEqual(
+            url_rules.correct_url("http://website.live.local/"),
+            "http://website.live.local/",
+        )
+        self.assertFalse(url_rules.is_archived("https://blog.nationalarchives.gov.uk/"))
+        self.assertFalse(
+            url_rules.is_blacklisted("https://www.nationalarchives.gov.uk/tag/")
+        )
+
+    def test_result_type(self):
+        self.assertEqual(
+            result_type(
+                "http://website.live.local/help-with-your-research/research-guides/"
+                "census-records/"
+            ),
+            "Research guide",
+        )
+        self.assertEqual(
+            result_type("https://blog.nationalarchives.gov.uk/post/"), "Archived"
+        )
+        self.assertEqual(
+            result_type(
+                "https://www.nationalarchives.gov.uk/help-with-your-research/"
+                "research-guides/"
+            ),
+            "",
+        )
+        self.assertEqual(
+            result_type("https://www.nationalarchives.gov.uk/education/resources/"),
+            "",
+        )
@@ -0,0 +1,13 @@
+import sys
+
+from populate import bump_index_generation, db_connections, populate, process_sitemap
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        sitemap = sys.argv[1]
+        process_sitemap(sitemap=sitemap, incremental=True)
+    else:
+        populate(incremental=True)
+    bump_index_generation()
+    db_connections.closeall()
+    exit(0)
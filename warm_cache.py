@@ -0,0 +1,88 @@
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from werkzeug.utils import import_string
+
+from app import create_app
+from app.lib.query_log import query_log
+from app.lib.search import get_facets, search
+from app.lib.sql import get_trimmed_query_parts
+
+
+def warm_query(app, query, requested_types):
+    """Search for the first pages of a query so they are stored in the cache."""
+
+    with app.app_context():
+        all_query_parts, quoted_query_parts, _ = get_trimmed_query_parts(query)
+        results_per_page = app.config.get("RESULTS_PER_PAGE")
+        pages = 0
+        for page in range(1, app.config.get("SEARCH_WARM_PAGES") + 1):
+            _, total_results, _ = search(
+                all_query_parts=all_query_parts,
+                quoted_query_parts=quoted_query_parts,
+                requested_types=requested_types,
+                page=page,
+                results_per_page=results_per_page,
+            )
+            pages = page
+            if page * results_per_page >= total_results:
+                break
+        get_facets(all_query_parts, quoted_query_parts)
+        return pages
+
+
+def warm_cache(limit=None):
+    """
+    Warm the cache with the most popular queries from the query log.
+
+    The queries are searched for SEARCH_WARM_CONCURRENCY at a time so the
+    database isn't overwhelmed.
+    """
+
+    config = import_string(os.getenv("CONFIG", "config.Production"))
+    if config.SEARCH_ENGINE == "memory":
+        # Each worker ranks the results of the memory search engine itself, so
+        # warming them would mean loading every page here for little benefit
+        print("Not warming the cache for the memory search engine")
+        return
+
+    class WarmCacheConfig(config):
+        # Only the database and the shared cache are needed to warm the cache
+        SEARCH_SUGGESTIONS_PRELOAD = False
+
+    app = create_app(WarmCacheConfig)
+    with app.app_context():
+        queries = query_log.top_queries(
+            limit or app.config.get("SEARCH_WARM_QUERIES"),
+            min_hits=app.config.get("SEARCH_WARM_MIN_HITS"),
+        )
+    print(f"Warming the cache with {len(queries)} queries")
+
+    with ThreadPoolExecutor(
+        max_workers=app.config.get("SEARCH_WARM_CONCURRENCY")
+    ) as executor:
+        futures = {
+            executor.submit(warm_query, app, query, requested_types): (
+                query,
+                requested_types,
+            )
+            for query, requested_types in queries
+        }
+        for number, future in enumerate(as_completed(futures), start=1):
+            query, requested_types = futures[future]
+            progress = (
+                f"[{str(number).rjust(len(str(len(queries))), ' ')}/{len(queries)}]"
+            )
+            try:
+                pages = future.result()
+                print(
+                    f"{progress} Warmed {pages} page(s) of {query} ({requested_types})"
+                )
+            except Exception as e:
+                print(f"{progress} Failed to warm {query} ({requested_types}): {e}")
+
+
+if __name__ == "__main__":
+    warm_cache(int(sys.argv[1]) if len(sys.argv) > 1 else None)
+    exit(0)